@@ -1,14 +1,25 @@
 import streamlit as st
+from streamlit.runtime.scriptrunner import RerunException
 import os
+import tempfile
 import time
 from datetime import datetime
 from llm_invoker import LLMFactory, ParameterPresets
-from prompt_eval import PromptEvaluator
+from llm_registry import LLMRegistry
+from prompt_analytics import SCORE_FIELDS, LibraryAnalytics
+from prompt_backup import start_scheduler
 from prompt_database import PromptDatabase
+from prompt_export import EXPORT_FORMATS, export_filename, export_mime_type
+from prompt_maintenance import start_maintenance
+from prompt_loader import get_default_loader
+from prompt_registry import get_default_registry
 from prompt_storage_local import LocalStoragePromptDB
+from prompt_sync import LocalFolderRemote, SyncEngine, SyncError
 from config_loader import get_default_config_loader
 from conversation_types import create_new_session, ConversationSession, Message, MessageRole, MessageType
-from conversation_ui import render_conversation_ui, render_new_conversation_button, get_conversation_ui_translations
+from conversation_ui import (
+    render_conversation_ui, render_new_conversation_button, get_conversation_ui_translations, render_duplicate_notice
+)
 from skill_generator import (
     SkillMetadataExtractor,
     SkillComplexityAnalyzer,
@@ -21,6 +32,11 @@ from skill_generator import (
 )
 
 max_token_length = 131072  # Claude 的最大 tokens 限制
+LIBRARY_PAGE_SIZE = 20  # 側邊欄提示詞庫每頁筆數
+TAG_FILTER_LIMIT = 50  # 標籤篩選最多列出的標籤數
+EXPORT_TEMP_DIR = os.path.join(tempfile.gettempdir(), "prompt-tool-exports")  # 已準備的匯出檔
+EXPORT_MAX_AGE_SECONDS = 3600  # 逾時未下載的匯出檔（如會話已關閉）在下次準備匯出時刪除
+SIMILAR_LIMIT = 5  # 「查找相似提示」最多列出的筆數
 
 
 # 翻譯字典
@@ -43,6 +59,7 @@ translations = {
         "test_connection": "測試連接",
         "connection_success": "連接正常",
         "connection_error": "連接錯誤",
+        "prompt_version_metrics": "Prompt 版本指標",
         "aws_settings": "LLM 設置",
         "select_llm": "選擇 LLM 模型",
         "select_preset": "選擇參數預設",
@@ -86,19 +103,75 @@ translations = {
         "load_success": "提示已載入！",
         "no_saved_prompts": "暫無保存的提示",
         "delete_prompt": "🗑️ 刪除",
+        "version_history": "🕘 版本歷史",
+        "version_from": "比較版本",
+        "version_to": "與版本",
+        "version_option": "v{version}（{kind}，{size} bytes）",
+        "version_kinds": {"original": "原始", "iteration": "迭代", "final": "最終"},
+        "version_same": "兩個版本內容相同",
+        "analytics": "📊 分析",
+        "analytics_title": "📊 提示詞庫分析",
+        "analytics_empty": "提示詞庫中尚無評分資料",
+        "analytics_prompts": "提示詞數",
+        "analytics_scored": "含評分",
+        "analytics_composite": "平均綜合分數",
+        "analytics_improvement": "平均優化提升",
+        "analytics_distribution": "分數分佈",
+        "analytics_dimension": "評分維度",
+        "analytics_by_language": "依語言",
+        "analytics_by_tag": "依標籤",
+        "analytics_trends": "綜合分數趨勢（每月平均）",
+        "analytics_deltas": "優化前後分數變化",
+        "analytics_no_deltas": "尚無優化前後的評分可比較（優化後的提示再次分析並保存後才會出現）",
+        "find_similar": "🔎 查找相似提示",
+        "similar_header": "已保存的相似提示",
+        "similar_hint": "可直接重用已優化的版本，不必再次呼叫 LLM 優化",
+        "similar_none": "提示詞庫中沒有相似的提示",
+        "similar_match": "{name}（相似度 {score:.0%}）",
+        "duplicate_flag": "已保存，但與「{name}」相似度 {score:.0%}，已標記為可能重複",
+        "duplicate_merge": "與「{name}」重複（相似度 {score:.0%}），已將標籤併入既有提示詞",
+        "duplicate_skip": "與「{name}」重複（相似度 {score:.0%}），未另外保存",
+        "possible_duplicate": "⚠️ 可能與其他提示詞重複",
+        "import_duplicates": "偵測到 {duplicates} 筆重複提示詞",
+        "analytics_fields": {"completeness_score": "完整性", "clarity_score": "清晰度", "structure_score": "結構性",
+                             "specificity_score": "具體性", "composite": "綜合", "count": "數量"},
+        "prev_page": "◀ 上一頁",
+        "next_page": "下一頁 ▶",
+        "page_number": "第 {page} 頁",
+        "filter_by_tag": "依標籤篩選",
+        "all_tags": "全部標籤",
         "confirm_delete": "確認刪除此提示？",
         "search_prompts": "搜尋提示詞",
         "prompt_name": "提示名稱",
         "created_at": "創建時間",
         "copy_prompt": "📋 複製提示",
         "export_prompts": "📤 匯出",
+        "export_format": "格式",
+        "export_gzip": "gzip 壓縮",
+        "export_prepare": "準備匯出檔",
+        "export_download": "⬇️ 下載",
+        "import_progress": "已匯入 {imported} 筆，略過 {skipped} 筆，錯誤 {errors} 筆",
         "import_prompts": "📥 匯入",
         "export_success": "匯出成功！",
         "import_success": "匯入成功！已匯入 {imported} 筆，跳過 {skipped} 筆，錯誤 {errors} 筆",
         "import_error": "匯入失敗：{error}",
-        "import_file_label": "選擇 JSON 檔案",
+        "import_file_label": "選擇 JSON / JSONL 檔案（可為 .gz）",
         "overwrite_existing": "覆蓋已存在的提示詞",
         "local_storage_notice": "⚠️ 資料儲存在瀏覽器中，請定期匯出以永久保存",
+        "backup_last": "💾 上次備份：{time}",
+        "backup_never": "💾 尚未備份",
+        "backup_running": "💾 備份中…",
+        "backup_failed": "備份失敗：{error}",
+        "backup_now": "💾 立即備份",
+        "backup_requested": "已在背景開始備份",
+        "storage_stats": "🗄️ 資料庫儲存空間",
+        "storage_stats_pending": "背景維護尚未執行",
+        "sync_now": "🔄 同步",
+        "sync_running": "同步中…",
+        "sync_done": "同步完成：拉取 {pulled} 筆、推送 {pushed} 筆",
+        "sync_failed": "同步失敗：{error}",
+        "sync_conflicts": "⚠️ 同步衝突 {count} 筆（保留的是較舊的版本）",
+        "sync_clear_conflicts": "清除衝突記錄",
         "specific_model": "具體模型",
         "gemini_api_key_note": "需要設置 GEMINI_API_KEY 環境變數",
         "gemini_api_key_input": "Gemini API Key",
@@ -170,6 +243,7 @@ translations = {
         "test_connection": "Test Connection",
         "connection_success": "Connection Successful",
         "connection_error": "Connection Error",
+        "prompt_version_metrics": "Prompt Version Metrics",
         "aws_settings": "LLM Settings",
         "select_llm": "Select LLM Model",
         "select_preset": "Select Parameter Preset",
@@ -213,19 +287,75 @@ translations = {
         "load_success": "Prompt loaded successfully!",
         "no_saved_prompts": "No saved prompts",
         "delete_prompt": "🗑️ Delete",
+        "version_history": "🕘 Version history",
+        "version_from": "Compare version",
+        "version_to": "With version",
+        "version_option": "v{version} ({kind}, {size} bytes)",
+        "version_kinds": {"original": "original", "iteration": "iteration", "final": "final"},
+        "version_same": "The two versions are identical",
+        "analytics": "📊 Analytics",
+        "analytics_title": "📊 Library analytics",
+        "analytics_empty": "No scored prompts in the library yet",
+        "analytics_prompts": "Prompts",
+        "analytics_scored": "Scored",
+        "analytics_composite": "Avg. composite score",
+        "analytics_improvement": "Avg. optimization gain",
+        "analytics_distribution": "Score distribution",
+        "analytics_dimension": "Dimension",
+        "analytics_by_language": "By language",
+        "analytics_by_tag": "By tag",
+        "analytics_trends": "Composite score trend (monthly mean)",
+        "analytics_deltas": "Score change from optimization",
+        "analytics_no_deltas": "No before/after scores yet (they appear once an optimized prompt is analyzed again and saved)",
+        "find_similar": "🔎 Find similar prompts",
+        "similar_header": "Similar saved prompts",
+        "similar_hint": "Reuse an already optimized version instead of running another LLM optimization",
+        "similar_none": "No similar prompts in the library",
+        "similar_match": "{name} ({score:.0%} similar)",
+        "duplicate_flag": "Saved, but {score:.0%} similar to \"{name}\"; marked as a possible duplicate",
+        "duplicate_merge": "Duplicate of \"{name}\" ({score:.0%} similar); tags were added to the existing prompt",
+        "duplicate_skip": "Duplicate of \"{name}\" ({score:.0%} similar); not saved again",
+        "possible_duplicate": "⚠️ Possible duplicate of another prompt",
+        "import_duplicates": "{duplicates} duplicate prompts detected",
+        "analytics_fields": {"completeness_score": "Completeness", "clarity_score": "Clarity", "structure_score": "Structure",
+                             "specificity_score": "Specificity", "composite": "Composite", "count": "Count"},
+        "prev_page": "◀ Prev",
+        "next_page": "Next ▶",
+        "page_number": "Page {page}",
+        "filter_by_tag": "Filter by tag",
+        "all_tags": "All tags",
         "confirm_delete": "Confirm delete this prompt?",
         "search_prompts": "Search prompts",
         "prompt_name": "Prompt Name",
         "created_at": "Created At",
         "copy_prompt": "📋 Copy Prompt",
         "export_prompts": "📤 Export",
+        "export_format": "Format",
+        "export_gzip": "gzip compression",
+        "export_prepare": "Prepare export",
+        "export_download": "⬇️ Download",
+        "import_progress": "Imported {imported}, skipped {skipped}, errors {errors}",
         "import_prompts": "📥 Import",
         "export_success": "Export successful!",
         "import_success": "Import successful! Imported {imported}, skipped {skipped}, errors {errors}",
         "import_error": "Import failed: {error}",
-        "import_file_label": "Select JSON file",
+        "import_file_label": "Select JSON / JSONL file (.gz allowed)",
         "overwrite_existing": "Overwrite existing prompts",
         "local_storage_notice": "⚠️ Data is stored in browser. Export regularly for permanent backup",
+        "backup_last": "💾 Last backup: {time}",
+        "backup_never": "💾 No backup yet",
+        "backup_running": "💾 Backing up…",
+        "backup_failed": "Backup failed: {error}",
+        "backup_now": "💾 Back up now",
+        "backup_requested": "Backup started in the background",
+        "storage_stats": "🗄️ Database storage",
+        "storage_stats_pending": "Background maintenance has not run yet",
+        "sync_now": "🔄 Sync",
+        "sync_running": "Syncing…",
+        "sync_done": "Sync complete: pulled {pulled}, pushed {pushed}",
+        "sync_failed": "Sync failed: {error}",
+        "sync_conflicts": "⚠️ {count} sync conflicts (the older versions are kept here)",
+        "sync_clear_conflicts": "Clear conflict records",
         "specific_model": "Specific Model",
         "gemini_api_key_note": "Requires GEMINI_API_KEY environment variable",
         "gemini_api_key_input": "Gemini API Key",
@@ -297,6 +427,7 @@ translations = {
         "test_connection": "接続テスト",
         "connection_success": "接続成功",
         "connection_error": "接続エラー",
+        "prompt_version_metrics": "プロンプトバージョン指標",
         "aws_settings": "LLM設定",
         "select_llm": "LLMモデルを選択",
         "select_preset": "パラメータプリセットを選択",
@@ -340,19 +471,75 @@ translations = {
         "load_success": "プロンプトが読み込まれました！",
         "no_saved_prompts": "保存されたプロンプトがありません",
         "delete_prompt": "🗑️ 削除",
+        "version_history": "🕘 バージョン履歴",
+        "version_from": "比較元バージョン",
+        "version_to": "比較先バージョン",
+        "version_option": "v{version}（{kind}、{size} bytes）",
+        "version_kinds": {"original": "元", "iteration": "反復", "final": "最終"},
+        "version_same": "2 つのバージョンは同じ内容です",
+        "analytics": "📊 分析",
+        "analytics_title": "📊 ライブラリ分析",
+        "analytics_empty": "スコア付きのプロンプトはまだありません",
+        "analytics_prompts": "プロンプト数",
+        "analytics_scored": "スコアあり",
+        "analytics_composite": "平均総合スコア",
+        "analytics_improvement": "平均最適化向上",
+        "analytics_distribution": "スコア分布",
+        "analytics_dimension": "評価軸",
+        "analytics_by_language": "言語別",
+        "analytics_by_tag": "タグ別",
+        "analytics_trends": "総合スコアの推移（月平均）",
+        "analytics_deltas": "最適化前後のスコア変化",
+        "analytics_no_deltas": "比較できる最適化前後のスコアはまだありません（最適化後のプロンプトを再分析して保存すると表示されます）",
+        "find_similar": "🔎 類似プロンプトを検索",
+        "similar_header": "保存済みの類似プロンプト",
+        "similar_hint": "LLM で再度最適化せずに、最適化済みのバージョンを再利用できます",
+        "similar_none": "ライブラリに類似したプロンプトはありません",
+        "similar_match": "{name}（類似度 {score:.0%}）",
+        "duplicate_flag": "保存しましたが、「{name}」と類似度 {score:.0%} のため重複の可能性ありとして記録しました",
+        "duplicate_merge": "「{name}」と重複しています（類似度 {score:.0%}）。タグを既存のプロンプトに追加しました",
+        "duplicate_skip": "「{name}」と重複しています（類似度 {score:.0%}）。保存しませんでした",
+        "possible_duplicate": "⚠️ 他のプロンプトと重複している可能性があります",
+        "import_duplicates": "重複プロンプトを {duplicates} 件検出しました",
+        "analytics_fields": {"completeness_score": "完全性", "clarity_score": "明確性", "structure_score": "構造性",
+                             "specificity_score": "具体性", "composite": "総合", "count": "件数"},
+        "prev_page": "◀ 前へ",
+        "next_page": "次へ ▶",
+        "page_number": "{page} ページ",
+        "filter_by_tag": "タグで絞り込み",
+        "all_tags": "すべてのタグ",
         "confirm_delete": "このプロンプトを削除しますか？",
         "search_prompts": "プロンプトを検索",
         "prompt_name": "プロンプト名",
         "created_at": "作成日時",
         "copy_prompt": "📋 プロンプトをコピー",
         "export_prompts": "📤 エクスポート",
+        "export_format": "形式",
+        "export_gzip": "gzip 圧縮",
+        "export_prepare": "エクスポートを準備",
+        "export_download": "⬇️ ダウンロード",
+        "import_progress": "インポート {imported} 件、スキップ {skipped} 件、エラー {errors} 件",
         "import_prompts": "📥 インポート",
         "export_success": "エクスポート成功！",
         "import_success": "インポート成功！{imported}件インポート、{skipped}件スキップ、{errors}件エラー",
         "import_error": "インポート失敗：{error}",
-        "import_file_label": "JSONファイルを選択",
+        "import_file_label": "JSON / JSONL ファイルを選択（.gz 可）",
         "overwrite_existing": "既存のプロンプトを上書き",
         "local_storage_notice": "⚠️ データはブラウザに保存されます。定期的にエクスポートしてください",
+        "backup_last": "💾 前回のバックアップ：{time}",
+        "backup_never": "💾 まだバックアップがありません",
+        "backup_running": "💾 バックアップ中…",
+        "backup_failed": "バックアップ失敗：{error}",
+        "backup_now": "💾 今すぐバックアップ",
+        "backup_requested": "バックグラウンドでバックアップを開始しました",
+        "storage_stats": "🗄️ データベース容量",
+        "storage_stats_pending": "バックグラウンドメンテナンスはまだ実行されていません",
+        "sync_now": "🔄 同期",
+        "sync_running": "同期中…",
+        "sync_done": "同期完了：{pulled}件取得、{pushed}件送信",
+        "sync_failed": "同期失敗：{error}",
+        "sync_conflicts": "⚠️ 同期の競合 {count}件（古いバージョンをここに保存）",
+        "sync_clear_conflicts": "競合記録を消去",
         "specific_model": "特定のモデル",
         "gemini_api_key_note": "GEMINI_API_KEY環境変数が必要です",
         "gemini_api_key_input": "Gemini API Key",
@@ -567,11 +754,11 @@ def show_skill_metadata_dialog(auto_metadata, complexity, optimized_prompt, orig
                     st.rerun()
 
                 # Stop rendering to prevent showing original buttons again
-                st.stop()
+                stop_run()
 
             else:
                 st.error(f"{t('skill_generation_failed')}: {result.get('message', 'Unknown error')}")
-                st.stop()
+                stop_run()
 
     with col2:
         if st.button(t("cancel"), key="skill_dialog_cancel", use_container_width=True):
@@ -698,10 +885,38 @@ def initialize_session_state():
         if st.session_state.dev_mode:
             # 開發模式：使用 SQLite 資料庫
             db_path = config.get('app.database.path', 'prompts.db')
-            st.session_state.prompt_db = PromptDatabase(db_path)
+            st.session_state.prompt_db = PromptDatabase(
+                db_path,
+                duplicate_policy=config.get('app.database.duplicate_policy', 'flag'),
+                duplicate_threshold=config.get('app.database.duplicate_threshold', 0.85)
+            )
+            # 背景定期線上備份（整個程序共用一個排程執行緒）
+            if config.get('app.database.backup_enabled', False):
+                st.session_state.backup_scheduler = start_scheduler(
+                    db_path,
+                    interval_hours=config.get('app.database.backup_interval_hours', 24),
+                    backup_dir=config.get('app.database.backup_dir', 'backups'),
+                    keep=config.get('app.database.backup_keep', 7)
+                )
+            # 背景儲存空間維護（回收空閒頁、ANALYZE、容量統計）
+            if config.get('app.database.maintenance_enabled', False):
+                st.session_state.maintenance_scheduler = start_maintenance(
+                    st.session_state.prompt_db,
+                    interval_hours=config.get('app.database.maintenance_interval_hours', 6)
+                )
+            # 增量同步：透過共用資料夾與其他副本交換變更批次
+            # （上線模式不啟用：伺服器上的資料夾會由所有瀏覽器使用者共用）
+            if config.get('app.sync.enabled', False):
+                st.session_state.sync_engine = SyncEngine(
+                    st.session_state.prompt_db,
+                    LocalFolderRemote(config.get('app.sync.folder', 'sync'))
+                )
         else:
             # 上線模式：使用瀏覽器 LocalStorage
-            st.session_state.prompt_db = LocalStoragePromptDB()
+            st.session_state.prompt_db = LocalStoragePromptDB(
+                duplicate_policy=config.get('app.database.duplicate_policy', 'flag'),
+                duplicate_threshold=config.get('app.database.duplicate_threshold', 0.85)
+            )
 
     # 初始化對話模式相關狀態
     if 'conversation_mode' not in st.session_state:
@@ -726,32 +941,37 @@ def initialize_session_state():
 
 
 
-# 創建 LLM 實例
-def create_llm():
+# 取得目前 session 的 LLM Registry（跨 rerun 重用 invoker / evaluator）
+def get_llm_registry():
+    if 'llm_registry' not in st.session_state:
+        st.session_state.llm_registry = LLMRegistry()
+    return st.session_state.llm_registry
+
+
+# 目前側邊欄的 LLM 設定
+def get_llm_settings():
     llm_type = st.session_state.llm_type
-    
-    if llm_type == "claude":
-        return LLMFactory.create_llm(
-            llm_type,
-            region=st.session_state.aws_region
-        )
-    elif llm_type == "gemini":
+    if llm_type not in ("claude", "gemini", "gemini-vertex"):
+        # 默認使用 Gemini
+        llm_type = "gemini"
+
+    return {
+        "llm_type": llm_type,
+        "model": st.session_state.llm_model,
+        "region": st.session_state.aws_region if llm_type == "claude" else None,
         # 如果用戶輸入了 API Key,使用它;否則使用環境變數
-        kwargs = {"model": st.session_state.llm_model}
-        if st.session_state.gemini_api_key:
-            kwargs["api_key"] = st.session_state.gemini_api_key
-        return LLMFactory.create_llm(llm_type, **kwargs)
-    elif llm_type == "gemini-vertex":
-        return LLMFactory.create_llm(
-            llm_type,
-            model=st.session_state.llm_model
-        )
-    else:
-        # 默認返回 Gemini
-        kwargs = {"model": st.session_state.llm_model}
-        if st.session_state.gemini_api_key:
-            kwargs["api_key"] = st.session_state.gemini_api_key
-        return LLMFactory.create_llm("gemini", **kwargs)
+        "api_key": st.session_state.gemini_api_key if llm_type == "gemini" else None
+    }
+
+
+# 創建 LLM 實例（設定未變更時重用同一個實例）
+def create_llm():
+    return get_llm_registry().get_llm(**get_llm_settings())
+
+
+# 創建 PromptEvaluator（設定未變更時重用同一個實例）
+def create_evaluator():
+    return get_llm_registry().get_evaluator(**get_llm_settings())
 
 
 # 獲取固定的最佳分析參數
@@ -894,16 +1114,105 @@ def show_sidebar():
                 else:
                     st.error(message)
 
+        # 多版本 prompt 分流指標（僅在 prompts.versions.enabled 時顯示）
+        prompt_registry = get_default_registry()
+        if prompt_registry:
+            with st.sidebar.expander(t("prompt_version_metrics")):
+                st.json(prompt_registry.get_metrics())
+
+        # 資料庫容量統計（顯示背景維護最近一次的結果，不在此重新計算）
+        maintenance = st.session_state.get('maintenance_scheduler')
+        if maintenance:
+            with st.sidebar.expander(t("storage_stats")):
+                report = maintenance.last_report()
+                if report:
+                    st.json(report)
+                else:
+                    st.caption(t("storage_stats_pending"))
+
     # 提示詞庫管理（所有模式都顯示）
     st.sidebar.header(t("prompt_library"))
 
     # 上線模式：顯示 LocalStorage 提示
     if not st.session_state.dev_mode:
         st.sidebar.warning(t("local_storage_notice"))
+    elif st.session_state.get('backup_scheduler'):
+        show_backup_status(st.session_state.backup_scheduler)
+    if st.session_state.get('sync_engine'):
+        show_sync_controls(st.session_state.sync_engine)
 
     show_prompt_library_sidebar()
 
 
+def show_backup_status(scheduler):
+    """顯示最近一次備份狀態與「立即備份」按鈕（備份在背景執行緒進行）"""
+    status = scheduler.status()
+    col_status, col_button = st.sidebar.columns([3, 2])
+    with col_status:
+        if status.running:
+            st.caption(t("backup_running"))
+        elif status.last_success_at:
+            st.caption(t("backup_last").format(time=status.last_success_at.replace("T", " ")))
+        else:
+            st.caption(t("backup_never"))
+    with col_button:
+        if st.button(t("backup_now"), key="backup_now", disabled=status.running, use_container_width=True):
+            scheduler.request_backup()
+            st.toast(t("backup_requested"), icon="💾")
+    if status.last_error:
+        st.sidebar.warning(t("backup_failed").format(error=status.last_error))
+
+
+def show_sync_controls(engine):
+    """「同步」按鈕（先拉取其他副本的變更再推送本機變更）與衝突記錄"""
+    if st.sidebar.button(t("sync_now"), key="sync_now", use_container_width=True):
+        try:
+            with st.sidebar, st.spinner(t("sync_running")):
+                result = engine.sync()
+        except (OSError, SyncError) as e:
+            st.sidebar.error(t("sync_failed").format(error=e))
+        else:
+            st.toast(t("sync_done").format(**result), icon="🔄")
+    conflicts = engine.conflicts()
+    if conflicts:
+        with st.sidebar.expander(t("sync_conflicts").format(count=len(conflicts))):
+            st.json(conflicts, expanded=False)
+            if st.button(t("sync_clear_conflicts"), key="sync_clear_conflicts"):
+                engine.clear_conflicts()
+                st.rerun()
+
+
+def spool_export(chunks):
+    """
+    將匯出串流寫入暫存檔並回傳路徑（記憶體不隨詞庫大小成長）
+
+    session_state 只保存路徑、不保存開啟的檔案；順便刪除逾時未下載的舊匯出檔。
+    """
+    os.makedirs(EXPORT_TEMP_DIR, exist_ok=True)
+    cutoff = time.time() - EXPORT_MAX_AGE_SECONDS
+    for entry in os.scandir(EXPORT_TEMP_DIR):
+        try:
+            if entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+        except OSError:
+            pass
+    fd, path = tempfile.mkstemp(prefix="export-", dir=EXPORT_TEMP_DIR)
+    with os.fdopen(fd, "wb") as f:
+        for chunk in chunks:
+            f.write(chunk)
+    return path
+
+
+def discard_prepared_export():
+    """下載後（或重新準備前）刪除已準備的匯出檔"""
+    prepared = st.session_state.pop("prepared_export", None)
+    if prepared:
+        try:
+            os.remove(prepared["path"])
+        except OSError:
+            pass
+
+
 # 顯示提示詞庫側邊欄
 def show_prompt_library_sidebar():
     """顯示提示詞庫管理界面"""
@@ -912,63 +1221,113 @@ def show_prompt_library_sidebar():
     # 匯出/匯入按鈕
     col_exp, col_imp = st.sidebar.columns(2)
     with col_exp:
-        # 匯出按鈕 - 直接生成最新資料（移除快取以避免資料不同步）
-        export_data = db.export_prompts()
-        st.download_button(
-            label=t("export_prompts"),
-            data=export_data,
-            file_name="prompts_backup.json",
-            mime="application/json",
-            use_container_width=True
-        )
+        # 匯出 - 只在按下「準備」時以串流寫入暫存檔，不在每次 rerun 重新產生
+        with st.popover(t("export_prompts"), use_container_width=True):
+            export_format = st.radio(t("export_format"), EXPORT_FORMATS, horizontal=True, key="export_format")
+            export_gzip = st.checkbox(t("export_gzip"), value=False, key="export_gzip")
+
+            if st.button(t("export_prepare"), key="do_export_prepare", use_container_width=True):
+                discard_prepared_export()
+                st.session_state.prepared_export = {
+                    "path": spool_export(db.export_stream(fmt=export_format, compress=export_gzip)),
+                    "file_name": export_filename(export_format, export_gzip),
+                    "mime": export_mime_type(export_format, export_gzip),
+                }
+
+            prepared = st.session_state.get("prepared_export")
+            if prepared and not os.path.exists(prepared["path"]):
+                # 已被清除（逾時）：需重新準備
+                discard_prepared_export()
+                prepared = None
+            if prepared:
+                # download_button 接受 BufferedReader（不接受 SpooledTemporaryFile），呼叫時即讀取完畢
+                with open(prepared["path"], "rb") as export_file:
+                    st.download_button(
+                        label=t("export_download"),
+                        data=export_file,
+                        file_name=prepared["file_name"],
+                        mime=prepared["mime"],
+                        on_click=discard_prepared_export,
+                        use_container_width=True
+                    )
 
     with col_imp:
         # 匯入按鈕 - 使用 popover 顯示上傳界面
         with st.popover(t("import_prompts"), use_container_width=True):
             uploaded_file = st.file_uploader(
                 t("import_file_label"),
-                type=['json'],
+                type=['json', 'jsonl', 'gz'],
                 key="import_file"
             )
             overwrite = st.checkbox(t("overwrite_existing"), value=False)
 
             if uploaded_file is not None:
                 if st.button("✅ " + t("import_prompts"), key="do_import"):
-                    try:
-                        # Handle UTF-8 encoding with error handling
-                        raw_data = uploaded_file.read()
-                        try:
-                            json_data = raw_data.decode('utf-8')
-                        except UnicodeDecodeError:
-                            # Fallback to utf-8 with error replacement
-                            json_data = raw_data.decode('utf-8', errors='replace')
-                            st.warning("⚠️ Some characters may have been replaced due to encoding issues")
-                    except Exception as e:
-                        st.error(t("import_error").format(error=f"File read error: {str(e)}"))
-                        json_data = None
-
-                    if json_data:
-                        result = db.import_prompts(json_data, overwrite=overwrite)
-
-                        if result.get("success"):
-                            st.success(t("import_success").format(
-                                imported=result["imported"],
-                                skipped=result["skipped"],
-                                errors=result["errors"]
-                            ))
-                            st.rerun()
-                        else:
-                            st.error(t("import_error").format(error=result.get("error", "Unknown")))
+                    # 直接傳入檔案物件：逐筆解析、分批寫入，不需先整份讀入並解碼
+                    progress = st.progress(0.0)
+                    total_bytes = max(uploaded_file.size, 1)
+
+                    def report_progress(stats):
+                        progress.progress(min(stats["bytes_read"] / total_bytes, 1.0),
+                                          text=t("import_progress").format(**stats))
+
+                    result = db.import_stream(uploaded_file, overwrite=overwrite,
+                                              progress_callback=report_progress)
+
+                    if result.get("success"):
+                        st.success(t("import_success").format(
+                            imported=result["imported"],
+                            skipped=result["skipped"],
+                            errors=result["errors"]
+                        ))
+                        if result.get("duplicates"):
+                            st.toast(t("import_duplicates").format(duplicates=result["duplicates"]), icon="🔁")
+                        st.rerun()
+                    else:
+                        st.error(t("import_error").format(error=result.get("error", "Unknown")))
+
+    # 詞庫分析（於主畫面顯示）
+    if st.sidebar.button(t("analytics"), key="open_library_analytics", use_container_width=True):
+        st.session_state.show_library_analytics = True
 
     # 搜索框
     search_query = st.sidebar.text_input(t("search_prompts"), key="search_prompts")
 
-    # 載入提示詞
+    # 標籤篩選（依使用次數排序）
+    tag_filter = None
+    if not search_query:
+        tag_counts = db.get_tag_counts(limit=TAG_FILTER_LIMIT)
+        if tag_counts:
+            tag_options = [None] + [tag['name'] for tag in tag_counts]
+            counts = {tag['name']: tag['count'] for tag in tag_counts}
+            tag_filter = st.sidebar.selectbox(
+                t("filter_by_tag"), tag_options, key="library_tag_filter",
+                format_func=lambda name: t("all_tags") if name is None else f"{name} ({counts[name]})"
+            )
+
+    # 分頁狀態：搜尋條件改變時回到第一頁
+    page_key = (search_query, st.session_state.language, tag_filter)
+    paging = st.session_state.get('library_paging')
+    if not paging or paging['key'] != page_key:
+        paging = st.session_state.library_paging = {'key': page_key, 'page': 0, 'cursors': [None]}
+    page = paging['page']
+
+    # 載入提示詞（列表只取預覽，內文在按下載入時才讀取）
     if search_query:
-        prompts = db.search_prompts(search_query, st.session_state.language)
+        prompts = db.search_prompts(
+            search_query, st.session_state.language,
+            limit=LIBRARY_PAGE_SIZE + 1, offset=page * LIBRARY_PAGE_SIZE
+        )
+        has_next = len(prompts) > LIBRARY_PAGE_SIZE
+        prompts = prompts[:LIBRARY_PAGE_SIZE]
     else:
-        prompts = db.load_prompts(limit=20)
-    
+        result = db.query_prompts(limit=LIBRARY_PAGE_SIZE, cursor=paging['cursors'][page], tag=tag_filter)
+        prompts = result['prompts']
+        has_next = result['next_cursor'] is not None
+        if has_next:
+            del paging['cursors'][page + 1:]
+            paging['cursors'].append(result['next_cursor'])
+
     if prompts:
         # 顯示提示詞列表
         for prompt in prompts:
@@ -976,23 +1335,28 @@ def show_prompt_library_sidebar():
                 st.write(f"**{t('created_at')}:** {prompt['created_at'][:10]}")
                 if prompt['tags']:
                     st.write(f"**Tags:** {', '.join(prompt['tags'])}")
+                if prompt.get('duplicate_of'):
+                    st.caption(t("possible_duplicate"))
                 
                 # 預覽區域
                 preview_tab1, preview_tab2 = st.tabs(["📄 原始", "✨ 優化"])
+                original_preview = prompt.get('original_preview', prompt.get('original_prompt', ''))
+                optimized_preview = prompt.get('optimized_preview', prompt.get('optimized_prompt', ''))
                 with preview_tab1:
-                    st.text_area("原始提示", prompt['original_prompt'][:100] + "...", height=80, disabled=True, key=f"orig_{prompt['id']}")
+                    st.text_area("原始提示", original_preview[:100] + "...", height=80, disabled=True, key=f"orig_{prompt['id']}")
                 with preview_tab2:
-                    st.text_area("優化提示", prompt['optimized_prompt'][:100] + "...", height=80, disabled=True, key=f"opt_{prompt['id']}")
+                    st.text_area("優化提示", optimized_preview[:100] + "...", height=80, disabled=True, key=f"opt_{prompt['id']}")
                 
                 # 載入按鈕組
                 col1, col2, col3 = st.columns(3)
                 with col1:
                     if st.button(t("load_original"), key=f"load_orig_{prompt['id']}", use_container_width=True):
                         # 載入原始提示（支援兩種模式）
+                        full_prompt = db.load_prompt_by_id(prompt['id']) or prompt
                         if st.session_state.conversation_mode:
-                            st.session_state.current_session = create_new_session(prompt['original_prompt'])
+                            st.session_state.current_session = create_new_session(full_prompt['original_prompt'])
                         else:
-                            st.session_state.initial_prompt = prompt['original_prompt']
+                            st.session_state.initial_prompt = full_prompt['original_prompt']
                             st.session_state.current_stage = "initial"
                         st.success(f"✅ {t('load_success')} (原始)")
                         st.rerun()
@@ -1000,10 +1364,11 @@ def show_prompt_library_sidebar():
                 with col2:
                     if st.button(t("load_optimized"), key=f"load_opt_{prompt['id']}", use_container_width=True):
                         # 載入優化提示（支援兩種模式）
+                        full_prompt = db.load_prompt_by_id(prompt['id']) or prompt
                         if st.session_state.conversation_mode:
-                            st.session_state.current_session = create_new_session(prompt['optimized_prompt'])
+                            st.session_state.current_session = create_new_session(full_prompt['optimized_prompt'])
                         else:
-                            st.session_state.initial_prompt = prompt['optimized_prompt']
+                            st.session_state.initial_prompt = full_prompt['optimized_prompt']
                             st.session_state.current_stage = "initial"
                         st.success(f"✅ {t('load_success')} (優化)")
                         st.rerun()
@@ -1011,23 +1376,166 @@ def show_prompt_library_sidebar():
                 with col3:
                     if st.button(t("convert_to_skill_short"), key=f"skill_{prompt['id']}",
                                  help=t("convert_to_skill"), use_container_width=True):
+                        full_prompt = db.load_prompt_by_id(prompt['id']) or prompt
                         convert_prompt_to_skill(
-                            optimized_prompt=prompt['optimized_prompt'],
-                            original_prompt=prompt['original_prompt']
+                            optimized_prompt=full_prompt['optimized_prompt'],
+                            original_prompt=full_prompt['original_prompt']
                         )
                 
+                if st.button(t("version_history"), key=f"history_{prompt['id']}", use_container_width=True):
+                    st.session_state.version_history_id = prompt['id']
+                    st.rerun()
+
                 # 刪除按鈕
                 if st.button(t("delete_prompt"), key=f"del_{prompt['id']}", use_container_width=True):
                     if db.delete_prompt(prompt['id']):
                         st.success("已刪除")
                         st.rerun()
-    else:
+    elif page == 0:
         st.sidebar.info(t("no_saved_prompts"))
 
+    # 翻頁按鈕
+    if page > 0 or has_next:
+        col_prev, col_page, col_next = st.sidebar.columns([2, 1, 2])
+        with col_prev:
+            if st.button(t("prev_page"), key="library_prev", disabled=page == 0, use_container_width=True):
+                paging['page'] -= 1
+                st.rerun()
+        with col_page:
+            st.caption(t("page_number").format(page=page + 1))
+        with col_next:
+            if st.button(t("next_page"), key="library_next", disabled=not has_next, use_container_width=True):
+                paging['page'] += 1
+                st.rerun()
+
+
+# 版本歷史檢視（主畫面）
+def show_version_history():
+    """顯示側邊欄所選提示詞的版本內容與任兩版的差異"""
+    db = st.session_state.prompt_db
+    prompt_id = st.session_state.version_history_id
+    versions = db.get_prompt_versions(prompt_id)
+    if not versions:
+        st.session_state.version_history_id = None
+        return
+
+    kinds = translations[st.session_state.language]["version_kinds"]
+    labels = {
+        item['version']: t("version_option").format(version=item['version'], kind=kinds[item['kind']], size=item['size'])
+        for item in versions
+    }
+    numbers = list(labels)
+
+    col_title, col_close = st.columns([4, 1])
+    with col_title:
+        st.subheader(t("version_history"))
+    with col_close:
+        if st.button(t("close"), key="version_history_close", use_container_width=True):
+            st.session_state.version_history_id = None
+            st.rerun()
+
+    col_from, col_to = st.columns(2)
+    with col_from:
+        from_version = st.selectbox(t("version_from"), numbers, index=max(0, len(numbers) - 2),
+                                    format_func=labels.get, key=f"version_from_{prompt_id}")
+    with col_to:
+        to_version = st.selectbox(t("version_to"), numbers, index=len(numbers) - 1,
+                                  format_func=labels.get, key=f"version_to_{prompt_id}")
+
+    diff = db.diff_prompt_versions(prompt_id, from_version, to_version)
+    if diff:
+        st.code(diff, language="diff")
+    else:
+        st.info(t("version_same"))
+
+    with st.expander(labels[to_version]):
+        st.text_area(labels[to_version], db.load_prompt_version(prompt_id, to_version) or "", height=200,
+                     disabled=True, label_visibility="collapsed", key=f"version_text_{prompt_id}_{to_version}")
+    st.markdown("---")
+
+
+# 詞庫分析（主畫面）
+def show_library_analytics():
+    """顯示提示詞庫的評分分佈、綜合分數、語言／標籤趨勢與優化前後的分數變化"""
+    analytics = st.session_state.get('library_analytics')
+    if analytics is None or analytics.storage is not st.session_state.prompt_db:
+        analytics = st.session_state.library_analytics = LibraryAnalytics(st.session_state.prompt_db)
+    # 權重取自 prompts.yaml 的 evaluation_dimensions（支援熱重載）
+    analytics.set_dimensions(get_default_loader().prompts.get('evaluation_dimensions'))
+    report = analytics.report()  # 詞庫未變更時直接使用快取
+
+    fields = translations[st.session_state.language]["analytics_fields"]
+
+    col_title, col_close = st.columns([4, 1])
+    with col_title:
+        st.subheader(t("analytics_title"))
+    with col_close:
+        if st.button(t("close"), key="library_analytics_close", use_container_width=True):
+            st.session_state.show_library_analytics = False
+            st.rerun()
+
+    frame = report.frame
+    scored = frame["composite"].notna()
+    if not scored.any():
+        st.info(t("analytics_empty"))
+        st.markdown("---")
+        return
+
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric(t("analytics_prompts"), len(frame))
+    col2.metric(t("analytics_scored"), int(scored.sum()))
+    col3.metric(t("analytics_composite"), f"{frame['composite'].mean():.2f}")
+    gain = report.delta_summary.loc["composite", "mean"]
+    col4.metric(t("analytics_improvement"), "—" if gain != gain else f"{gain:+.2f}")
+
+    st.markdown(f"**{t('analytics_distribution')}**")
+    dimension = st.selectbox(t("analytics_dimension"), list(SCORE_FIELDS) + ["composite"],
+                             index=len(SCORE_FIELDS), format_func=fields.get, key="analytics_dimension")
+    st.bar_chart(report.distributions[dimension])
+
+    col_lang, col_tag = st.columns(2)
+    with col_lang:
+        st.markdown(f"**{t('analytics_by_language')}**")
+        st.dataframe(report.by_language.rename(columns=fields).round(2), use_container_width=True)
+    with col_tag:
+        st.markdown(f"**{t('analytics_by_tag')}**")
+        st.dataframe(report.by_tag.rename(columns=fields).round(2), use_container_width=True)
+
+    st.markdown(f"**{t('analytics_trends')}**")
+    tab_lang, tab_tag = st.tabs([t("analytics_by_language"), t("analytics_by_tag")])
+    for tab, trend in ((tab_lang, report.language_trends), (tab_tag, report.tag_trends)):
+        if not trend.empty:
+            tab.line_chart(trend.set_axis(trend.index.astype(str)))
+
+    st.markdown(f"**{t('analytics_deltas')}**")
+    if report.deltas.empty:
+        st.info(t("analytics_no_deltas"))
+    else:
+        st.dataframe(report.delta_summary.rename(index=fields).round(2), use_container_width=True)
+    st.markdown("---")
+
+
+# 相似提示（重用已優化的版本）
+def show_similar_prompts(matches):
+    """列出與輸入相似的已保存提示，可直接載入其優化版本"""
+    if not matches:
+        st.info(t("similar_none"))
+        return
+
+    st.subheader(t("similar_header"))
+    st.caption(t("similar_hint"))
+    for match in matches:
+        with st.expander(t("similar_match").format(name=match['name'], score=match['similarity'])):
+            st.code(match['optimized_prompt'], language=None)
+            if st.button(t("load_optimized"), key=f"similar_load_{match['id']}"):
+                st.session_state.initial_prompt = match['optimized_prompt']
+                st.session_state.similar_prompts = None
+                st.rerun()
+
 
 # 保存提示對話框
-def show_save_prompt_dialog(original_prompt, optimized_prompt, analysis_scores=None):
-    """顯示保存提示的對話框"""
+def show_save_prompt_dialog(original_prompt, optimized_prompt, analysis_scores=None, history=None):
+    """顯示保存提示的對話框（history：最終版本之前的各版本，會保存為版本歷史）"""
     with st.expander(t("save_prompt"), expanded=False):
         # 使用 form 來避免 session state 問題
         with st.form("save_prompt_form"):
@@ -1040,16 +1548,20 @@ def show_save_prompt_dialog(original_prompt, optimized_prompt, analysis_scores=N
                         # 處理標籤
                         tags = [tag.strip() for tag in save_tags.split(",") if tag.strip()] if save_tags else []
                         
-                        # 保存到資料庫
-                        prompt_id = st.session_state.prompt_db.save_prompt(
+                        # 保存到資料庫（重複的提示詞依 duplicate_policy 處理）
+                        db = st.session_state.prompt_db
+                        duplicate = db.find_duplicate(optimized_prompt)
+                        prompt_id = db.save_prompt(
                             name=save_name,
                             original_prompt=original_prompt,
                             optimized_prompt=optimized_prompt,
                             analysis_scores=analysis_scores,
                             tags=tags,
-                            language=st.session_state.language
+                            language=st.session_state.language,
+                            history=history
                         )
 
+                        render_duplicate_notice(duplicate, db.duplicate_policy, t)
                         st.success(t("save_success"))
                         st.rerun()  # 重新運行以清空表單
                         
@@ -1076,18 +1588,34 @@ def show_optimize_ui():
             type_display = translations[st.session_state.language]["prompt_types"][prompt_type]
             st.info(f"**{t('prompt_type')}**: {type_display}")
 
-        if st.button(t("analyze_button")):
+        col_analyze, col_similar = st.columns([1, 1])
+        with col_analyze:
+            analyze_clicked = st.button(t("analyze_button"))
+        with col_similar:
+            # 離線向量索引，不呼叫 LLM
+            if st.button(t("find_similar"), key="find_similar") and initial_prompt:
+                st.session_state.similar_prompts = {
+                    'query': initial_prompt,
+                    'matches': st.session_state.prompt_db.find_similar(initial_prompt, limit=SIMILAR_LIMIT),
+                }
+
+        similar = st.session_state.get('similar_prompts')
+        if similar and similar['query'] == initial_prompt:
+            show_similar_prompts(similar['matches'])
+
+        if analyze_clicked:
             if initial_prompt:
                 with st.spinner(t("processing")):
                     # 創建評估器並分析提示
-                    llm_instance = create_llm()
-                    evaluator = PromptEvaluator(llm_instance=llm_instance)
+                    evaluator = create_evaluator()
                     analysis = evaluator.analyze_prompt(initial_prompt, st.session_state.language)
 
                     # 保存提示類型到會話狀態
                     st.session_state.prompt_type = identify_prompt_type(initial_prompt)
                     st.session_state.analysis = analysis
                     st.session_state.initial_prompt = initial_prompt
+                    # 版本歷史：最初的 prompt 及每次「再次優化」的輸入
+                    st.session_state.prompt_lineage = [initial_prompt]
                     st.session_state.current_stage = "questions"
                     st.rerun()  # 重新運行以顯示問題
             else:
@@ -1130,7 +1658,8 @@ def show_optimize_ui():
         show_save_prompt_dialog(
             st.session_state.initial_prompt,
             result["enhanced_prompt"],
-            st.session_state.get('analysis', {})
+            st.session_state.get('analysis', {}),
+            history=st.session_state.get('prompt_lineage') or [st.session_state.initial_prompt]
         )
 
         # 提供進一步優化選項和 Skill 轉換
@@ -1148,6 +1677,8 @@ def show_optimize_ui():
 
         with col3:
             if st.button(t("optimize_again")):
+                st.session_state.setdefault('prompt_lineage', [st.session_state.initial_prompt])
+                st.session_state.prompt_lineage.append(result["enhanced_prompt"])
                 st.session_state.initial_prompt = result["enhanced_prompt"]
                 st.session_state.prompt_type = enhanced_type
                 st.session_state.current_stage = "questions"
@@ -1167,8 +1698,7 @@ def show_optimize_ui():
         st.header(t("improvement_header"))
         
         analysis = st.session_state.analysis
-        llm_instance = create_llm()
-        evaluator = PromptEvaluator(llm_instance=llm_instance)
+        evaluator = create_evaluator()
         questions = evaluator.generate_questions(analysis, st.session_state.language)
         
         user_responses = {}
@@ -1348,7 +1878,34 @@ def add_custom_css():
     """, unsafe_allow_html=True)
 
 # 主函數
+def flush_local_storage():
+    """上線模式：將本次執行累積的 LocalStorage 變更寫入瀏覽器（失敗則保留，下次執行重試）"""
+    db = st.session_state.get('prompt_db')
+    if isinstance(db, LocalStoragePromptDB) and db.has_pending_writes():
+        db.flush()
+
+
+def stop_run():
+    """st.stop() 之後無法再繪製任何元件（包括 LocalStorage 寫入），因此先寫入累積的變更"""
+    flush_local_storage()
+    st.stop()
+
+
 def main():
+    # 本次執行累積的 LocalStorage 變更在結束時一次寫入（包括未捕捉的例外）；
+    # 以 st.rerun() 結束的執行，其變更由下一次執行寫入
+    rerun = False
+    try:
+        render_app()
+    except RerunException:
+        rerun = True
+        raise
+    finally:
+        if not rerun:
+            flush_local_storage()
+
+
+def render_app():
     add_custom_css()
     
     # 初始化會話狀態
@@ -1388,10 +1945,18 @@ def main():
     # 顯示側邊欄
     show_sidebar()
 
+    # 側邊欄選取的版本歷史
+    if st.session_state.get('version_history_id'):
+        show_version_history()
+
+    # 側邊欄開啟的詞庫分析
+    if st.session_state.get('show_library_analytics'):
+        show_library_analytics()
+
     # 根據模式顯示不同的 UI
     if st.session_state.conversation_mode:
         # 對話式 UI
-        render_conversation_ui(t, create_llm)
+        render_conversation_ui(t, create_llm, create_evaluator)
     else:
         # 傳統階段式 UI
         show_optimize_ui()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+提示詞資料庫效能基準測試
+量測不同資料量（預設 1k / 10k / 100k 筆）下 save / load / search / similar / duplicate / analytics 的延遲
+
+用法:
+    python benchmark_database.py
+    python benchmark_database.py --sizes 1000 10000 --repeat 50
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List
+
+from prompt_analytics import SCORE_FIELDS, build_report, dimension_weights
+from prompt_database import ROW_COLUMNS, ROW_PARAMS, PromptDatabase, score_columns
+
+WORDS = [
+    "translate", "summarize", "code", "review", "email", "marketing", "analysis",
+    "product", "customer", "report", "python", "sql", "story", "meeting",
+    "翻譯", "摘要", "程式碼", "審查", "行銷", "分析", "客戶", "報告", "會議", "故事",
+]
+TAGS = ["writing", "coding", "business", "education", "translation", "data"]
+LANGUAGES = ["zh_TW", "en", "ja"]
+
+
+def _text(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+def _scores(rng: random.Random) -> Dict[str, int]:
+    return {field: rng.randint(1, 10) for field in SCORE_FIELDS}
+
+
+def populate(db: PromptDatabase, rows: int, seed: int = 0, batch_size: int = 1000) -> None:
+    """以單一交易批次寫入測試資料（不計入量測）"""
+    rng = random.Random(seed)
+    start = datetime(2024, 1, 1)
+    with db._transaction() as cursor:
+        for offset in range(0, rows, batch_size):
+            scores = [_scores(rng) for _ in range(offset, min(rows, offset + batch_size))]
+            records = [
+                {
+                    "id": str(uuid.UUID(int=rng.getrandbits(128))),
+                    "name": _text(rng, 4),
+                    "original_prompt": _text(rng, 60),
+                    "optimized_prompt": _text(rng, 150),
+                    "analysis_scores": json.dumps(scores[i - offset]),
+                    **score_columns(scores[i - offset]),
+                    "tags": '["%s"]' % rng.choice(TAGS),
+                    "language": rng.choice(LANGUAGES),
+                    "created_at": (start + timedelta(minutes=i)).isoformat(),
+                    "updated_at": (start + timedelta(minutes=i)).isoformat(),
+                }
+                for i in range(offset, min(rows, offset + batch_size))
+            ]
+            db._store_bodies(cursor, records)
+            cursor.executemany(f"INSERT INTO prompts ({ROW_COLUMNS}) VALUES ({ROW_PARAMS})", records)
+
+
+def measure(func: Callable[[], object], repeat: int) -> Dict[str, float]:
+    """執行 repeat 次並回傳延遲統計（毫秒）"""
+    samples: List[float] = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - t0) * 1000)
+    samples.sort()
+    return {
+        "mean": statistics.fmean(samples),
+        "p50": samples[len(samples) // 2],
+        "p95": samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+    }
+
+
+def run(rows: int, repeat: int, workdir: str) -> Dict[str, Dict[str, float]]:
+    """對單一資料量執行所有量測"""
+    path = os.path.join(workdir, f"bench_{rows}.db")
+    db = PromptDatabase(path)
+    populate(db, rows)
+    rng = random.Random(1)
+    ids = [row[0] for row in db._query("SELECT id FROM prompts ORDER BY RANDOM() LIMIT ?", (repeat,))]
+    id_iter = iter(ids * 2)
+    db.find_similar(_text(rng, 20))  # builds the similarity index (not measured)
+
+    results = {
+        "save": measure(lambda: db.save_prompt(
+            _text(rng, 4), _text(rng, 60), _text(rng, 150),
+            _scores(rng), [rng.choice(TAGS)], rng.choice(LANGUAGES)
+        ), repeat),
+        "load_page": measure(lambda: db.load_prompts(limit=20), repeat),
+        "query_page": measure(lambda: db.query_prompts(limit=20, language=rng.choice(LANGUAGES)), repeat),
+        "load_by_id": measure(lambda: db.load_prompt_by_id(next(id_iter)), repeat),
+        "search": measure(lambda: db.search_prompts(
+            rng.choice(WORDS[:14]) + " " + rng.choice(WORDS[:14]), limit=20), repeat),
+        "search_cjk": measure(lambda: db.search_prompts(
+            rng.choice(WORDS[14:]) + " " + rng.choice(WORDS[14:]), limit=20), repeat),
+        "search_short": measure(lambda: db.search_prompts(rng.choice(WORDS[14:]), limit=20), repeat),
+        "count": measure(db.get_prompt_count, repeat),
+        "similar": measure(lambda: db.find_similar(_text(rng, 20)), repeat),
+        "duplicate": measure(lambda: db.find_duplicate(_text(rng, 150)), repeat),
+        "analytics": measure(lambda: build_report(db.get_analytics_data(), dimension_weights(None), 0), repeat),
+    }
+    db.close()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="PromptDatabase latency benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--repeat", type=int, default=30, help="iterations per operation")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        print(f"{'rows':>8}  {'operation':<12} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9}")
+        for rows in args.sizes:
+            for operation, stats in run(rows, args.repeat, workdir).items():
+                print(f"{rows:>8}  {operation:<12} {stats['mean']:>9.2f} {stats['p50']:>9.2f} {stats['p95']:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
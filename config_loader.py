@@ -4,49 +4,68 @@ Config Loader - YAML-based Application Configuration Loader
 Loads application configuration from YAML files with environment variable override support
 """
 
-import yaml
 import os
-from typing import Dict, Any, Optional
+import threading
+from typing import Callable, Dict, Any, List, Optional
 from pathlib import Path
 import logging
 from dotenv import load_dotenv
 
+from config_watcher import FileWatcher
+from yaml_cache import load_yaml
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+_dotenv_loaded = False
+
+
+def _load_dotenv_once() -> None:
+    """Load .env into the process environment once (it does not change at runtime)"""
+    global _dotenv_loaded
+    if not _dotenv_loaded:
+        load_dotenv()
+        _dotenv_loaded = True
+
 
 class ConfigLoader:
     """Loads and manages application configuration from YAML files"""
     
-    def __init__(self, config_path: str = "config/config.yaml"):
+    def __init__(self, config_path: str = "config/config.yaml", use_cache: bool = True):
         """
         Initialize the config loader
         
         Args:
             config_path: Path to the config YAML file
+            use_cache: Reuse the parsed-YAML snapshot cache next to the file
         """
         # Load .env file first (secrets)
-        load_dotenv()
+        _load_dotenv_once()
         
         self.config_path = Path(config_path)
-        self.config = {}
+        self.use_cache = use_cache
+        # Immutable snapshot: replaced as a whole on reload, never mutated in place
+        self._config: Dict[str, Any] = {}
+        self._watcher: Optional[FileWatcher] = None
+        self._reload_listeners: List[Callable[["ConfigLoader"], None]] = []
         self._load()
     
+    @property
+    def config(self) -> Dict[str, Any]:
+        """Current configuration snapshot (treat as read-only)"""
+        return self._config
+    
     def _load(self) -> None:
         """Load configuration from YAML file"""
         try:
             if not self.config_path.exists():
                 logger.warning(f"Config file not found: {self.config_path}")
                 logger.warning("Using default configuration")
-                self.config = self._get_default_config()
+                self._config = self._get_default_config()
                 return
             
-            with open(self.config_path, 'r', encoding='utf-8') as f:
-                self.config = yaml.safe_load(f)
-            
-            # Apply environment variable overrides
-            self._apply_env_overrides()
+            self._config = self._build_config()
             
             logger.info(f"Loaded configuration from {self.config_path}")
             logger.info(f"Version: {self.config.get('version', 'unknown')}")
@@ -55,7 +74,26 @@ class ConfigLoader:
         except Exception as e:
             logger.error(f"Error loading configuration: {e}")
             logger.warning("Falling back to default configuration")
-            self.config = self._get_default_config()
+            self._config = self._get_default_config()
+    
+    def _build_config(self) -> Dict[str, Any]:
+        """
+        Parse the YAML file and apply environment overrides
+        
+        Returns:
+            New configuration dict (not yet published)
+        
+        Raises:
+            Exception: If the file cannot be read or parsed
+        """
+        config = load_yaml(self.config_path, self.use_cache)
+        
+        if not isinstance(config, dict):
+            raise ValueError(f"Config must be a mapping, got {type(config).__name__}")
+        
+        # Apply environment variable overrides
+        self._apply_env_overrides(config)
+        return config
     
     def _get_default_config(self) -> Dict:
         """Get minimal default configuration as fallback"""
@@ -83,12 +121,12 @@ class ConfigLoader:
             }
         }
     
-    def _apply_env_overrides(self) -> None:
-        """Apply environment variable overrides"""
+    def _apply_env_overrides(self, config: Dict[str, Any]) -> None:
+        """Apply environment variable overrides to a freshly parsed config"""
         # Google Cloud Project ID
         if os.getenv('GOOGLE_CLOUD_PROJECT'):
-            if 'llm' in self.config and 'gemini_vertex' in self.config['llm']:
-                self.config['llm']['gemini_vertex']['project_id'] = os.getenv('GOOGLE_CLOUD_PROJECT')
+            if 'llm' in config and 'gemini_vertex' in config['llm']:
+                config['llm']['gemini_vertex']['project_id'] = os.getenv('GOOGLE_CLOUD_PROJECT')
                 logger.info("Overriding gemini_vertex.project_id from GOOGLE_CLOUD_PROJECT env var")
         
         # Add more environment variable overrides as needed
@@ -182,25 +220,90 @@ class ConfigLoader:
         Returns:
             True if valid, False otherwise
         """
+        error = self._validate(self.config)
+        if error:
+            logger.error(error)
+            return False
+        
+        logger.info("Configuration validation passed")
+        return True
+    
+    def _validate(self, config: Dict[str, Any]) -> Optional[str]:
+        """
+        Validate a configuration dict
+        
+        Args:
+            config: Configuration to validate
+        
+        Returns:
+            Error message, or None if valid
+        """
         required_keys = ['version', 'llm', 'app']
         
         for key in required_keys:
-            if key not in self.config:
-                logger.error(f"Missing required key: {key}")
-                return False
+            if key not in config:
+                return f"Missing required key: {key}"
         
         # Validate LLM config
-        if 'default_provider' not in self.config.get('llm', {}):
-            logger.error("Missing llm.default_provider")
+        if 'default_provider' not in config.get('llm', {}):
+            return "Missing llm.default_provider"
+        
+        return None
+    
+    def reload(self) -> bool:
+        """
+        Reload configuration from file (hot reload)
+        
+        The new file is parsed and validated before it replaces the current
+        snapshot; on any failure the current configuration stays in effect.
+        
+        Returns:
+            True if the new configuration was swapped in
+        """
+        logger.info("Reloading configuration...")
+        try:
+            config = self._build_config()
+        except Exception as e:
+            logger.error(f"Error reloading configuration, keeping current: {e}")
             return False
         
-        logger.info("Configuration validation passed")
+        error = self._validate(config)
+        if error:
+            logger.error(f"Reloaded configuration is invalid, keeping current: {error}")
+            return False
+        
+        self._config = config
+        logger.info(f"Reloaded configuration from {self.config_path}")
+        for listener in list(self._reload_listeners):
+            try:
+                listener(self)
+            except Exception as e:
+                logger.error(f"Error applying reloaded configuration: {e}")
         return True
     
-    def reload(self) -> None:
-        """Reload configuration from file (hot reload)"""
-        logger.info("Reloading configuration...")
-        self._load()
+    def add_reload_listener(self, listener: Callable[["ConfigLoader"], None]) -> None:
+        """
+        Call listener(self) after every successful reload
+        
+        For settings read once into long-lived objects (e.g. prompt version weights).
+        """
+        self._reload_listeners.append(listener)
+    
+    def start_watching(self, interval: float = 2.0) -> None:
+        """
+        Watch the YAML file and hot reload it on change
+        
+        Args:
+            interval: Polling interval in seconds
+        """
+        if self._watcher is None:
+            self._watcher = FileWatcher(str(self.config_path), self.reload, interval)
+        self._watcher.start()
+    
+    def stop_watching(self) -> None:
+        """Stop watching the YAML file"""
+        if self._watcher is not None:
+            self._watcher.stop()
     
     def get_version(self) -> str:
         """Get configuration version"""
@@ -213,13 +316,23 @@ class ConfigLoader:
 
 # Singleton instance for global access
 _default_config_loader = None
+_default_config_loader_lock = threading.Lock()
 
 
 def get_default_config_loader() -> ConfigLoader:
-    """Get default singleton config loader instance"""
+    """
+    Get default singleton config loader instance
+    
+    Starts hot reload when config.yaml sets app.config_hot_reload.
+    """
     global _default_config_loader
     if _default_config_loader is None:
-        _default_config_loader = ConfigLoader()
+        with _default_config_loader_lock:
+            if _default_config_loader is None:
+                loader = ConfigLoader()
+                if loader.get('app.config_hot_reload', False):
+                    loader.start_watching(loader.get('app.config_hot_reload_interval_seconds', 2.0))
+                _default_config_loader = loader
     return _default_config_loader
 
 
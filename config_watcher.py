@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Config Watcher - mtime polling file watcher for hot reload
+Calls a reload callback from a background thread when a watched file changes
+"""
+
+import os
+import threading
+import logging
+from pathlib import Path
+from typing import Callable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class FileWatcher:
+    """
+    Polls a file's mtime and size and triggers a callback when they change
+
+    Polling is used instead of inotify so it works the same on macOS, Linux
+    and Docker bind mounts. A change is only reported once the file has been
+    stable for one full interval, so half-written files are not picked up.
+    """
+
+    def __init__(self, path: str, on_change: Callable[[], None], interval: float = 2.0):
+        """
+        Initialize the watcher
+
+        Args:
+            path: File to watch
+            on_change: Callback invoked (on the watcher thread) after a change
+            interval: Polling interval in seconds
+        """
+        self.path = Path(path)
+        self.on_change = on_change
+        self.interval = interval
+        self._last_seen = self._stat()
+        self._pending: Optional[Tuple[float, int]] = None
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _stat(self) -> Optional[Tuple[float, int]]:
+        """Return (mtime, size) of the watched file, or None if it does not exist"""
+        try:
+            st = os.stat(self.path)
+            return (st.st_mtime, st.st_size)
+        except OSError:
+            return None
+
+    def check(self) -> bool:
+        """
+        Check the file once and fire the callback if a settled change is found
+
+        Returns:
+            True if the callback was invoked
+        """
+        current = self._stat()
+        if current is None or current == self._last_seen:
+            self._pending = None
+            return False
+
+        # Wait until the file has stopped changing for one interval
+        if current != self._pending:
+            self._pending = current
+            return False
+
+        self._last_seen = current
+        self._pending = None
+        try:
+            self.on_change()
+        except Exception as e:
+            logger.error(f"Error reloading {self.path}: {e}")
+        return True
+
+    def _run(self) -> None:
+        """Polling loop"""
+        while not self._stop_event.wait(self.interval):
+            self.check()
+
+    def start(self) -> None:
+        """Start polling on a daemon thread (no-op if already running)"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(
+            target=self._run, name=f"FileWatcher({self.path.name})", daemon=True
+        )
+        self._thread.start()
+        logger.info(f"Watching {self.path} for changes (every {self.interval}s)")
+
+    def stop(self) -> None:
+        """Stop polling"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval + 1)
+            self._thread = None
+
+    @property
+    def is_running(self) -> bool:
+        """Whether the polling thread is alive"""
+        return self._thread is not None and self._thread.is_alive()
@@ -42,7 +42,8 @@ class ConversationFlow:
     }
 
 
-    def __init__(self, session: ConversationSession, llm_instance: Any, language: str = "zh_TW"):
+    def __init__(self, session: ConversationSession, llm_instance: Any, language: str = "zh_TW",
+                 evaluator: Optional[PromptEvaluator] = None):
         """
         初始化對話流程控制器
 
@@ -50,11 +51,12 @@ class ConversationFlow:
             session: 對話會話
             llm_instance: LLM 實例
             language: 語言代碼
+            evaluator: 可選的共用 PromptEvaluator（未提供時以 llm_instance 建立）
         """
         self.session = session
         self.llm = llm_instance
         self.language = language
-        self.evaluator = PromptEvaluator(llm_instance=llm_instance)
+        self.evaluator = evaluator if evaluator else PromptEvaluator(llm_instance=llm_instance)
         self.state = ConversationState.IDLE
 
     def _get_error_message(self, key: str, error: str) -> str:
@@ -271,12 +273,13 @@ class ConversationFlow:
                 self.language
             )
 
-            # 添加優化結果訊息
+            # 添加優化結果訊息（parent 指向被優化的版本，用於保存版本歷史）
             optimization_msg = self.session.add_message(
                 role=MessageRole.ASSISTANT,
                 msg_type=MessageType.OPTIMIZATION,
                 content=result["enhanced_prompt"],
-                optimization_data=result
+                optimization_data=result,
+                parent_message_id=self._current_version_message_id()
             )
 
             # 更新會話狀態
@@ -315,6 +318,15 @@ class ConversationFlow:
         self.session.iteration_count = 0
         self.state = ConversationState.IDLE
 
+    def _current_version_message_id(self) -> Optional[str]:
+        """目前 prompt 所在的訊息（用戶輸入或上一次的優化結果）"""
+        for msg in reversed(self.session.messages):
+            if msg.content != self.session.current_prompt:
+                continue
+            if msg.type == MessageType.OPTIMIZATION or (msg.role == MessageRole.USER and msg.type == MessageType.TEXT):
+                return msg.id
+        return None
+
     def can_optimize(self) -> bool:
         """檢查是否可以執行優化"""
         return (
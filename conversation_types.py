@@ -119,6 +119,26 @@ class ConversationSession:
         """獲取最後一條訊息"""
         return self.messages[-1] if self.messages else None
 
+    def get_prompt_lineage(self, message_id: str) -> List[str]:
+        """
+        獲取某個優化結果之前的各版本 prompt（沿 parent_message_id 回溯）
+
+        Args:
+            message_id: 優化結果訊息的 ID
+
+        Returns:
+            由最初的 prompt 到上一版的內容列表（不含該優化結果本身）
+        """
+        by_id = {msg.id: msg for msg in self.messages}
+        message = by_id.get(message_id)
+        lineage = []
+        parent = by_id.get(message.parent_message_id) if message and message.parent_message_id else None
+        while parent is not None:
+            lineage.append(parent.content)
+            parent = by_id.get(parent.parent_message_id) if parent.parent_message_id else None
+        lineage.reverse()
+        return lineage or [self.original_prompt]
+
     def clear_messages(self):
         """清空訊息歷史"""
         self.messages = []
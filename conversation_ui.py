@@ -75,13 +75,15 @@ def add_chat_css():
     """, unsafe_allow_html=True)
 
 
-def render_conversation_ui(t_func: Callable[[str], str], create_llm_func: Callable[[], Any]):
+def render_conversation_ui(t_func: Callable[[str], str], create_llm_func: Callable[[], Any],
+                           create_evaluator_func: Optional[Callable[[], Any]] = None):
     """
     渲染對話式 UI 主介面（簡化版：單次優化流程）
 
     Args:
         t_func: 翻譯函數
         create_llm_func: 創建 LLM 實例的函數
+        create_evaluator_func: 可選，取得共用 PromptEvaluator 的函數
     """
     session = st.session_state.current_session
 
@@ -93,7 +95,7 @@ def render_conversation_ui(t_func: Callable[[str], str], create_llm_func: Callab
         render_message(msg, t_func)
 
     # 根據狀態渲染輸入區域（簡化：無追加對話）
-    render_input_area_simple(session, t_func, create_llm_func)
+    render_input_area_simple(session, t_func, create_llm_func, create_evaluator_func)
 
 
 
@@ -367,6 +369,19 @@ def render_optimization_card(msg: Message, t_func: Callable[[str], str]):
 
 
 
+def render_duplicate_notice(duplicate: Optional[Dict], policy: str, t_func: Callable[[str], str]):
+    """
+    保存時偵測到重複提示詞的通知（toast 在 rerun 後仍會顯示）
+
+    Args:
+        duplicate: find_duplicate() 的結果（None 表示沒有重複）
+        policy: 儲存後端的 duplicate_policy（flag / merge / skip）
+        t_func: 翻譯函數
+    """
+    if duplicate:
+        st.toast(t_func(f"duplicate_{policy}").format(name=duplicate['name'], score=duplicate['similarity']), icon="🔁")
+
+
 def render_save_prompt_form(original_prompt: str, optimized_prompt: str, analysis_scores: Optional[Dict], t_func: Callable[[str], str], msg_id: str):
     """
     渲染保存提示表單
@@ -400,16 +415,19 @@ def render_save_prompt_form(original_prompt: str, optimized_prompt: str, analysi
                 # 處理標籤
                 tags = [tag.strip() for tag in save_tags.split(",") if tag.strip()] if save_tags else []
 
-                # 保存到資料庫
-                prompt_id = st.session_state.prompt_db.save_prompt(
+                # 保存到資料庫（連同此結果之前的各版本；重複的提示詞依 duplicate_policy 處理）
+                db = st.session_state.prompt_db
+                duplicate = db.find_duplicate(optimized_prompt)
+                prompt_id = db.save_prompt(
                     name=save_name,
                     original_prompt=original_prompt,
                     optimized_prompt=optimized_prompt,
                     analysis_scores=analysis_scores,
                     tags=tags,
-                    language=st.session_state.language
+                    language=st.session_state.language,
+                    history=st.session_state.current_session.get_prompt_lineage(msg_id)
                 )
-
+                render_duplicate_notice(duplicate, db.duplicate_policy, t_func)
 
                 # 關閉保存表單
                 st.session_state.active_save_msg_id = None
@@ -528,7 +546,17 @@ def get_conversation_ui_translations():
     }
 
 
-def render_input_area_simple(session: ConversationSession, t_func: Callable[[str], str], create_llm_func: Callable[[], Any]):
+def _create_flow(session: ConversationSession, create_llm_func: Callable[[], Any],
+                 create_evaluator_func: Optional[Callable[[], Any]] = None) -> ConversationFlow:
+    """建立對話流程控制器（有提供時重用共用的 PromptEvaluator）"""
+    if create_evaluator_func:
+        evaluator = create_evaluator_func()
+        return ConversationFlow(session, evaluator.llm, st.session_state.language, evaluator=evaluator)
+    return ConversationFlow(session, create_llm_func(), st.session_state.language)
+
+
+def render_input_area_simple(session: ConversationSession, t_func: Callable[[str], str], create_llm_func: Callable[[], Any],
+                             create_evaluator_func: Optional[Callable[[], Any]] = None):
     """
     簡化版輸入區域（單次優化流程：輸入 → 分析 → 問題 → 優化 → 重新開始）
 
@@ -536,6 +564,7 @@ def render_input_area_simple(session: ConversationSession, t_func: Callable[[str
         session: 對話會話
         t_func: 翻譯函數
         create_llm_func: 創建 LLM 實例的函數
+        create_evaluator_func: 可選，取得共用 PromptEvaluator 的函數
     """
     # 檢查是否有待處理的優化操作
     if st.session_state.get('trigger_optimization'):
@@ -546,8 +575,7 @@ def render_input_area_simple(session: ConversationSession, t_func: Callable[[str
         try:
             if responses:
                 with st.spinner(t_func("processing")):
-                    llm = create_llm_func()
-                    flow = ConversationFlow(session, llm, st.session_state.language)
+                    flow = _create_flow(session, create_llm_func, create_evaluator_func)
                     result = flow.handle_questions_response(responses)
 
                     optimization_result = result.get("optimization", {})
@@ -576,8 +604,7 @@ def render_input_area_simple(session: ConversationSession, t_func: Callable[[str
         st.session_state.is_processing = True
         try:
             with st.spinner(t_func("processing")):
-                llm = create_llm_func()
-                flow = ConversationFlow(session, llm, st.session_state.language)
+                flow = _create_flow(session, create_llm_func, create_evaluator_func)
                 result = flow.handle_initial_prompt(prompt_text)
 
                 analysis_result = result.get("analysis", {})
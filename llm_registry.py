@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+LLM Registry - Session-scoped reuse of LLM invokers and PromptEvaluator instances
+Hands out shared instances keyed by (provider, model, region, api-key hash)
+"""
+
+import hashlib
+import logging
+import threading
+import uuid
+from typing import Any, Dict, Optional, Tuple
+
+from llm_invoker import LLMFactory
+from prompt_eval import PromptEvaluator
+
+logger = logging.getLogger(__name__)
+
+RegistryKey = Tuple[str, Optional[str], Optional[str], Optional[str]]
+
+
+class LLMRegistry:
+    """
+    Caches LLM invokers and PromptEvaluators for one set of LLM settings.
+
+    Streamlit reruns the whole script on every widget interaction, so creating
+    a new invoker/evaluator per rerun multiplies client setup cost. The registry
+    keeps instances for the currently active settings and drops them as soon as
+    the settings (provider, model, region or API key) change.
+    """
+
+    def __init__(self):
+        """Initialize an empty registry"""
+        self._lock = threading.Lock()
+        self._active_key: Optional[RegistryKey] = None
+        self._invokers: Dict[RegistryKey, Any] = {}
+        self._evaluators: Dict[RegistryKey, PromptEvaluator] = {}
+        # Sticky key for prompt-version traffic splitting: every evaluator of
+        # this session (one per LLM setting) uses the same prompt version
+        self.session_key = uuid.uuid4().hex
+
+    @staticmethod
+    def make_key(
+        llm_type: str,
+        model: Optional[str] = None,
+        region: Optional[str] = None,
+        api_key: Optional[str] = None
+    ) -> RegistryKey:
+        """
+        Build the registry key for a set of LLM settings
+
+        The API key is hashed so the raw secret is never used as a dict key.
+
+        Args:
+            llm_type: Provider type (claude, gemini, gemini-vertex)
+            model: Model name
+            region: AWS region (Claude only)
+            api_key: API key (Gemini only)
+
+        Returns:
+            Hashable registry key
+        """
+        key_hash = hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:16] if api_key else None
+        return (llm_type.lower(), model, region, key_hash)
+
+    def _activate(self, key: RegistryKey) -> None:
+        """Drop cached instances if the settings changed (caller holds the lock)"""
+        if self._active_key is not None and key != self._active_key:
+            logger.info(f"LLM settings changed, releasing cached instances for {self._active_key[:3]}")
+            self._invokers.clear()
+            self._evaluators.clear()
+        self._active_key = key
+
+    def get_llm(
+        self,
+        llm_type: str,
+        model: Optional[str] = None,
+        region: Optional[str] = None,
+        api_key: Optional[str] = None
+    ) -> Any:
+        """
+        Get a shared LLM invoker for the given settings
+
+        Args:
+            llm_type: Provider type (claude, gemini, gemini-vertex)
+            model: Model name
+            region: AWS region (Claude only)
+            api_key: API key (Gemini only)
+
+        Returns:
+            LLM invoker instance
+        """
+        key = self.make_key(llm_type, model, region, api_key)
+        with self._lock:
+            self._activate(key)
+            llm = self._invokers.get(key)
+            if llm is None:
+                llm = LLMFactory.create_llm(llm_type, **self._build_kwargs(llm_type, model, region, api_key))
+                self._invokers[key] = llm
+            return llm
+
+    def get_evaluator(
+        self,
+        llm_type: str,
+        model: Optional[str] = None,
+        region: Optional[str] = None,
+        api_key: Optional[str] = None
+    ) -> PromptEvaluator:
+        """
+        Get a shared PromptEvaluator bound to the invoker for the given settings
+
+        Args:
+            llm_type: Provider type (claude, gemini, gemini-vertex)
+            model: Model name
+            region: AWS region (Claude only)
+            api_key: API key (Gemini only)
+
+        Returns:
+            PromptEvaluator instance
+        """
+        llm = self.get_llm(llm_type, model, region, api_key)
+        key = self.make_key(llm_type, model, region, api_key)
+        with self._lock:
+            evaluator = self._evaluators.get(key)
+            if evaluator is None or evaluator.llm is not llm:
+                evaluator = PromptEvaluator(llm_instance=llm, session_key=self.session_key)
+                self._evaluators[key] = evaluator
+            return evaluator
+
+    def invalidate(self) -> None:
+        """Release all cached instances"""
+        with self._lock:
+            self._invokers.clear()
+            self._evaluators.clear()
+            self._active_key = None
+
+    @staticmethod
+    def _build_kwargs(
+        llm_type: str,
+        model: Optional[str],
+        region: Optional[str],
+        api_key: Optional[str]
+    ) -> Dict[str, Any]:
+        """Map registry settings to LLMFactory.create_llm keyword arguments"""
+        llm_type = llm_type.lower()
+        if llm_type == "claude":
+            return {"region": region} if region else {}
+
+        kwargs = {"model": model} if model else {}
+        if llm_type == "gemini" and api_key:
+            kwargs["api_key"] = api_key
+        return kwargs
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+Prompt Analytics - Vectorized statistics over the prompt library's analysis scores
+Loads the library's typed score columns into a pandas frame once per library
+revision and derives score distributions, weighted composite scores
+(evaluation_dimensions), per-language / per-tag trends and before/after
+optimization deltas without per-row Python loops
+"""
+
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+SCORE_FIELDS = ("completeness_score", "clarity_score", "structure_score", "specificity_score")
+
+# Scores are integers on this scale (evaluation_dimensions[].range)
+SCORE_RANGE = (1, 10)
+
+# Trend period (pandas period alias)
+TREND_FREQ = "M"
+
+# Tags shown in the per-tag trend (most used first)
+TOP_TAGS = 8
+
+
+@dataclass(frozen=True)
+class AnalyticsReport:
+    """Derived statistics for one library revision"""
+    revision: int
+    frame: pd.DataFrame            # one row per prompt: scores, composite, language, period
+    distributions: pd.DataFrame    # index: score 1..10, columns: dimensions + composite, values: counts
+    by_language: pd.DataFrame      # index: language, columns: mean scores + count
+    language_trends: pd.DataFrame  # index: period, columns: language, values: mean composite
+    by_tag: pd.DataFrame           # index: tag, columns: mean scores + count
+    tag_trends: pd.DataFrame       # index: period, columns: top tags, values: mean composite
+    deltas: pd.DataFrame           # one row per (before, after) pair: score differences
+    delta_summary: pd.DataFrame    # index: dimensions + composite, columns: mean / median / improved
+
+
+def dimension_weights(dimensions: Optional[Sequence[Dict[str, Any]]]) -> pd.Series:
+    """
+    Normalized composite weights per score column
+
+    Args:
+        dimensions: evaluation_dimensions from prompts.yaml ({"name", "weight", ...});
+                    equal weights when missing
+
+    Returns:
+        Series indexed by score column (e.g. "clarity_score"), summing to 1
+    """
+    weights = pd.Series(0.0, index=list(SCORE_FIELDS))
+    for dimension in dimensions or []:
+        column = f"{dimension.get('name')}_score"
+        if column in weights.index:
+            weights[column] = float(dimension.get("weight") or 0)
+    if weights.sum() <= 0:
+        weights[:] = 1.0
+    return weights / weights.sum()
+
+
+def build_frame(data: Dict[str, Dict[str, List]], weights: pd.Series, freq: str = TREND_FREQ) -> pd.DataFrame:
+    """
+    Columnar frame from a storage backend's get_analytics_data()
+
+    Adds "composite" (weighted mean of the dimensions present) and "period"
+    (creation period for trends).
+    """
+    frame = pd.DataFrame(data["prompts"])
+    for column in SCORE_FIELDS:
+        frame[column] = pd.to_numeric(frame[column], errors="coerce").astype("float64")
+    frame["composite"] = composite_scores(frame, weights)
+    created = pd.to_datetime(frame["created_at"], errors="coerce", format="ISO8601")
+    frame["period"] = created.dt.to_period(freq)
+    return frame
+
+
+def composite_scores(frame: pd.DataFrame, weights: pd.Series) -> pd.Series:
+    """Weighted mean of the available dimension scores (NaN when a prompt has none)"""
+    scores = frame[list(weights.index)]
+    present = scores.notna()
+    weighted = scores.fillna(0.0).mul(weights, axis=1).sum(axis=1)
+    total_weight = present.mul(weights, axis=1).sum(axis=1)
+    return weighted / total_weight.where(total_weight > 0)
+
+
+def score_distributions(frame: pd.DataFrame) -> pd.DataFrame:
+    """Histogram of each dimension (and the rounded composite) over SCORE_RANGE"""
+    columns = list(SCORE_FIELDS) + ["composite"]
+    low, high = SCORE_RANGE
+    scores = frame[columns].round().clip(low, high)
+    counts = scores.melt(var_name="dimension", value_name="score").dropna()
+    table = pd.crosstab(counts["score"].astype(int), counts["dimension"])
+    return table.reindex(index=range(low, high + 1), columns=columns, fill_value=0)
+
+
+def group_summary(frame: pd.DataFrame, key: str) -> pd.DataFrame:
+    """Mean of every score and the prompt count per group"""
+    columns = list(SCORE_FIELDS) + ["composite"]
+    grouped = frame.groupby(key, dropna=True)
+    summary = grouped[columns].mean()
+    summary["count"] = grouped.size()
+    return summary.sort_values("count", ascending=False)
+
+
+def trend(frame: pd.DataFrame, key: str, keys: Optional[Sequence] = None) -> pd.DataFrame:
+    """Mean composite per period (rows) and group (columns)"""
+    if keys is not None:
+        frame = frame[frame[key].isin(keys)]
+    table = frame.pivot_table(index="period", columns=key, values="composite", aggfunc="mean", observed=True)
+    return table.sort_index()
+
+
+def tag_frame(frame: pd.DataFrame, tags: Dict[str, List]) -> pd.DataFrame:
+    """One row per (prompt, tag)"""
+    pairs = pd.DataFrame(tags, columns=["prompt_id", "tag"])
+    return pairs.merge(frame, left_on="prompt_id", right_on="id", how="inner")
+
+
+def optimization_deltas(frame: pd.DataFrame) -> pd.DataFrame:
+    """
+    Score changes caused by optimization
+
+    A prompt's analysis_scores describe its original text. When its optimized
+    text was later analyzed again (it is the original of another saved prompt,
+    matched by content hash), the pair gives a before/after measurement.
+
+    Returns:
+        One row per pair: before_id, after_id and "<dimension>" / "composite" differences
+    """
+    columns = list(SCORE_FIELDS) + ["composite"]
+    before = frame[["id", "optimized_hash"] + columns]
+    after = frame[["id", "original_hash"] + columns]
+    pairs = before.merge(after, left_on="optimized_hash", right_on="original_hash", suffixes=("_before", "_after"))
+    pairs = pairs[pairs["id_before"] != pairs["id_after"]]
+
+    deltas = pd.DataFrame({"before_id": pairs["id_before"].to_numpy(), "after_id": pairs["id_after"].to_numpy()})
+    for column in columns:
+        deltas[column] = pairs[f"{column}_after"].to_numpy() - pairs[f"{column}_before"].to_numpy()
+    return deltas
+
+
+def delta_summary(deltas: pd.DataFrame) -> pd.DataFrame:
+    """Mean / median change and share of pairs that improved, per dimension"""
+    columns = list(SCORE_FIELDS) + ["composite"]
+    values = deltas[columns]
+    return pd.DataFrame({
+        "mean": values.mean(),
+        "median": values.median(),
+        "improved": (values > 0).sum() / values.notna().sum().replace(0, np.nan),
+        "pairs": values.notna().sum(),
+    })
+
+
+def build_report(data: Dict[str, Dict[str, List]], weights: pd.Series, revision: int,
+                 freq: str = TREND_FREQ, top_tags: int = TOP_TAGS) -> AnalyticsReport:
+    """Compute every statistic from get_analytics_data() output"""
+    frame = build_frame(data, weights, freq)
+    tagged = tag_frame(frame, data["tags"])
+    by_tag = group_summary(tagged, "tag")
+    deltas = optimization_deltas(frame)
+    return AnalyticsReport(
+        revision=revision,
+        frame=frame,
+        distributions=score_distributions(frame),
+        by_language=group_summary(frame, "language"),
+        language_trends=trend(frame, "language"),
+        by_tag=by_tag,
+        tag_trends=trend(tagged, "tag", by_tag.index[:top_tags]),
+        deltas=deltas,
+        delta_summary=delta_summary(deltas),
+    )
+
+
+class LibraryAnalytics:
+    """
+    Cached analytics for one storage backend
+
+    The report is rebuilt only when the backend's library revision (or the
+    dimension weights) change, so reruns of the analytics page are free.
+    """
+
+    def __init__(self, storage, dimensions: Optional[Sequence[Dict[str, Any]]] = None):
+        """
+        Args:
+            storage: PromptDatabase or LocalStoragePromptDB
+            dimensions: evaluation_dimensions from prompts.yaml
+        """
+        self.storage = storage
+        self.weights = dimension_weights(dimensions)
+        self._cached: Optional[Tuple[Tuple, AnalyticsReport]] = None
+
+    def set_dimensions(self, dimensions: Optional[Sequence[Dict[str, Any]]]) -> None:
+        """Update the composite weights (e.g. after prompts.yaml was reloaded)"""
+        self.weights = dimension_weights(dimensions)
+
+    def report(self, freq: str = TREND_FREQ) -> AnalyticsReport:
+        """Current report, recomputed only if the library changed"""
+        revision = self.storage.get_library_revision()
+        key = (revision, freq, tuple(self.weights.round(6)))
+        if self._cached is None or self._cached[0] != key:
+            report = build_report(self.storage.get_analytics_data(), self.weights, revision, freq)
+            self._cached = (key, report)
+        return self._cached[1]
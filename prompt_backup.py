@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+"""
+Prompt Backup - Scheduled online backups of the SQLite prompt library
+Copies the live database with SQLite's online backup API a few pages at a
+time on a background thread, verifies the copy, gzip-compresses it and keeps
+the newest snapshots; the last result is persisted so the schedule and the
+status survive restarts
+"""
+
+import glob
+import gzip
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from dataclasses import asdict, dataclass, fields
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Pages copied per backup step; the source is only read-locked during a step
+PAGES_PER_STEP = 256
+
+# Pause between steps, so other connections get the database in between
+STEP_PAUSE = 0.005
+
+# Snapshots kept per database (oldest are deleted first)
+KEEP = 7
+
+# Delay before the first backup after start-up (the app is busy loading then)
+STARTUP_DELAY = 60.0
+
+# A failed backup is retried after this long (or the interval, if shorter)
+RETRY_SECONDS = 30 * 60
+
+# Prompt bodies are already zlib blobs: level 1 is ~3x faster than 6 for ~5% more bytes
+GZIP_LEVEL = 1
+COPY_BUFFER = 1024 * 1024
+
+
+class BackupError(Exception):
+    """Raised when a snapshot cannot be created or fails verification"""
+
+
+@dataclass
+class BackupStatus:
+    """Outcome of the most recent backups of one database"""
+    last_success_at: Optional[str] = None   # ISO timestamp
+    last_attempt_at: Optional[str] = None
+    last_error: Optional[str] = None        # None when the last attempt succeeded
+    last_file: Optional[str] = None         # newest snapshot
+    last_size: Optional[int] = None         # compressed bytes
+    last_pages: Optional[int] = None        # database pages copied
+    last_duration: Optional[float] = None   # seconds
+    running: bool = False
+    next_due_at: Optional[str] = None
+
+
+def copy_database(source_path: str, target_path: str, pages_per_step: int = PAGES_PER_STEP,
+                  step_pause: float = STEP_PAUSE) -> int:
+    """
+    Online copy of a live database into a standalone file
+
+    The source connection holds one read transaction for the whole copy. In
+    WAL mode that pins a consistent snapshot while other connections keep
+    committing; without it every commit between two steps makes SQLite
+    restart the copy, and a busy library would never finish.
+
+    Returns:
+        Number of pages copied
+    """
+    source = sqlite3.connect(source_path, timeout=30, isolation_level=None)
+    target = sqlite3.connect(target_path)
+    total = 0
+    try:
+        source.execute("BEGIN")
+        source.execute("SELECT count(*) FROM sqlite_master").fetchone()
+
+        def pause(status, remaining, pages):
+            nonlocal total
+            total = pages
+            if remaining:
+                time.sleep(step_pause)
+
+        source.backup(target, pages=pages_per_step, progress=pause)
+        # The page copy carries the source's WAL flag; snapshots must not need a -wal file
+        target.execute("PRAGMA journal_mode = DELETE")
+    finally:
+        target.close()
+        source.rollback()
+        source.close()
+    return total
+
+
+def verify_database(path: str) -> None:
+    """Raise BackupError unless PRAGMA integrity_check reports ok"""
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        problems = [row[0] for row in conn.execute("PRAGMA integrity_check")]
+    except sqlite3.DatabaseError as e:
+        raise BackupError(f"integrity check failed: {e}") from e
+    finally:
+        conn.close()
+    if problems != ["ok"]:
+        raise BackupError(f"integrity check failed: {'; '.join(problems[:5])}")
+
+
+def compress_file(source_path: str, target_path: str, level: int = GZIP_LEVEL) -> None:
+    with open(source_path, "rb") as source, gzip.open(target_path, "wb", compresslevel=level) as target:
+        shutil.copyfileobj(source, target, COPY_BUFFER)
+
+
+def snapshot_pattern(backup_dir: str, db_path: str) -> str:
+    stem = os.path.splitext(os.path.basename(db_path))[0]
+    return os.path.join(backup_dir, f"{stem}-*.db.gz")
+
+
+def list_snapshots(backup_dir: str, db_path: str) -> List[str]:
+    """Snapshot files of a database, newest first (names sort by timestamp)"""
+    return sorted(glob.glob(snapshot_pattern(backup_dir, db_path)), reverse=True)
+
+
+def rotate(backup_dir: str, db_path: str, keep: int = KEEP) -> List[str]:
+    """Delete all but the newest keep snapshots; returns the deleted paths"""
+    removed = list_snapshots(backup_dir, db_path)[max(keep, 1):]
+    for path in removed:
+        os.remove(path)
+    return removed
+
+
+def create_snapshot(db_path: str, backup_dir: str, pages_per_step: int = PAGES_PER_STEP,
+                    step_pause: float = STEP_PAUSE) -> Tuple[str, int]:
+    """
+    Copy, verify and compress one snapshot
+
+    The copy is verified before it is compressed, and the snapshot only gets
+    its final name once complete, so a crash never leaves a partial snapshot.
+
+    Returns:
+        (snapshot path, pages copied)
+    """
+    os.makedirs(backup_dir, exist_ok=True)
+    stem = os.path.splitext(os.path.basename(db_path))[0]
+    path = os.path.join(backup_dir, f"{stem}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.db.gz")
+    temp_db = f"{path}.tmp-db"
+    temp_gz = f"{path}.tmp"
+    try:
+        pages = copy_database(db_path, temp_db, pages_per_step, step_pause)
+        verify_database(temp_db)
+        compress_file(temp_db, temp_gz)
+        os.replace(temp_gz, path)
+    finally:
+        for leftover in (temp_db, temp_gz):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+    return path, pages
+
+
+class BackupScheduler:
+    """
+    Backs up one database every interval_hours on a daemon thread
+
+    The schedule is based on the last successful backup recorded in
+    "<backup_dir>/<db name>.backup.json", so restarting the app does not
+    trigger an extra backup.
+    """
+
+    def __init__(self, db_path: str, interval_hours: float = 24, backup_dir: str = "backups",
+                 keep: int = KEEP, pages_per_step: int = PAGES_PER_STEP, step_pause: float = STEP_PAUSE,
+                 startup_delay: float = STARTUP_DELAY):
+        self.db_path = db_path
+        self.interval = timedelta(hours=interval_hours)
+        self.backup_dir = backup_dir
+        self.keep = keep
+        self.pages_per_step = pages_per_step
+        self.step_pause = step_pause
+        self.startup_delay = startup_delay
+        stem = os.path.splitext(os.path.basename(db_path))[0]
+        self.status_path = os.path.join(backup_dir, f"{stem}.backup.json")
+        self._lock = threading.Lock()
+        self._run_lock = threading.Lock()
+        self._status = self._read_status()
+        self._wake = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _read_status(self) -> BackupStatus:
+        try:
+            with open(self.status_path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return BackupStatus()
+        known = {field.name for field in fields(BackupStatus)}
+        return BackupStatus(**{key: value for key, value in data.items() if key in known and key != "running"})
+
+    def _write_status(self) -> None:
+        os.makedirs(self.backup_dir, exist_ok=True)
+        temp = f"{self.status_path}.tmp"
+        with open(temp, "w", encoding="utf-8") as f:
+            json.dump({key: value for key, value in asdict(self._status).items() if key != "running"}, f, indent=2)
+        os.replace(temp, self.status_path)
+
+    def status(self) -> BackupStatus:
+        """Copy of the current status (safe to read from any thread)"""
+        with self._lock:
+            status = BackupStatus(**asdict(self._status))
+        status.next_due_at = self.next_due().isoformat(timespec="seconds")
+        return status
+
+    def next_due(self) -> datetime:
+        """When the next scheduled backup should run"""
+        with self._lock:
+            status = self._status
+            if status.last_error and status.last_attempt_at:
+                retry = min(self.interval, timedelta(seconds=RETRY_SECONDS))
+                return datetime.fromisoformat(status.last_attempt_at) + retry
+            if status.last_success_at:
+                return datetime.fromisoformat(status.last_success_at) + self.interval
+        return datetime.now()
+
+    def run_backup(self) -> BackupStatus:
+        """Create a snapshot now (on the calling thread) and rotate old ones"""
+        with self._run_lock:
+            started = time.monotonic()
+            with self._lock:
+                self._status.running = True
+                self._status.last_attempt_at = datetime.now().isoformat(timespec="seconds")
+            try:
+                path, pages = create_snapshot(self.db_path, self.backup_dir, self.pages_per_step, self.step_pause)
+                removed = rotate(self.backup_dir, self.db_path, self.keep)
+            except Exception as e:
+                logger.error(f"Backup of {self.db_path} failed: {e}")
+                with self._lock:
+                    self._status.last_error = str(e)
+            else:
+                duration = time.monotonic() - started
+                logger.info(f"Backed up {self.db_path} to {path} ({pages} pages, {duration:.1f}s, "
+                            f"{len(removed)} old snapshots removed)")
+                with self._lock:
+                    self._status.last_success_at = self._status.last_attempt_at
+                    self._status.last_error = None
+                    self._status.last_file = path
+                    self._status.last_size = os.path.getsize(path)
+                    self._status.last_pages = pages
+                    self._status.last_duration = round(duration, 3)
+            finally:
+                with self._lock:
+                    self._status.running = False
+                try:
+                    self._write_status()
+                except OSError as e:
+                    logger.warning(f"Could not record backup status in {self.status_path}: {e}")
+            return self.status()
+
+    def request_backup(self) -> None:
+        """Ask the background thread to back up as soon as possible"""
+        self._wake.set()
+
+    def _run(self) -> None:
+        """Scheduling loop"""
+        delay = self.startup_delay
+        while not self._stop_event.is_set():
+            wait = max((self.next_due() - datetime.now()).total_seconds(), delay)
+            delay = 0.0
+            self._wake.wait(wait)
+            if self._stop_event.is_set():
+                break
+            self._wake.clear()
+            self.run_backup()
+
+    def start(self) -> None:
+        """Start the scheduler on a daemon thread (no-op if already running)"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(
+            target=self._run, name=f"BackupScheduler({os.path.basename(self.db_path)})", daemon=True
+        )
+        self._thread.start()
+        logger.info(f"Backing up {self.db_path} to {self.backup_dir} every {self.interval}")
+
+    def stop(self) -> None:
+        """Stop the scheduler (a backup in progress finishes first)"""
+        self._stop_event.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    @property
+    def is_running(self) -> bool:
+        """Whether the scheduler thread is alive"""
+        return self._thread is not None and self._thread.is_alive()
+
+
+_schedulers: Dict[str, BackupScheduler] = {}
+_schedulers_lock = threading.Lock()
+
+
+def start_scheduler(db_path: str, interval_hours: float = 24, backup_dir: str = "backups",
+                    keep: int = KEEP) -> BackupScheduler:
+    """
+    Process-wide scheduler for a database file, started on first use
+
+    Every Streamlit session calls this with the same path; only one thread
+    backs the file up.
+    """
+    key = os.path.abspath(db_path)
+    with _schedulers_lock:
+        scheduler = _schedulers.get(key)
+        if scheduler is None:
+            scheduler = _schedulers[key] = BackupScheduler(db_path, interval_hours, backup_dir, keep)
+        scheduler.start()
+        return scheduler
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Prompt Blobs - Content-addressed, compressed storage of prompt bodies
+Bodies are keyed by the SHA-256 digest of their text, so identical bodies (re-saves,
+re-imported backups) are stored once, and compressed with zlib
+"""
+
+import hashlib
+import zlib
+from typing import Optional, Tuple
+
+# Codec ids stored next to each blob
+CODEC_RAW = 0
+CODEC_ZLIB = 1
+
+ZLIB_LEVEL = 6
+
+# Bodies shorter than this are not worth compressing
+MIN_COMPRESS_BYTES = 64
+
+BLOBS_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS prompt_blobs (
+        hash BLOB PRIMARY KEY,
+        codec INTEGER NOT NULL,
+        size INTEGER NOT NULL,
+        data BLOB NOT NULL
+    )
+"""
+
+INSERT_BLOB_SQL = "INSERT OR IGNORE INTO prompt_blobs (hash, codec, size, data) VALUES (?, ?, ?, ?)"
+
+
+def body_hash(text: str) -> bytes:
+    """Content address of a body (raw 32-byte SHA-256 digest)"""
+    return hashlib.sha256(text.encode("utf-8")).digest()
+
+
+def encode_body(text: str) -> Tuple[bytes, int, int, bytes]:
+    """
+    Encode a body for storage
+
+    Returns:
+        (hash, codec, uncompressed size in bytes, stored bytes)
+    """
+    raw = text.encode("utf-8")
+    digest = hashlib.sha256(raw).digest()
+    if len(raw) >= MIN_COMPRESS_BYTES:
+        compressed = zlib.compress(raw, ZLIB_LEVEL)
+        if len(compressed) < len(raw):
+            return digest, CODEC_ZLIB, len(raw), compressed
+    return digest, CODEC_RAW, len(raw), raw
+
+
+def inflate(codec: Optional[int], data: Optional[bytes]) -> Optional[str]:
+    """
+    Decode a stored body (registered as the SQL function prompt_inflate)
+
+    Returns:
+        Body text, or None for a missing blob
+    """
+    if data is None:
+        return None
+    if codec == CODEC_ZLIB:
+        data = zlib.decompress(data)
+    return bytes(data).decode("utf-8")
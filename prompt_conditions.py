@@ -0,0 +1,387 @@
+#!/usr/bin/env python3
+"""
+Prompt Conditions - Compiled condition DSL for dynamic questions
+Parses condition strings from prompts.yaml once into a small, safe AST
+that can be evaluated per analysis or vectorized over a batch of analyses
+"""
+
+import re
+import logging
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Union
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Missing numeric fields are treated as a perfect score, so score conditions
+# such as "completeness_score < 7" do not fire when the analysis lacks a score
+MISSING_SCORE = 10.0
+
+# Columnar batch: field name -> sequence (list, tuple or numpy array) of values
+Columns = Mapping[str, Sequence[Any]]
+
+_TOKEN_RE = re.compile(r"""
+    \s*(?:
+        (?P<number>-?\d+(?:\.\d+)?)
+      | (?P<string>'[^']*'|"[^"]*")
+      | (?P<op><=|>=|==|!=|<|>)
+      | (?P<punct>[()\[\],])
+      | (?P<name>[A-Za-z_][A-Za-z0-9_]*)
+    )""", re.VERBOSE)
+
+_KEYWORDS = {'and', 'or', 'not', 'in'}
+
+
+class ConditionError(ValueError):
+    """Raised when a condition string cannot be compiled"""
+
+
+def _tokenize(text: str) -> List[tuple]:
+    """Split a condition string into (kind, value) tokens"""
+    tokens = []
+    pos = 0
+    text = text.rstrip()
+    while pos < len(text):
+        match = _TOKEN_RE.match(text, pos)
+        if not match or match.end() == pos:
+            raise ConditionError(f"Unexpected character at position {pos}: {text[pos:pos + 10]!r}")
+        pos = match.end()
+        kind = match.lastgroup
+        value = match.group(kind)
+        if kind == 'number':
+            tokens.append(('literal', float(value)))
+        elif kind == 'string':
+            tokens.append(('literal', value[1:-1]))
+        elif kind == 'name' and value.lower() in _KEYWORDS:
+            tokens.append(('keyword', value.lower()))
+        else:
+            tokens.append((kind, value))
+    return tokens
+
+
+class ColumnCache:
+    """Converts batch columns once per field and value type during one evaluation"""
+
+    def __init__(self, columns: Columns, size: int):
+        self.columns = columns
+        self.size = size
+        self._numeric: Dict[str, np.ndarray] = {}
+        self._objects: Dict[str, np.ndarray] = {}
+
+    def _raw(self, field: str) -> Sequence[Any]:
+        values = self.columns.get(field)
+        if values is None:
+            return [None] * self.size
+        return values
+
+    def numeric(self, field: str) -> np.ndarray:
+        """Float column; missing values become MISSING_SCORE, non-numeric values NaN"""
+        if field not in self._numeric:
+            values = self._raw(field)
+            array = np.asarray(values) if isinstance(values, np.ndarray) else None
+            if array is not None and array.dtype.kind in 'iuf':
+                column = array.astype(float)
+            else:
+                column = np.fromiter((_to_number(v) for v in values), dtype=float, count=self.size)
+            self._numeric[field] = column
+        return self._numeric[field]
+
+    def objects(self, field: str) -> np.ndarray:
+        """Object column for equality / membership tests"""
+        if field not in self._objects:
+            column = np.empty(self.size, dtype=object)
+            # Element by element: slice assignment would broadcast list values
+            for i, value in enumerate(self._raw(field)):
+                column[i] = '' if value is None else value
+            self._objects[field] = column
+        return self._objects[field]
+
+
+def _to_number(value: Any) -> float:
+    """Coerce a single value for numeric comparison"""
+    if value is None:
+        return MISSING_SCORE
+    if isinstance(value, bool):
+        return float(value)
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return float('nan')
+
+
+def _text_value(analysis: Mapping[str, Any], field: str) -> Any:
+    """Value for equality / membership tests; missing values compare as ''"""
+    value = analysis.get(field)
+    return '' if value is None else value
+
+
+class Node(ABC):
+    """Base class of compiled condition nodes"""
+
+    fields: frozenset = frozenset()
+
+    @abstractmethod
+    def evaluate(self, analysis: Mapping[str, Any]) -> bool:
+        """Evaluate against one analysis dict"""
+
+    @abstractmethod
+    def evaluate_columns(self, cache: ColumnCache) -> np.ndarray:
+        """Evaluate against a batch; returns a boolean array of cache.size"""
+
+
+class Comparison(Node):
+    """field <op> literal"""
+
+    _NUMERIC_OPS = {
+        '<': np.less,
+        '<=': np.less_equal,
+        '>': np.greater,
+        '>=': np.greater_equal,
+        '==': np.equal,
+        '!=': np.not_equal,
+    }
+
+    def __init__(self, field: str, op: str, value: Union[float, str]):
+        self.field = field
+        self.op = op
+        self.value = value
+        self.numeric = isinstance(value, float)
+        self.fields = frozenset([field])
+        if not self.numeric and op not in ('==', '!='):
+            raise ConditionError(f"Operator {op} requires a numeric value, got {value!r}")
+
+    def evaluate(self, analysis: Mapping[str, Any]) -> bool:
+        if self.numeric:
+            number = _to_number(analysis.get(self.field))
+            if number != number:  # NaN: value is not numeric
+                return False
+            return bool(self._NUMERIC_OPS[self.op](number, self.value))
+        matches = _text_value(analysis, self.field) == self.value
+        return matches if self.op == '==' else not matches
+
+    def evaluate_columns(self, cache: ColumnCache) -> np.ndarray:
+        if self.numeric:
+            column = cache.numeric(self.field)
+            with np.errstate(invalid='ignore'):
+                result = self._NUMERIC_OPS[self.op](column, self.value)
+            return result & ~np.isnan(column)
+        result = cache.objects(self.field) == self.value
+        result = np.asarray(result, dtype=bool)
+        return result if self.op == '==' else ~result
+
+
+class Membership(Node):
+    """field [not] in [literal, ...]"""
+
+    def __init__(self, field: str, values: List[Union[float, str]], negate: bool = False):
+        self.field = field
+        self.values = frozenset(values)
+        self.negate = negate
+        self.fields = frozenset([field])
+
+    def evaluate(self, analysis: Mapping[str, Any]) -> bool:
+        return _safe_contains(self.values, _text_value(analysis, self.field)) != self.negate
+
+    def evaluate_columns(self, cache: ColumnCache) -> np.ndarray:
+        values = self.values
+        column = cache.objects(self.field)
+        found = np.fromiter(
+            (_safe_contains(values, v) for v in column), dtype=bool, count=cache.size
+        )
+        return ~found if self.negate else found
+
+
+def _safe_contains(values: frozenset, value: Any) -> bool:
+    try:
+        return value in values
+    except TypeError:  # unhashable value
+        return False
+
+
+class Not(Node):
+    """NOT operand"""
+
+    def __init__(self, operand: Node):
+        self.operand = operand
+        self.fields = operand.fields
+
+    def evaluate(self, analysis: Mapping[str, Any]) -> bool:
+        return not self.operand.evaluate(analysis)
+
+    def evaluate_columns(self, cache: ColumnCache) -> np.ndarray:
+        return ~self.operand.evaluate_columns(cache)
+
+
+class And(Node):
+    """operand AND operand ..."""
+
+    def __init__(self, operands: List[Node]):
+        self.operands = operands
+        self.fields = frozenset().union(*(o.fields for o in operands))
+
+    def evaluate(self, analysis: Mapping[str, Any]) -> bool:
+        return all(o.evaluate(analysis) for o in self.operands)
+
+    def evaluate_columns(self, cache: ColumnCache) -> np.ndarray:
+        result = self.operands[0].evaluate_columns(cache)
+        for operand in self.operands[1:]:
+            result = result & operand.evaluate_columns(cache)
+        return result
+
+
+class Or(Node):
+    """operand OR operand ..."""
+
+    def __init__(self, operands: List[Node]):
+        self.operands = operands
+        self.fields = frozenset().union(*(o.fields for o in operands))
+
+    def evaluate(self, analysis: Mapping[str, Any]) -> bool:
+        return any(o.evaluate(analysis) for o in self.operands)
+
+    def evaluate_columns(self, cache: ColumnCache) -> np.ndarray:
+        result = self.operands[0].evaluate_columns(cache)
+        for operand in self.operands[1:]:
+            result = result | operand.evaluate_columns(cache)
+        return result
+
+
+class Never(Node):
+    """Empty or invalid condition: never matches (the previous evaluator's behaviour)"""
+
+    def evaluate(self, analysis: Mapping[str, Any]) -> bool:
+        return False
+
+    def evaluate_columns(self, cache: ColumnCache) -> np.ndarray:
+        return np.zeros(cache.size, dtype=bool)
+
+
+class _Parser:
+    """
+    Recursive-descent parser
+
+    expr       := and_expr (OR and_expr)*
+    and_expr   := not_expr (AND not_expr)*
+    not_expr   := NOT not_expr | '(' expr ')' | comparison
+    comparison := name op literal | name [NOT] IN '[' literal (',' literal)* ']'
+    """
+
+    def __init__(self, tokens: List[tuple]):
+        self.tokens = tokens
+        self.pos = 0
+
+    def peek(self) -> Optional[tuple]:
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def take(self, kind: str, value: Optional[str] = None) -> Any:
+        token = self.peek()
+        if token is None or token[0] != kind or (value is not None and token[1] != value):
+            expected = value or kind
+            raise ConditionError(f"Expected {expected}, got {token[1] if token else 'end of condition'!r}")
+        self.pos += 1
+        return token[1]
+
+    def accept(self, kind: str, value: Optional[str] = None) -> bool:
+        token = self.peek()
+        if token is not None and token[0] == kind and (value is None or token[1] == value):
+            self.pos += 1
+            return True
+        return False
+
+    def parse(self) -> Node:
+        node = self.expr()
+        if self.peek() is not None:
+            raise ConditionError(f"Unexpected token {self.peek()[1]!r}")
+        return node
+
+    def expr(self) -> Node:
+        operands = [self.and_expr()]
+        while self.accept('keyword', 'or'):
+            operands.append(self.and_expr())
+        return operands[0] if len(operands) == 1 else Or(operands)
+
+    def and_expr(self) -> Node:
+        operands = [self.not_expr()]
+        while self.accept('keyword', 'and'):
+            operands.append(self.not_expr())
+        return operands[0] if len(operands) == 1 else And(operands)
+
+    def not_expr(self) -> Node:
+        if self.accept('keyword', 'not'):
+            return Not(self.not_expr())
+        if self.accept('punct', '('):
+            node = self.expr()
+            self.take('punct', ')')
+            return node
+        return self.comparison()
+
+    def comparison(self) -> Node:
+        field = self.take('name')
+        if self.accept('keyword', 'not'):
+            self.take('keyword', 'in')
+            return Membership(field, self.literal_list(), negate=True)
+        if self.accept('keyword', 'in'):
+            return Membership(field, self.literal_list())
+        op = self.take('op')
+        return Comparison(field, op, self.take('literal'))
+
+    def literal_list(self) -> List[Union[float, str]]:
+        self.take('punct', '[')
+        values = []
+        if not self.accept('punct', ']'):
+            values.append(self.take('literal'))
+            while self.accept('punct', ','):
+                values.append(self.take('literal'))
+            self.take('punct', ']')
+        return values
+
+
+def compile_condition(condition: str) -> Node:
+    """
+    Compile a condition string into an AST
+
+    Args:
+        condition: Condition string (e.g., "completeness_score < 7 AND clarity_score >= 5")
+
+    Returns:
+        Compiled condition node (an always-false node for empty conditions)
+
+    Raises:
+        ConditionError: If the condition is malformed
+    """
+    if not condition or not condition.strip():
+        return Never()
+    return _Parser(_tokenize(condition)).parse()
+
+
+def to_columns(analyses: Sequence[Mapping[str, Any]], fields: Sequence[str]) -> Dict[str, List[Any]]:
+    """
+    Convert a list of analysis dicts into a columnar batch
+
+    Args:
+        analyses: Analysis dicts
+        fields: Field names to extract
+
+    Returns:
+        Dict of field name -> list of values (None for missing)
+    """
+    return {field: [analysis.get(field) for analysis in analyses] for field in fields}
+
+
+def evaluate_batch(node: Node, columns: Columns, size: int, cache: Optional[ColumnCache] = None) -> np.ndarray:
+    """
+    Evaluate a compiled condition over a columnar batch
+
+    Args:
+        node: Compiled condition
+        columns: Field name -> sequence of values
+        size: Number of rows in the batch
+        cache: Optional column cache shared between several conditions
+
+    Returns:
+        Boolean numpy array, one entry per row
+    """
+    if cache is None:
+        cache = ColumnCache(columns, size)
+    return np.asarray(node.evaluate_columns(cache), dtype=bool)
@@ -6,24 +6,357 @@
 
 import sqlite3
 import json
+import logging
 import uuid
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime
-from typing import List, Dict, Optional
+from typing import BinaryIO, Callable, Iterable, Iterator, List, Dict, Optional, Union
 import os
 
+import numpy as np
+
+from prompt_blobs import BLOBS_SCHEMA, INSERT_BLOB_SQL, body_hash, encode_body, inflate
+from prompt_dedup import (
+    DEFAULT_THRESHOLD as DUPLICATE_THRESHOLD, POLICY_FLAG, POLICY_MERGE, LSHIndex, band_keys, best_match,
+    merge_tags, pack_signature, signatures, unpack_signatures, validate_policy
+)
+from prompt_export import iter_export
+from prompt_history import (
+    KIND_FINAL, KIND_ORIGINAL, decode_version, diff_text, encode_history, pack_delta, unpack_delta
+)
+from prompt_import import (
+    BATCH_SIZE as IMPORT_BATCH_SIZE, ImportFormatError, iter_validated_batches, validate_record
+)
+from prompt_similarity import index_text, shared_index
+
+# FTS5 trigram 以 3 個字元為單位建立索引，較短的查詢無法使用 MATCH
+FTS_MIN_QUERY_LENGTH = 3
+
+# 欄位權重：名稱命中優先於內文命中
+FTS_BM25_WEIGHTS = (5.0, 1.0, 1.0)
+
+# 較短的查詢改以 fts5vocab 找出以查詢開頭的 trigram；超過此數量（常見字元）時
+# 退回 LIKE 掃描，此時符合的提示詞很多，依更新時間掃描很快就能取滿一頁
+FTS_SHORT_QUERY_MAX_TERMS = 500
+
+def _body(hash_column: str) -> str:
+    """由 prompt_blobs 讀出並解壓內文的子查詢（只在實際選取時才解壓）"""
+    return f"(SELECT prompt_inflate(b.codec, b.data) FROM prompt_blobs b WHERE b.hash = {hash_column})"
+
+
+# 完整提示詞的欄位（順序與 _row_to_prompt 對應）
+PROMPT_COLUMNS = (
+    f"p.id, p.name, {_body('p.original_hash')}, {_body('p.optimized_hash')}, "
+    "p.analysis_scores, p.tags, p.language, p.created_at"
+)
+
+# 分析分數欄位：另存為 REAL 欄位供分數篩選與統計使用（分數篩選取有值欄位的平均）
+SCORE_FIELDS = ("completeness_score", "clarity_score", "structure_score", "specificity_score")
+
+# prompts 表實際儲存的欄位（寫入用，搭配具名參數）
+ROW_COLUMNS = (
+    "id, name, original_hash, optimized_hash, original_preview, optimized_preview, "
+    "analysis_scores, tags, language, created_at, updated_at, " + ", ".join(SCORE_FIELDS)
+)
+ROW_PARAMS = ", ".join(f":{column}" for column in ROW_COLUMNS.split(", "))
+
+# 引用 prompt_blobs 的欄位；內文不再被任何欄位引用時才會刪除
+BLOB_REFERENCES = (
+    ("prompts", "original_hash"),
+    ("prompts", "optimized_hash"),
+    ("prompt_versions", "body_hash"),
+)
+
+def _fts_body(hash_column: str) -> str:
+    """
+    索引用的內文：結尾補兩個換行，使內文中每一處 1～2 字元的子字串
+    都是某個 trigram 的開頭（短查詢由此在索引中找到，見 search_prompts）
+    """
+    return f"({_body(hash_column)} || char(10, 10))"
+
+
+# FTS 的 external content：內文由 prompt_blobs 解壓後提供
+FTS_CONTENT_VIEW = f"""
+    CREATE VIEW IF NOT EXISTS prompts_fts_content AS
+    SELECT p.rowid AS prompt_rowid, p.name,
+           {_fts_body('p.original_hash')} AS original_prompt,
+           {_fts_body('p.optimized_hash')} AS optimized_prompt
+    FROM prompts p
+"""
+
+# 保持 prompts_fts 與 prompts 同步的觸發器（內文須在寫入 prompts 前存入
+# prompt_blobs，並在刪除觸發器讀取後才回收）
+FTS_TRIGGERS = (
+    f"""
+    CREATE TRIGGER IF NOT EXISTS prompts_fts_ai AFTER INSERT ON prompts BEGIN
+        INSERT INTO prompts_fts(rowid, name, original_prompt, optimized_prompt)
+        VALUES (new.rowid, new.name, {_fts_body('new.original_hash')}, {_fts_body('new.optimized_hash')});
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS prompts_fts_ad AFTER DELETE ON prompts BEGIN
+        INSERT INTO prompts_fts(prompts_fts, rowid, name, original_prompt, optimized_prompt)
+        VALUES ('delete', old.rowid, old.name, {_fts_body('old.original_hash')}, {_fts_body('old.optimized_hash')});
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS prompts_fts_au AFTER UPDATE OF name, original_hash, optimized_hash ON prompts BEGIN
+        INSERT INTO prompts_fts(prompts_fts, rowid, name, original_prompt, optimized_prompt)
+        VALUES ('delete', old.rowid, old.name, {_fts_body('old.original_hash')}, {_fts_body('old.optimized_hash')});
+        INSERT INTO prompts_fts(rowid, name, original_prompt, optimized_prompt)
+        VALUES (new.rowid, new.name, {_fts_body('new.original_hash')}, {_fts_body('new.optimized_hash')});
+    END
+    """,
+)
+
+# 列表檢視（include_bodies=False）中內文預覽的字數
+PREVIEW_CHARS = 100
+
+# 正規化標籤：prompts.tags（JSON 陣列）仍為寫入來源，由觸發器同步到
+# tags / prompt_tags；tags.prompt_count 由 prompt_tags 的觸發器維護
+_VALID_NEW_TAGS = "SELECT DISTINCT value FROM json_each(CASE WHEN json_valid(new.tags) THEN new.tags END) WHERE type = 'text'"
+# 觸發器內不使用 INSERT OR IGNORE：外層陳述式（如 UPSERT）的衝突處理會覆蓋它
+_INSERT_NEW_TAGS = f"INSERT INTO tags(name) SELECT value FROM ({_VALID_NEW_TAGS}) WHERE value NOT IN (SELECT name FROM tags)"
+_LINK_NEW_TAGS = f"""INSERT INTO prompt_tags(prompt_id, tag_id)
+        SELECT new.id, tags.id FROM tags WHERE tags.name IN ({_VALID_NEW_TAGS})
+        AND NOT EXISTS (SELECT 1 FROM prompt_tags pt WHERE pt.prompt_id = new.id AND pt.tag_id = tags.id)"""
+TAG_TRIGGERS = (
+    """
+    CREATE TRIGGER IF NOT EXISTS prompt_tags_count_ai AFTER INSERT ON prompt_tags BEGIN
+        UPDATE tags SET prompt_count = prompt_count + 1 WHERE id = new.tag_id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS prompt_tags_count_ad AFTER DELETE ON prompt_tags BEGIN
+        UPDATE tags SET prompt_count = prompt_count - 1 WHERE id = old.tag_id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS prompts_tags_ai AFTER INSERT ON prompts BEGIN
+        {_INSERT_NEW_TAGS};
+        {_LINK_NEW_TAGS};
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS prompts_tags_ad AFTER DELETE ON prompts BEGIN
+        DELETE FROM prompt_tags WHERE prompt_id = old.id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS prompts_tags_au AFTER UPDATE OF tags ON prompts BEGIN
+        DELETE FROM prompt_tags WHERE prompt_id = old.id
+            AND tag_id NOT IN (SELECT tags.id FROM tags WHERE tags.name IN ({_VALID_NEW_TAGS}));
+        {_INSERT_NEW_TAGS};
+        {_LINK_NEW_TAGS};
+    END
+    """,
+)
+
+# 版本歷史跟隨提示詞：刪除提示詞或其內文被覆蓋（如覆蓋匯入）時一併移除
+VERSION_TRIGGERS = (
+    """
+    CREATE TRIGGER IF NOT EXISTS prompts_versions_ad AFTER DELETE ON prompts BEGIN
+        DELETE FROM prompt_versions WHERE prompt_id = old.id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS prompts_versions_au AFTER UPDATE OF original_hash, optimized_hash ON prompts
+    WHEN old.original_hash IS NOT new.original_hash OR old.optimized_hash IS NOT new.optimized_hash BEGIN
+        DELETE FROM prompt_versions WHERE prompt_id = old.id;
+    END
+    """,
+)
+
+# 近似重複偵測的指紋（MinHash 簽章與 LSH 分桶）跟隨提示詞：刪除或優化內文被覆蓋時一併移除
+_DELETE_FINGERPRINT = """
+        DELETE FROM prompt_lsh WHERE fid IN (SELECT fid FROM prompt_fingerprints WHERE prompt_id = old.id);
+        DELETE FROM prompt_fingerprints WHERE prompt_id = old.id;
+"""
+DUPLICATE_TRIGGERS = (
+    f"""
+    CREATE TRIGGER IF NOT EXISTS prompts_fingerprints_ad AFTER DELETE ON prompts BEGIN
+        {_DELETE_FINGERPRINT}
+        UPDATE prompt_fingerprints SET duplicate_of = NULL WHERE duplicate_of = old.id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS prompts_fingerprints_au AFTER UPDATE OF optimized_hash ON prompts
+    WHEN old.optimized_hash IS NOT new.optimized_hash BEGIN
+        {_DELETE_FINGERPRINT}
+    END
+    """,
+)
+
+# 變更記錄（CDC）：每個提示詞在 prompt_changes 保留最後一次變更，seq 依變更順序
+# 遞增且不重複使用（AUTOINCREMENT）；刪除留下 tombstone（deleted = 1）。
+# origin 為 NULL 表示本機變更，同步套用的變更記錄來源副本，不會再被推送。
+# changed_at 為 UTC 時間戳（含時區），供不同時區副本間的 last-writer-wins 比較；
+# updated_at 為本機時間，僅供顯示
+CHANGE_STAMP_SQL = "strftime('%Y-%m-%dT%H:%M:%f+00:00', 'now')"
+_RECORD_CHANGE = f"""
+        DELETE FROM prompt_changes WHERE prompt_id = {{row}}.id;
+        INSERT INTO prompt_changes (prompt_id, deleted, updated_at, changed_at)
+        VALUES ({{row}}.id, {{deleted}}, {{updated_at}}, {CHANGE_STAMP_SQL});
+"""
+CHANGE_TRIGGERS = (
+    f"""
+    CREATE TRIGGER IF NOT EXISTS prompts_changes_ai AFTER INSERT ON prompts BEGIN
+        {_RECORD_CHANGE.format(row='new', deleted=0, updated_at='new.updated_at')}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS prompts_changes_au AFTER UPDATE ON prompts BEGIN
+        {_RECORD_CHANGE.format(row='new', deleted=0, updated_at='new.updated_at')}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS prompts_changes_ad AFTER DELETE ON prompts BEGIN
+        {_RECORD_CHANGE.format(row='old', deleted=1, updated_at="strftime('%Y-%m-%dT%H:%M:%f', 'now', 'localtime')")}
+    END
+    """,
+)
+
+# IN (...) 查詢（LSH 分桶、內文雜湊、ID）每次的參數數量上限
+IN_QUERY_CHUNK = 500
+
+# 建立既有提示詞指紋時每批讀取的筆數
+FINGERPRINT_BATCH = 1000
+
+# get_changes() 預設每次回傳的變更筆數
+CHANGE_BATCH = 500
+
+# 結構遷移（依序套用，PRAGMA user_version 記錄已套用的數量）
+MIGRATIONS = (
+    "_migrate_normalized_tags",
+    "_migrate_blob_storage",
+    "_migrate_version_history",
+    "_migrate_score_columns",
+    "_migrate_library_revision",
+    "_migrate_duplicate_index",
+    "_migrate_change_log",
+    "_migrate_change_stamps",
+    "_migrate_fts_body_end",
+)
+
+
+def score_columns(analysis_scores: Optional[Dict]) -> Dict[str, Optional[float]]:
+    """由分析結果取出 SCORE_FIELDS 的數值（非數值或缺少時為 None）"""
+    scores = analysis_scores if isinstance(analysis_scores, dict) else {}
+    values = {}
+    for field in SCORE_FIELDS:
+        value = scores.get(field)
+        is_number = isinstance(value, (int, float)) and not isinstance(value, bool)
+        values[field] = float(value) if is_number else None
+    return values
+
+
+# 連線調校參數（每個連線套用）
+BUSY_TIMEOUT_MS = 5000           # 寫入鎖競爭時等待，而非立即拋出 "database is locked"
+CACHE_SIZE_KB = 16 * 1024        # page cache 16 MB（負值代表 KiB）
+MMAP_SIZE = 256 * 1024 * 1024    # 256 MB memory-mapped I/O
+JOURNAL_SIZE_LIMIT = 64 * 1024 * 1024  # checkpoint 後將 -wal 截短至 64 MB（大量匯入或 VACUUM 後不長期佔用空間）
+
+# 儲存空間維護（由 prompt_maintenance 於背景執行緒呼叫 maintain()）
+AUTO_VACUUM_MODES = ("none", "full", "incremental")
+AUTO_VACUUM_INCREMENTAL = 2
+ANALYSIS_LIMIT = 1000            # ANALYZE 每個索引取樣的列數上限（近似統計，大型詞庫也只需數十毫秒）
+VACUUM_STEP_PAGES = 256          # 每個 incremental_vacuum 交易回收的頁數，寫入鎖只持有很短的時間
+VACUUM_STEP_PAUSE = 0.01         # 兩次回收之間的間隔（秒），讓其他連線的寫入先執行
+VACUUM_MAX_PAGES = 16384         # 每次維護最多回收的頁數（page_size 4 KB 時為 64 MB）
+VACUUM_MIN_FREE_RATIO = 0.05     # 空閒頁比例低於此值時不回收，留給之後的寫入重用
+
+
 class PromptDatabase:
     """提示詞資料庫管理類"""
     
-    def __init__(self, db_path: str = "prompts.db"):
-        """初始化資料庫連接"""
+    def __init__(self, db_path: str = "prompts.db", cache_size_kb: int = CACHE_SIZE_KB,
+                 mmap_size: int = MMAP_SIZE, duplicate_policy: str = POLICY_FLAG,
+                 duplicate_threshold: float = DUPLICATE_THRESHOLD):
+        """
+        初始化資料庫連接
+
+        Args:
+            db_path: SQLite 檔案路徑
+            cache_size_kb: 每個連線的 page cache 大小（KiB）
+            mmap_size: 每個連線的 mmap 大小（bytes，0 表示停用）
+            duplicate_policy: 保存 / 匯入重複提示詞時的處理方式
+                              （"flag" 標記、"merge" 併入既有提示詞、"skip" 略過）
+            duplicate_threshold: 視為近似重複的估計相似度（0~1）
+        """
         self.db_path = db_path
+        self.cache_size_kb = cache_size_kb
+        self.mmap_size = mmap_size
+        self.duplicate_policy = validate_policy(duplicate_policy)
+        self.duplicate_threshold = duplicate_threshold
+        # 每個執行緒（Streamlit session 的 script thread）各自持有一個連線
+        self._local = threading.local()
         self.init_database()
+        # 「相似提示」向量索引（檔案與資料庫同目錄，同一路徑的各 session 共用）
+        self._similarity = shared_index(f"{db_path}.similarity")
+    
+    def _connect(self) -> sqlite3.Connection:
+        """建立新連線並套用效能相關 PRAGMA"""
+        conn = sqlite3.connect(self.db_path, timeout=BUSY_TIMEOUT_MS / 1000)
+        conn.execute(f"PRAGMA busy_timeout = {int(BUSY_TIMEOUT_MS)}")
+        # WAL 模式下 NORMAL 仍可保證一致性，只在斷電時可能遺失最後一筆交易
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute(f"PRAGMA cache_size = {-int(self.cache_size_kb)}")
+        conn.execute(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        conn.execute(f"PRAGMA journal_size_limit = {int(JOURNAL_SIZE_LIMIT)}")
+        # 內文以壓縮 blob 保存，查詢、檢視與 FTS 觸發器透過此函式解壓
+        conn.create_function("prompt_inflate", 2, inflate, deterministic=True)
+        return conn
+    
+    def _get_connection(self) -> sqlite3.Connection:
+        """取得目前執行緒的連線（首次使用時建立）"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+        return conn
+    
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Cursor]:
+        """在目前執行緒的連線上開啟交易，成功時 commit、例外時 rollback"""
+        conn = self._get_connection()
+        cursor = conn.cursor()
+        try:
+            yield cursor
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+    
+    def _query(self, sql: str, params=()) -> List[tuple]:
+        """執行唯讀查詢並回傳所有列"""
+        cursor = self._get_connection().execute(sql, params)
+        try:
+            return cursor.fetchall()
+        finally:
+            cursor.close()
+    
+    def close(self):
+        """關閉目前執行緒的連線"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
     
     def init_database(self):
         """初始化資料庫表結構"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._get_connection()
+        # 只對尚未建表的新資料庫生效；既有資料庫由 maintain() 以一次 VACUUM 轉換
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        # WAL 為持久設定：讀取不會被寫入（如大量匯入）阻塞
+        conn.execute("PRAGMA journal_mode = WAL")
         cursor = conn.cursor()
         
+        # 初始（版本 0）結構，之後的變更由 MIGRATIONS 套用
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS prompts (
                 id TEXT PRIMARY KEY,
@@ -38,88 +371,549 @@ class PromptDatabase:
             )
         """)
         
+        # 列表 / 分頁依 (updated_at, id) 排序；語言篩選使用複合索引
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_prompts_updated ON prompts(updated_at, id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_prompts_language_updated ON prompts(language, updated_at, id)")
+        
         conn.commit()
-        conn.close()
+        cursor.close()
+        
+        self._migrate()
+        self.fts_enabled = self._init_fts()
     
-    def save_prompt(self, name: str, original_prompt: str, optimized_prompt: str, 
-                   analysis_scores: Dict = None, tags: List[str] = None, 
-                   language: str = "zh_TW") -> str:
-        """保存提示詞"""
-        prompt_id = str(uuid.uuid4())
-        now = datetime.now().isoformat()
+    def _migrate(self):
+        """依 PRAGMA user_version 套用尚未執行的結構遷移（每步一個交易）"""
+        conn = self._get_connection()
+        for version, migration in enumerate(MIGRATIONS, start=1):
+            if conn.execute("PRAGMA user_version").fetchone()[0] >= version:
+                continue
+            # IMMEDIATE 取得寫入鎖後再確認一次，避免多個程序重複遷移
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                if conn.execute("PRAGMA user_version").fetchone()[0] < version:
+                    getattr(self, migration)(conn)
+                    conn.execute(f"PRAGMA user_version = {version}")
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+    
+    def _migrate_normalized_tags(self, conn: sqlite3.Connection):
+        """建立 tags / prompt_tags 並由既有的 JSON 標籤欄位回填"""
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS tags (
+                id INTEGER PRIMARY KEY,
+                name TEXT NOT NULL UNIQUE,
+                prompt_count INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS prompt_tags (
+                prompt_id TEXT NOT NULL,
+                tag_id INTEGER NOT NULL,
+                PRIMARY KEY (prompt_id, tag_id)
+            ) WITHOUT ROWID
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_prompt_tags_tag ON prompt_tags(tag_id, prompt_id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_tags_count ON tags(prompt_count DESC, name)")
         
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        # 先建立計數觸發器，回填時 prompt_count 會一併算好
+        for statement in TAG_TRIGGERS[:2]:
+            conn.execute(statement)
+        valid_tags = "json_each(CASE WHEN json_valid(p.tags) THEN p.tags END) AS j"
+        conn.execute(f"""
+            INSERT OR IGNORE INTO tags(name)
+            SELECT DISTINCT j.value FROM prompts p, {valid_tags} WHERE j.type = 'text'
+        """)
+        conn.execute(f"""
+            INSERT OR IGNORE INTO prompt_tags(prompt_id, tag_id)
+            SELECT p.id, tags.id FROM prompts p, {valid_tags}
+            JOIN tags ON tags.name = j.value
+            WHERE j.type = 'text'
+        """)
+        for statement in TAG_TRIGGERS[2:]:
+            conn.execute(statement)
+    
+    def _migrate_blob_storage(self, conn: sqlite3.Connection):
+        """
+        將內文移到以內容雜湊為鍵、zlib 壓縮的 prompt_blobs
+
+        prompts 改存 original_hash / optimized_hash 與列表用的預覽，重建時保留
+        rowid；舊的 FTS 索引（直接讀 prompts 的內文欄位）一併移除，
+        由 _init_fts 以新結構重建。
+        """
+        conn.execute(BLOBS_SCHEMA)
+        for trigger in ("prompts_fts_ai", "prompts_fts_ad", "prompts_fts_au"):
+            conn.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+        conn.execute("DROP TABLE IF EXISTS prompts_fts")
         
-        cursor.execute("""
-            INSERT INTO prompts 
-            (id, name, original_prompt, optimized_prompt, analysis_scores, tags, language, created_at, updated_at)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
-            prompt_id,
-            name,
-            original_prompt,
-            optimized_prompt,
-            json.dumps(analysis_scores) if analysis_scores else None,
-            json.dumps(tags) if tags else None,
-            language,
-            now,
-            now
-        ))
+        conn.execute("""
+            CREATE TABLE prompts_blobbed (
+                id TEXT PRIMARY KEY,
+                name TEXT NOT NULL,
+                original_hash BLOB NOT NULL,
+                optimized_hash BLOB NOT NULL,
+                original_preview TEXT NOT NULL,
+                optimized_preview TEXT NOT NULL,
+                analysis_scores TEXT,
+                tags TEXT,
+                language TEXT DEFAULT 'zh_TW',
+                created_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL
+            )
+        """)
+        source = conn.execute("""
+            SELECT rowid, id, name, original_prompt, optimized_prompt, analysis_scores, tags, language,
+                   created_at, updated_at
+            FROM prompts
+        """)
+        columns = ("rowid", "id", "name", "original_prompt", "optimized_prompt", "analysis_scores", "tags",
+                   "language", "created_at", "updated_at")
+        cursor = conn.cursor()
+        while True:
+            rows = source.fetchmany(500)
+            if not rows:
+                break
+            records = [dict(zip(columns, row)) for row in rows]
+            self._store_bodies(cursor, records)
+            cursor.executemany("""
+                INSERT INTO prompts_blobbed
+                (rowid, id, name, original_hash, optimized_hash, original_preview, optimized_preview,
+                 analysis_scores, tags, language, created_at, updated_at)
+                VALUES (:rowid, :id, :name, :original_hash, :optimized_hash, :original_preview, :optimized_preview,
+                        :analysis_scores, :tags, :language, :created_at, :updated_at)
+            """, records)
+        cursor.close()
         
-        conn.commit()
-        conn.close()
+        # DROP TABLE 不觸發刪除觸發器，prompt_tags 保持不變；prompts 上的索引與觸發器需重建
+        conn.execute("DROP TABLE prompts")
+        conn.execute("ALTER TABLE prompts_blobbed RENAME TO prompts")
+        conn.execute("CREATE INDEX idx_prompts_updated ON prompts(updated_at, id)")
+        conn.execute("CREATE INDEX idx_prompts_language_updated ON prompts(language, updated_at, id)")
+        conn.execute("CREATE INDEX idx_prompts_original_hash ON prompts(original_hash)")
+        conn.execute("CREATE INDEX idx_prompts_optimized_hash ON prompts(optimized_hash)")
+        for statement in TAG_TRIGGERS[2:]:
+            conn.execute(statement)
+    
+    def _migrate_version_history(self, conn: sqlite3.Connection):
+        """
+        建立 prompt_versions（原始 → 各次迭代 → 最終版本）
+
+        每個版本存 body_hash（完整內容，存於 prompt_blobs）或 delta（相對前一版
+        的差異）其中之一；既有提示詞沒有版本列，讀取時視為「原始 → 最終」兩版。
+        """
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS prompt_versions (
+                prompt_id TEXT NOT NULL,
+                version INTEGER NOT NULL,
+                kind TEXT NOT NULL,
+                body_hash BLOB,
+                delta BLOB,
+                size INTEGER NOT NULL,
+                PRIMARY KEY (prompt_id, version)
+            ) WITHOUT ROWID
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_prompt_versions_hash ON prompt_versions(body_hash)")
+        for statement in VERSION_TRIGGERS:
+            conn.execute(statement)
+    
+    def _migrate_score_columns(self, conn: sqlite3.Connection):
+        """新增 SCORE_FIELDS 的 REAL 欄位並由 analysis_scores JSON 回填"""
+        for field in SCORE_FIELDS:
+            conn.execute(f"ALTER TABLE prompts ADD COLUMN {field} REAL")
+        assignments = ", ".join(
+            f"{field} = CASE WHEN json_type(analysis_scores, '$.{field}') IN ('integer', 'real') "
+            f"THEN json_extract(analysis_scores, '$.{field}') END"
+            for field in SCORE_FIELDS
+        )
+        conn.execute(f"UPDATE prompts SET {assignments} WHERE json_valid(analysis_scores)")
+    
+    def _migrate_library_revision(self, conn: sqlite3.Connection):
+        """建立提示詞庫修訂號（任何新增 / 修改 / 刪除都會遞增，供快取判斷是否過期）"""
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS library_revision (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                revision INTEGER NOT NULL
+            )
+        """)
+        conn.execute("INSERT OR IGNORE INTO library_revision (id, revision) VALUES (1, 0)")
+        for event in ("INSERT", "UPDATE", "DELETE"):
+            conn.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS prompts_revision_{event.lower()} AFTER {event} ON prompts BEGIN
+                    UPDATE library_revision SET revision = revision + 1 WHERE id = 1;
+                END
+            """)
+    
+    def _migrate_duplicate_index(self, conn: sqlite3.Connection):
+        """建立近似重複偵測的指紋表與 LSH 分桶，並為既有提示詞建立指紋（不回溯標記既有的重複）"""
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS prompt_fingerprints (
+                fid INTEGER PRIMARY KEY,
+                prompt_id TEXT NOT NULL UNIQUE,
+                signature BLOB NOT NULL,
+                duplicate_of TEXT
+            )
+        """)
+        conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_prompt_fingerprints_duplicate
+            ON prompt_fingerprints(duplicate_of) WHERE duplicate_of IS NOT NULL
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS prompt_lsh (
+                bucket INTEGER NOT NULL,
+                fid INTEGER NOT NULL,
+                PRIMARY KEY (bucket, fid)
+            ) WITHOUT ROWID
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_prompt_lsh_fid ON prompt_lsh(fid)")
+        for statement in DUPLICATE_TRIGGERS:
+            conn.execute(statement)
         
-        return prompt_id
+        cursor = conn.execute(f"SELECT p.id, {_body('p.optimized_hash')} FROM prompts p")
+        writer = conn.cursor()
+        while True:
+            rows = cursor.fetchmany(FINGERPRINT_BATCH)
+            if not rows:
+                break
+            ids, texts = zip(*rows)
+            self._store_fingerprints(writer, ids, *signatures(texts))
+        writer.close()
     
-    def load_prompts(self, limit: int = 50) -> List[Dict]:
-        """載入所有保存的提示詞"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+    def _migrate_change_log(self, conn: sqlite3.Connection):
+        """建立變更記錄與同步狀態表；既有提示詞依更新時間記為本機變更（首次同步時推送）"""
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS prompt_changes (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                prompt_id TEXT NOT NULL UNIQUE,
+                deleted INTEGER NOT NULL DEFAULT 0,
+                updated_at TEXT NOT NULL,
+                origin TEXT
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS sync_state (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            )
+        """)
+        conn.execute("""
+            INSERT INTO prompt_changes (prompt_id, deleted, updated_at)
+            SELECT id, 0, updated_at FROM prompts ORDER BY updated_at, id
+        """)
+        for statement in CHANGE_TRIGGERS:
+            conn.execute(statement)
+
+    def _migrate_change_stamps(self, conn: sqlite3.Connection):
+        """變更記錄加上 UTC 時間戳 changed_at；既有記錄由 updated_at 視為本機時間換算"""
+        conn.execute("ALTER TABLE prompt_changes ADD COLUMN changed_at TEXT NOT NULL DEFAULT ''")
+        conn.execute("""
+            UPDATE prompt_changes
+            SET changed_at = COALESCE(strftime('%Y-%m-%dT%H:%M:%f+00:00', updated_at, 'utc'), '')
+        """)
+        for trigger in ("prompts_changes_ai", "prompts_changes_au", "prompts_changes_ad"):
+            conn.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+        for statement in CHANGE_TRIGGERS:
+            conn.execute(statement)
+    
+    def _migrate_fts_body_end(self, conn: sqlite3.Connection):
+        """移除舊的 FTS 索引（內文未補結尾換行），由 _init_fts 以新內容重建"""
+        for trigger in ("prompts_fts_ai", "prompts_fts_ad", "prompts_fts_au"):
+            conn.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+        conn.execute("DROP TABLE IF EXISTS prompts_fts")
+        conn.execute("DROP VIEW IF EXISTS prompts_fts_content")
+    
+    def _init_fts(self) -> bool:
+        """
+        建立 FTS5 全文索引（trigram 分詞，適用於無詞界的中日文內容）
+
+        prompts_fts 為 external-content 表，僅保存索引，內容讀自
+        prompts_fts_content 檢視（由 prompt_blobs 解壓）；由觸發器保持同步。
+        首次建立時會以既有資料重建索引。
+
+        Returns:
+            FTS5 / trigram 是否可用（不可用時搜尋退回 LIKE 掃描）
+        """
+        if self._query("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'prompts_fts'"):
+            return True
         
-        cursor.execute("""
-            SELECT id, name, original_prompt, optimized_prompt, analysis_scores, tags, language, created_at
-            FROM prompts
-            ORDER BY updated_at DESC
-            LIMIT ?
-        """, (limit,))
+        try:
+            with self._transaction() as cursor:
+                cursor.execute(FTS_CONTENT_VIEW)
+                cursor.execute("""
+                    CREATE VIRTUAL TABLE prompts_fts USING fts5(
+                        name, original_prompt, optimized_prompt,
+                        content='prompts_fts_content', content_rowid='prompt_rowid', tokenize='trigram'
+                    )
+                """)
+                for statement in FTS_TRIGGERS:
+                    cursor.execute(statement)
+                cursor.execute("INSERT INTO prompts_fts(prompts_fts) VALUES ('rebuild')")
+        except sqlite3.OperationalError as e:
+            # SQLite < 3.34 或未編入 FTS5
+            logging.warning(f"FTS5 trigram search unavailable, falling back to LIKE: {e}")
+            return False
+        return True
+    
+    def save_prompt(self, name: str, original_prompt: str, optimized_prompt: str, 
+                   analysis_scores: Dict = None, tags: List[str] = None, 
+                   language: str = "zh_TW", history: Optional[List[str]] = None,
+                   duplicate_policy: Optional[str] = None) -> str:
+        """
+        保存提示詞
+
+        優化後內容與既有提示詞完全相同或近似重複（見 find_duplicate）時，
+        依 duplicate_policy 處理：flag 照常保存並標記、merge 將標籤併入既有
+        提示詞、skip 不做任何變更；後兩者回傳既有提示詞的 ID。
+
+        Args:
+            history: 最終版本之前的各版本內容（最初的 prompt 在前，如
+                     原始 → 各次「再次優化」的輸入）；提供時一併保存版本歷史
+            duplicate_policy: 覆寫建構時設定的重複處理方式
+        """
+        policy = validate_policy(duplicate_policy or self.duplicate_policy)
+        prompt_id = str(uuid.uuid4())
+        now = datetime.now().isoformat()
+        signature_rows, present = signatures([optimized_prompt])
         
-        rows = cursor.fetchall()
-        conn.close()
+        record = {
+            'id': prompt_id,
+            'name': name,
+            'original_prompt': original_prompt,
+            'optimized_prompt': optimized_prompt,
+            'analysis_scores': json.dumps(analysis_scores) if analysis_scores else None,
+            'tags': json.dumps(tags) if tags else None,
+            'language': language,
+            'created_at': now,
+            'updated_at': now,
+            **score_columns(analysis_scores)
+        }
         
-        prompts = []
-        for row in rows:
-            prompt = {
-                'id': row[0],
-                'name': row[1],
-                'original_prompt': row[2],
-                'optimized_prompt': row[3],
-                'analysis_scores': json.loads(row[4]) if row[4] else {},
-                'tags': json.loads(row[5]) if row[5] else [],
-                'language': row[6],
-                'created_at': row[7]
-            }
-            prompts.append(prompt)
+        with self._transaction() as cursor:
+            duplicate = self._match_duplicates(cursor, [optimized_prompt], signature_rows, present)[0]
+            if duplicate is None or policy == POLICY_FLAG:
+                self._store_bodies(cursor, [record])
+                cursor.execute(f"""
+                    INSERT INTO prompts ({ROW_COLUMNS})
+                    VALUES ({ROW_PARAMS})
+                """, record)
+                if history:
+                    self._store_versions(cursor, prompt_id, list(history) + [optimized_prompt])
+                self._store_fingerprints(cursor, [prompt_id], signature_rows, present,
+                                         [duplicate['id'] if duplicate else None])
+                added, changes = [(prompt_id, index_text(name, original_prompt))], 1
+            else:
+                prompt_id = duplicate['id']
+                added = []
+                changes = self._merge_tags(cursor, {prompt_id: tags or []}, now) if policy == POLICY_MERGE else 0
+            revision = self._revision(cursor)
         
-        return prompts
+        if changes:
+            self._similarity.update(added, [], revision, changes)
+        return prompt_id
     
-    def load_prompt_by_id(self, prompt_id: str) -> Optional[Dict]:
-        """根據ID載入特定提示詞"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+    def find_duplicate(self, optimized_prompt: str, exclude_id: Optional[str] = None) -> Optional[Dict]:
+        """
+        找出與優化後內容重複的已保存提示詞
+
+        先比對完全相同的優化內容（內文雜湊），再以 MinHash-LSH 找出共用
+        分桶的候選，估計相似度達 duplicate_threshold 者視為近似重複。
+
+        Returns:
+            {'id', 'name', 'similarity'（估計的 Jaccard 相似度）, 'exact'}，沒有重複時為 None
+        """
+        signature_rows, present = signatures([optimized_prompt])
+        cursor = self._get_connection().cursor()
+        try:
+            return self._match_duplicates(cursor, [optimized_prompt], signature_rows, present, [exclude_id])[0]
+        finally:
+            cursor.close()
+    
+    def _match_duplicates(self, cursor: sqlite3.Cursor, texts: List[str], signature_rows, present,
+                          exclude_ids: Optional[List[Optional[str]]] = None) -> List[Optional[Dict]]:
+        """
+        每筆優化內容在資料庫中的重複（完全相同者優先，其次為 LSH 候選中估計相似度最高者）
+
+        Returns:
+            與 texts 對應的列表，元素為 find_duplicate 的結果格式或 None
+        """
+        exclude_ids = exclude_ids or [None] * len(texts)
+        matches: List[Optional[Dict]] = [None] * len(texts)
+        digests = [body_hash(text) for text in texts]
+        same_body: Dict[bytes, List[tuple]] = {}
+        for chunk in self._chunks(sorted(set(digests))):
+            for digest, prompt_id, name in cursor.execute(f"""
+                SELECT optimized_hash, id, name FROM prompts
+                WHERE optimized_hash IN ({", ".join("?" * len(chunk))})
+                ORDER BY created_at
+            """, chunk):
+                same_body.setdefault(digest, []).append((prompt_id, name))
+        for i, (digest, exclude_id) in enumerate(zip(digests, exclude_ids)):
+            for prompt_id, name in same_body.get(digest, ()):
+                if prompt_id != exclude_id:
+                    matches[i] = {'id': prompt_id, 'name': name, 'similarity': 1.0, 'exact': True}
+                    break
         
-        cursor.execute("""
-            SELECT id, name, original_prompt, optimized_prompt, analysis_scores, tags, language, created_at
-            FROM prompts
-            WHERE id = ?
-        """, (prompt_id,))
+        # 沒有任何 shingle 的短內容只比對完全相同
+        pending = [i for i, match in enumerate(matches) if match is None and present[i]]
+        if not pending:
+            return matches
+        keys = band_keys(signature_rows[pending])
+        pairs = []
+        for chunk in self._chunks(sorted(set(keys.ravel().tolist()))):
+            pairs.extend(cursor.execute(
+                f"SELECT bucket, fid FROM prompt_lsh WHERE bucket IN ({', '.join('?' * len(chunk))})", chunk
+            ))
+        if not pairs:
+            return matches
         
-        row = cursor.fetchone()
-        conn.close()
+        # 每個候選只讀一次簽章；分桶依 bucket 排序，以 searchsorted 取出各筆的候選列
+        pairs = np.array(pairs, dtype=np.int64)
+        order = np.argsort(pairs[:, 0], kind="stable")
+        sorted_buckets = pairs[order, 0]
+        fids, candidate_of_pair = np.unique(pairs[:, 1], return_inverse=True)
+        sorted_candidates = candidate_of_pair[order]
+        stored = {}
+        for chunk in self._chunks(fids.tolist()):
+            for fid, prompt_id, signature in cursor.execute(f"""
+                SELECT fid, prompt_id, signature FROM prompt_fingerprints
+                WHERE fid IN ({", ".join("?" * len(chunk))})
+            """, chunk):
+                stored[fid] = (prompt_id, signature)
+        candidate_ids = [stored[fid][0] for fid in fids.tolist()]
+        candidate_rows = unpack_signatures([stored[fid][1] for fid in fids.tolist()])
+        exclude_set = set(exclude_ids)
+        excluded = {prompt_id: row for row, prompt_id in enumerate(candidate_ids) if prompt_id in exclude_set}
         
-        if not row:
-            return None
+        starts = np.searchsorted(sorted_buckets, keys, side="left")
+        ends = np.searchsorted(sorted_buckets, keys, side="right")
+        found = {}
+        for i, row_starts, row_ends in zip(pending, starts, ends):
+            candidates = np.concatenate([sorted_candidates[a:b] for a, b in zip(row_starts, row_ends)])
+            if exclude_ids[i] in excluded:
+                candidates = candidates[candidates != excluded[exclude_ids[i]]]
+            match = best_match(signature_rows[i], candidate_rows[candidates], self.duplicate_threshold)
+            if match:
+                found[i] = (candidate_ids[candidates[match[0]]], match[1])
+        if found:
+            match_ids = sorted({match_id for match_id, _ in found.values()})
+            names = dict(cursor.execute(
+                f"SELECT id, name FROM prompts WHERE id IN ({', '.join('?' * len(match_ids))})", match_ids
+            ).fetchall())
+            for i, (match_id, similarity) in found.items():
+                if match_id in names:
+                    matches[i] = {'id': match_id, 'name': names[match_id], 'similarity': similarity, 'exact': False}
+        return matches
+    
+    @staticmethod
+    def _chunks(values: List) -> Iterator[List]:
+        """切成 IN (...) 查詢可用的參數批次"""
+        for start in range(0, len(values), IN_QUERY_CHUNK):
+            yield values[start:start + IN_QUERY_CHUNK]
+    
+    @staticmethod
+    def _store_fingerprints(cursor: sqlite3.Cursor, prompt_ids: Iterable[str], signature_rows, present,
+                            duplicate_of: Optional[Iterable[Optional[str]]] = None):
+        """寫入提示詞的 MinHash 簽章與 LSH 分桶（已有指紋的提示詞不變）"""
+        prompt_ids = list(prompt_ids)
+        duplicate_of = list(duplicate_of) if duplicate_of is not None else [None] * len(prompt_ids)
+        cursor.executemany(
+            "INSERT OR IGNORE INTO prompt_fingerprints (prompt_id, signature, duplicate_of) VALUES (?, ?, ?)",
+            zip(prompt_ids, map(pack_signature, signature_rows), duplicate_of)
+        )
+        keys = band_keys(signature_rows).tolist()
+        cursor.executemany(
+            "INSERT OR IGNORE INTO prompt_lsh (bucket, fid) SELECT ?, fid FROM prompt_fingerprints WHERE prompt_id = ?",
+            ((bucket, prompt_id)
+             for prompt_id, row_keys, has_shingles in zip(prompt_ids, keys, present) if has_shingles
+             for bucket in row_keys)
+        )
+    
+    @staticmethod
+    def _merge_tags(cursor: sqlite3.Cursor, incoming: Dict[str, List[str]], now: str) -> int:
+        """
+        將標籤併入既有提示詞（重複提示詞的 merge 處理）
+
+        Returns:
+            實際變更的提示詞數
+        """
+        changed = 0
+        for prompt_id, tags in incoming.items():
+            row = cursor.execute("SELECT tags FROM prompts WHERE id = ?", (prompt_id,)).fetchone()
+            if row is None:
+                continue
+            existing = json.loads(row[0]) if row[0] else []
+            merged = merge_tags(existing, tags)
+            if merged != existing:
+                cursor.execute("UPDATE prompts SET tags = ?, updated_at = ? WHERE id = ?",
+                               (json.dumps(merged), now, prompt_id))
+                changed += 1
+        return changed
+    
+    @staticmethod
+    def _store_versions(cursor: sqlite3.Cursor, prompt_id: str, texts: List[str]):
+        """以差異編碼寫入版本歷史（完整版本存入 prompt_blobs，可與其他提示詞共用）"""
+        def stored_size(value) -> int:
+            return len(encode_body(value)[3]) if isinstance(value, str) else len(pack_delta(value))
         
+        rows = []
+        for entry in encode_history(texts, size_of=stored_size):
+            if "text" in entry:
+                blob = encode_body(entry["text"])
+                cursor.execute(INSERT_BLOB_SQL, blob)
+                rows.append((prompt_id, entry["version"], entry["kind"], blob[0], None, entry["size"]))
+            else:
+                rows.append((prompt_id, entry["version"], entry["kind"], None, pack_delta(entry["delta"]), entry["size"]))
+        cursor.executemany("""
+            INSERT INTO prompt_versions (prompt_id, version, kind, body_hash, delta, size)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, rows)
+    
+    @staticmethod
+    def _store_bodies(cursor: sqlite3.Cursor, records: List[Dict]):
+        """
+        將內文寫入 prompt_blobs（相同內文只存一份），並在每筆記錄加上
+        original_hash / optimized_hash / original_preview / optimized_preview
+        """
+        blobs = {}
+        for record in records:
+            for field in ('original', 'optimized'):
+                text = record[f'{field}_prompt']
+                digest, codec, size, data = encode_body(text)
+                blobs[digest] = (digest, codec, size, data)
+                record[f'{field}_hash'] = digest
+                record[f'{field}_preview'] = text[:PREVIEW_CHARS]
+        cursor.executemany(INSERT_BLOB_SQL, blobs.values())
+    
+    @staticmethod
+    def _body_hashes(cursor: sqlite3.Cursor, id_filter: str, params=()) -> List[bytes]:
+        """
+        指定提示詞（prompts 及 prompt_versions）引用的所有內文雜湊
+
+        Args:
+            id_filter: 提示詞 ID 的 IN 條件內容（如 "?" 或子查詢）
+        """
+        rows = cursor.execute(f"""
+            SELECT original_hash FROM prompts WHERE id IN ({id_filter})
+            UNION SELECT optimized_hash FROM prompts WHERE id IN ({id_filter})
+            UNION SELECT body_hash FROM prompt_versions WHERE prompt_id IN ({id_filter}) AND body_hash IS NOT NULL
+        """, tuple(params) * 3).fetchall()
+        return [row[0] for row in rows]
+    
+    @staticmethod
+    def _collect_blobs(cursor: sqlite3.Cursor, hashes: Iterable[bytes]):
+        """刪除已不被 BLOB_REFERENCES 任何欄位引用的內文"""
+        unreferenced = " AND ".join(
+            f"NOT EXISTS (SELECT 1 FROM {table} WHERE {column} = prompt_blobs.hash)"
+            for table, column in BLOB_REFERENCES
+        )
+        cursor.executemany(
+            f"DELETE FROM prompt_blobs WHERE hash = ? AND {unreferenced}",
+            ((digest,) for digest in set(hashes))
+        )
+    
+    @staticmethod
+    def _row_to_prompt(row: tuple) -> Dict:
+        """將 SELECT 結果列轉為提示詞字典"""
         return {
             'id': row[0],
             'name': row[1],
@@ -131,97 +925,668 @@ class PromptDatabase:
             'created_at': row[7]
         }
     
+    def load_prompts(self, limit: int = 50) -> List[Dict]:
+        """載入所有保存的提示詞"""
+        rows = self._query(f"""
+            SELECT {PROMPT_COLUMNS}
+            FROM prompts p
+            ORDER BY p.updated_at DESC
+            LIMIT ?
+        """, (limit,))
+        
+        return [self._row_to_prompt(row) for row in rows]
+    
+    def load_prompt_by_id(self, prompt_id: str) -> Optional[Dict]:
+        """根據ID載入特定提示詞"""
+        rows = self._query(f"""
+            SELECT {PROMPT_COLUMNS}
+            FROM prompts p
+            WHERE p.id = ?
+        """, (prompt_id,))
+        
+        if not rows:
+            return None
+        
+        return self._row_to_prompt(rows[0])
+    
     def delete_prompt(self, prompt_id: str) -> bool:
         """刪除提示詞"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        with self._transaction() as cursor:
+            removed = [
+                (prompt_id, index_text(name, original))
+                for name, original in cursor.execute(
+                    f"SELECT p.name, {_body('p.original_hash')} FROM prompts p WHERE p.id = ?", (prompt_id,)
+                ).fetchall()
+            ]
+            deleted = self._delete_rows(cursor, [prompt_id]) > 0
+            revision = self._revision(cursor)
         
-        cursor.execute("DELETE FROM prompts WHERE id = ?", (prompt_id,))
-        deleted = cursor.rowcount > 0
+        if deleted:
+            self._similarity.update([], removed, revision)
+        return deleted
+    
+    def _delete_rows(self, cursor: sqlite3.Cursor, prompt_ids: List[str]) -> int:
+        """刪除提示詞並回收不再被引用的內文；回傳刪除筆數"""
+        deleted = 0
+        for chunk in self._chunks(prompt_ids):
+            placeholders = ", ".join("?" * len(chunk))
+            hashes = self._body_hashes(cursor, placeholders, chunk)
+            cursor.execute(f"DELETE FROM prompts WHERE id IN ({placeholders})", chunk)
+            deleted += cursor.rowcount
+            # 在 FTS 刪除觸發器讀取內文之後才回收
+            self._collect_blobs(cursor, hashes)
+        return deleted
+    
+    def get_prompt_versions(self, prompt_id: str) -> List[Dict]:
+        """
+        列出提示詞的版本歷史（不讀取內文）
+
+        Returns:
+            [{'version': int, 'kind': 'original' / 'iteration' / 'final', 'size': bytes}, ...]，
+            由舊到新；沒有保存歷史的提示詞回傳「原始 → 最終」兩版，不存在時回傳空列表
+        """
+        rows = self._query("""
+            SELECT version, kind, size FROM prompt_versions WHERE prompt_id = ? ORDER BY version
+        """, (prompt_id,))
+        if not rows:
+            rows = self._query("""
+                SELECT 1, ?, o.size FROM prompts p JOIN prompt_blobs o ON o.hash = p.original_hash WHERE p.id = ?
+                UNION ALL
+                SELECT 2, ?, f.size FROM prompts p JOIN prompt_blobs f ON f.hash = p.optimized_hash WHERE p.id = ?
+            """, (KIND_ORIGINAL, prompt_id, KIND_FINAL, prompt_id))
+        return [{'version': version, 'kind': kind, 'size': size} for version, kind, size in rows]
+    
+    def load_prompt_version(self, prompt_id: str, version: int) -> Optional[str]:
+        """
+        讀取提示詞某個版本的內容
+
+        只讀取最近一個完整版本到目標版本之間的列，依序套用差異。
+
+        Returns:
+            版本內容，不存在時回傳 None
+        """
+        rows = self._query(f"""
+            SELECT v.version, {_body('v.body_hash')}, v.delta
+            FROM prompt_versions v
+            WHERE v.prompt_id = ? AND v.version <= ? AND v.version >= (
+                SELECT MAX(version) FROM prompt_versions
+                WHERE prompt_id = ? AND version <= ? AND body_hash IS NOT NULL
+            )
+            ORDER BY v.version
+        """, (prompt_id, version, prompt_id, version))
+        if rows:
+            entries = [
+                {'version': number, 'text': text} if delta is None else {'version': number, 'delta': unpack_delta(delta)}
+                for number, text, delta in rows
+            ]
+            return decode_version(entries, version)
         
-        conn.commit()
-        conn.close()
+        if self._query("SELECT 1 FROM prompt_versions WHERE prompt_id = ? LIMIT 1", (prompt_id,)):
+            return None
+        # 沒有保存歷史：版本 1 為原始內容，版本 2 為優化後內容
+        if version not in (1, 2):
+            return None
+        column = 'p.original_hash' if version == 1 else 'p.optimized_hash'
+        rows = self._query(f"SELECT {_body(column)} FROM prompts p WHERE p.id = ?", (prompt_id,))
+        return rows[0][0] if rows else None
+    
+    def diff_prompt_versions(self, prompt_id: str, from_version: int, to_version: int) -> Optional[str]:
+        """
+        比較提示詞的兩個版本
+
+        Returns:
+            unified diff 文字（內容相同時為空字串），任一版本不存在時回傳 None
+        """
+        old = self.load_prompt_version(prompt_id, from_version)
+        new = self.load_prompt_version(prompt_id, to_version)
+        if old is None or new is None:
+            return None
+        return diff_text(old, new, f"v{from_version}", f"v{to_version}")
+    
+    def search_prompts(self, query: str, language: str = None,
+                       limit: Optional[int] = None, offset: int = 0) -> List[Dict]:
+        """
+        搜索提示詞（名稱、原始及優化後內容的子字串比對）
+
+        查詢長度 >= 3 時使用 FTS5 索引並以 BM25 排序；較短的查詢依更新時間
+        排序，只解壓索引中含以查詢開頭之 trigram 的提示詞來確認內文（查詢為
+        常見字元或 FTS5 不可用時退回 LIKE 掃描）。
+
+        Args:
+            query: 搜尋字串
+            language: 僅回傳此語言的提示詞
+            limit: 每頁筆數（None 表示全部）
+            offset: 略過的筆數（分頁用）
+        """
+        language_filter = " AND p.language = ?" if language else ""
+        page = " LIMIT ? OFFSET ?" if limit is not None else ""
         
-        return deleted
+        short_terms = None
+        if self.fts_enabled and len(query) < FTS_MIN_QUERY_LENGTH:
+            short_terms = self._fts_terms_starting_with(query)
+        
+        if self.fts_enabled and len(query) >= FTS_MIN_QUERY_LENGTH:
+            # 整個查詢視為一個片語，語意等同原本的 LIKE '%query%'；
+            # 先在子查詢中排序分頁，只解壓該頁的內文
+            sql = f"""
+                SELECT {PROMPT_COLUMNS}
+                FROM (
+                    SELECT p.rowid AS prompt_rowid, bm25(prompts_fts, %s, %s, %s) AS score, p.updated_at
+                    FROM prompts_fts
+                    JOIN prompts p ON p.rowid = prompts_fts.rowid
+                    WHERE prompts_fts MATCH ?{language_filter}
+                    ORDER BY score, p.updated_at DESC{page}
+                ) AS hit
+                JOIN prompts p ON p.rowid = hit.prompt_rowid
+                ORDER BY hit.score, hit.updated_at DESC
+            """ % FTS_BM25_WEIGHTS
+            params = ['"' + query.replace('"', '""') + '"']
+        elif short_terms is not None:
+            # 名稱直接比對；內文只需確認索引挑出的候選（LIKE 與索引的大小寫規則不同）
+            body_match = f"""
+                OR (p.rowid IN (SELECT rowid FROM prompts_fts WHERE prompts_fts MATCH ?)
+                    AND ({_body('p.original_hash')} LIKE ? OR {_body('p.optimized_hash')} LIKE ?))
+            """ if short_terms else ""
+            sql = f"""
+                SELECT {PROMPT_COLUMNS}
+                FROM prompts p
+                WHERE (p.name LIKE ? {body_match})
+                {language_filter}
+                ORDER BY p.updated_at DESC{page}
+            """
+            params = [f"%{query}%"]
+            if short_terms:
+                match = " OR ".join('"' + term.replace('"', '""') + '"' for term in short_terms)
+                params += [match, f"%{query}%", f"%{query}%"]
+        else:
+            # 依更新時間索引掃描，取滿一頁即停止（逐列解壓內文比對）
+            sql = f"""
+                SELECT {PROMPT_COLUMNS}
+                FROM prompts p
+                WHERE (p.name LIKE ? OR {_body('p.original_hash')} LIKE ? OR {_body('p.optimized_hash')} LIKE ?)
+                {language_filter}
+                ORDER BY p.updated_at DESC{page}
+            """
+            params = [f"%{query}%", f"%{query}%", f"%{query}%"]
+        
+        if language:
+            params.append(language)
+        if limit is not None:
+            params.extend([limit, offset])
+        
+        return [self._row_to_prompt(row) for row in self._query(sql, params)]
     
-    def search_prompts(self, query: str, language: str = None) -> List[Dict]:
-        """搜索提示詞"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+    def _fts_terms_starting_with(self, query: str) -> Optional[List[str]]:
+        """
+        FTS 索引中以 query 開頭的 trigram（查詢短於 3 個字元時使用）
+
+        Returns:
+            trigram 清單；查詢為空或 trigram 超過 FTS_SHORT_QUERY_MAX_TERMS 個時為 None
+        """
+        if not query:
+            return None
+        self._get_connection().execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS temp.prompts_fts_vocab USING fts5vocab('main', 'prompts_fts', 'row')"
+        )
+        prefix = query.lower()
+        rows = self._query(
+            "SELECT term FROM temp.prompts_fts_vocab WHERE term >= ? AND term < ? LIMIT ?",
+            (prefix, prefix + "\U0010ffff", FTS_SHORT_QUERY_MAX_TERMS + 1)
+        )
+        if len(rows) > FTS_SHORT_QUERY_MAX_TERMS:
+            return None
+        return [row[0] for row in rows]
+    
+    def query_prompts(self, limit: int = 20, cursor: Optional[str] = None,
+                      language: Optional[str] = None, tag: Optional[str] = None,
+                      updated_from: Optional[str] = None, updated_to: Optional[str] = None,
+                      min_score: Optional[float] = None, max_score: Optional[float] = None,
+                      include_bodies: bool = False) -> Dict:
+        """
+        以 keyset 分頁查詢提示詞（依更新時間新到舊）
+
+        與 OFFSET 不同，每一頁都從索引上的游標位置開始讀取，翻到後面的頁面
+        不會變慢，翻頁期間新增的資料也不會造成重複或遺漏。
+
+        Args:
+            limit: 每頁筆數
+            cursor: 上一頁回傳的 next_cursor（None 表示第一頁）
+            language: 僅回傳此語言
+            tag: 僅回傳含此標籤者
+            updated_from: 更新時間下限（ISO 格式，含）
+            updated_to: 更新時間上限（ISO 格式，含；只給日期時涵蓋當天）
+            min_score: 平均分數下限（SCORE_FIELDS 中有值欄位的平均）
+            max_score: 平均分數上限
+            include_bodies: 是否回傳完整內文；False 時只回傳
+                            original_preview / optimized_preview
+
+        Returns:
+            {'prompts': [...], 'next_cursor': str 或 None（已無下一頁）}；
+            每筆含 'duplicate_of'（保存時判定為重複的既有提示詞 ID，否則為 None）
+        """
+        if include_bodies:
+            body_columns = f"{_body('p.original_hash')}, {_body('p.optimized_hash')}"
+        else:
+            # 列表檢視只讀預覽欄位，不觸及 prompt_blobs
+            body_columns = "p.original_preview, p.optimized_preview"
         
-        sql = """
-            SELECT id, name, original_prompt, optimized_prompt, analysis_scores, tags, language, created_at
-            FROM prompts
-            WHERE (name LIKE ? OR original_prompt LIKE ? OR optimized_prompt LIKE ?)
+        sql = f"""
+            SELECT p.id, p.name, {body_columns}, p.analysis_scores, p.tags, p.language, p.created_at, p.updated_at,
+                   f.duplicate_of
+            FROM prompts p
+            LEFT JOIN prompt_fingerprints f ON f.prompt_id = p.id
+            WHERE 1 = 1
         """
-        params = [f"%{query}%", f"%{query}%", f"%{query}%"]
+        params: list = []
         
         if language:
-            sql += " AND language = ?"
+            sql += " AND p.language = ?"
             params.append(language)
+        if updated_from:
+            sql += " AND p.updated_at >= ?"
+            params.append(updated_from)
+        if updated_to:
+            # '2024-05-01' 應涵蓋當天所有時間
+            sql += " AND p.updated_at <= ?"
+            params.append(updated_to if 'T' in updated_to else updated_to + 'T23:59:59.999999')
+        if tag:
+            sql += """ AND p.id IN (
+                SELECT pt.prompt_id FROM prompt_tags pt JOIN tags t ON t.id = pt.tag_id WHERE t.name = ?
+            )"""
+            params.append(tag)
+        if min_score is not None or max_score is not None:
+            # 有值欄位的平均（全部為 NULL 時為 NULL，不符合任何條件）
+            total = " + ".join(f"coalesce(p.{field}, 0)" for field in SCORE_FIELDS)
+            present = " + ".join(f"(p.{field} IS NOT NULL)" for field in SCORE_FIELDS)
+            score_expr = f"(({total}) / nullif({present}, 0))"
+            if min_score is not None:
+                sql += f" AND {score_expr} >= ?"
+                params.append(min_score)
+            if max_score is not None:
+                sql += f" AND {score_expr} <= ?"
+                params.append(max_score)
+        if cursor:
+            cursor_updated_at, cursor_id = self._decode_cursor(cursor)
+            sql += " AND (p.updated_at, p.id) < (?, ?)"
+            params.extend([cursor_updated_at, cursor_id])
         
-        sql += " ORDER BY updated_at DESC"
+        sql += " ORDER BY p.updated_at DESC, p.id DESC LIMIT ?"
+        # 多取一筆以判斷是否還有下一頁
+        params.append(limit + 1)
         
-        cursor.execute(sql, params)
-        rows = cursor.fetchall()
-        conn.close()
+        rows = self._query(sql, params)
+        has_more = len(rows) > limit
+        rows = rows[:limit]
         
         prompts = []
         for row in rows:
-            prompt = {
-                'id': row[0],
-                'name': row[1],
-                'original_prompt': row[2],
-                'optimized_prompt': row[3],
-                'analysis_scores': json.loads(row[4]) if row[4] else {},
-                'tags': json.loads(row[5]) if row[5] else [],
-                'language': row[6],
-                'created_at': row[7]
-            }
+            prompt = self._row_to_prompt(row)
+            prompt['updated_at'] = row[8]
+            prompt['duplicate_of'] = row[9]
+            if not include_bodies:
+                prompt['original_preview'] = prompt.pop('original_prompt')
+                prompt['optimized_preview'] = prompt.pop('optimized_prompt')
             prompts.append(prompt)
         
-        return prompts
+        next_cursor = self._encode_cursor(rows[-1][8], rows[-1][0]) if has_more else None
+        return {'prompts': prompts, 'next_cursor': next_cursor}
+    
+    @staticmethod
+    def _encode_cursor(updated_at: str, prompt_id: str) -> str:
+        """分頁游標：最後一筆的 (updated_at, id)"""
+        return f"{updated_at}|{prompt_id}"
+    
+    @staticmethod
+    def _decode_cursor(cursor: str) -> tuple:
+        updated_at, _, prompt_id = cursor.partition('|')
+        return updated_at, prompt_id
     
     def get_all_tags(self) -> List[str]:
         """獲取所有標籤"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT tags FROM prompts WHERE tags IS NOT NULL")
-        rows = cursor.fetchall()
-        conn.close()
-        
-        all_tags = set()
-        for row in rows:
-            if row[0]:
-                tags = json.loads(row[0])
-                all_tags.update(tags)
-        
-        return sorted(list(all_tags))
+        rows = self._query("SELECT name FROM tags WHERE prompt_count > 0 ORDER BY name")
+        return [row[0] for row in rows]
+    
+    def get_tag_counts(self, limit: Optional[int] = None) -> List[Dict]:
+        """
+        獲取標籤及其使用次數（標籤雲用），依次數由多到少排序
+
+        Args:
+            limit: 最多回傳幾個標籤（None 表示全部）
+
+        Returns:
+            [{'name': str, 'count': int}, ...]
+        """
+        rows = self._query("""
+            SELECT name, prompt_count FROM tags
+            WHERE prompt_count > 0
+            ORDER BY prompt_count DESC, name
+            LIMIT ?
+        """, (-1 if limit is None else limit,))
+        return [{'name': name, 'count': count} for name, count in rows]
     
     def get_prompt_count(self) -> int:
         """獲取提示詞總數"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        return self._query("SELECT COUNT(*) FROM prompts")[0][0]
+
+    def get_storage_stats(self) -> Dict:
+        """
+        資料庫檔案大小、空閒頁比例與各表筆數
+
+        Returns:
+            {"file_size", "wal_size", "page_size", "page_count", "free_pages",
+             "free_ratio", "auto_vacuum", "tables": {表名: 筆數}}
+        """
+        conn = self._get_connection()
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+        free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        auto_vacuum = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+        rows = conn.execute("SELECT name, sql FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'").fetchall()
+        # FTS5 虛擬表的 shadow table（prompts_fts_data 等）屬於索引，不列入
+        virtual = [name for name, sql in rows if sql.upper().startswith("CREATE VIRTUAL TABLE")]
+        tables = sorted(name for name, _ in rows
+                        if name not in virtual and not any(name.startswith(f"{v}_") for v in virtual))
+        wal_path = f"{self.db_path}-wal"
+        return {
+            "file_size": os.path.getsize(self.db_path),
+            "wal_size": os.path.getsize(wal_path) if os.path.exists(wal_path) else 0,
+            "page_size": page_size,
+            "page_count": page_count,
+            "free_pages": free_pages,
+            "free_ratio": round(free_pages / page_count, 4) if page_count else 0.0,
+            "auto_vacuum": AUTO_VACUUM_MODES[auto_vacuum],
+            "tables": {name: conn.execute(f'SELECT count(*) FROM "{name}"').fetchone()[0] for name in tables},
+        }
+
+    def maintain(self, max_vacuum_pages: int = VACUUM_MAX_PAGES) -> Dict:
+        """
+        儲存空間維護（在背景執行緒呼叫，不在請求路徑上執行）
+
+        1. 尚未啟用 incremental auto_vacuum 的既有資料庫執行一次 VACUUM 轉換
+        2. 以取樣 ANALYZE 更新查詢規劃器的統計資料
+        3. 空閒頁比例達 VACUUM_MIN_FREE_RATIO 時，分段回收最多 max_vacuum_pages 頁
+
+        Returns:
+            {"converted", "reclaimed_pages", "duration", "stats"}
+        """
+        started = time.monotonic()
+        converted = self._enable_incremental_vacuum()
+        conn = self._get_connection()
+        conn.execute(f"PRAGMA analysis_limit = {int(ANALYSIS_LIMIT)}")
+        conn.execute("ANALYZE")
+        conn.commit()
+        reclaimed = self._reclaim_free_pages(max_vacuum_pages)
+        return {
+            "converted": converted,
+            "reclaimed_pages": reclaimed,
+            "duration": round(time.monotonic() - started, 3),
+            "stats": self.get_storage_stats(),
+        }
+
+    def _enable_incremental_vacuum(self) -> bool:
+        """
+        將既有資料庫轉為 incremental auto_vacuum（需要一次完整 VACUUM）
+
+        prompts 沒有 INTEGER PRIMARY KEY，VACUUM 可能重新編號 rowid，而
+        prompts_fts 以 rowid 對應提示詞，因此編號有變時重建全文索引。
+
+        Returns:
+            是否執行了轉換
+        """
+        conn = self._get_connection()
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == AUTO_VACUUM_INCREMENTAL:
+            return False
+        rowids = conn.execute("SELECT rowid, id FROM prompts ORDER BY rowid").fetchall()
+        conn.commit()
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        # VACUUM 不能在交易中執行，期間其他連線的寫入會等待（busy_timeout）
+        conn.execute("VACUUM")
+        if self.fts_enabled and conn.execute("SELECT rowid, id FROM prompts ORDER BY rowid").fetchall() != rowids:
+            logging.info("VACUUM renumbered prompts, rebuilding the FTS index")
+            with self._transaction() as cursor:
+                cursor.execute("INSERT INTO prompts_fts(prompts_fts) VALUES ('rebuild')")
+        return True
 
-        cursor.execute("SELECT COUNT(*) FROM prompts")
-        count = cursor.fetchone()[0]
+    def _reclaim_free_pages(self, max_pages: int) -> int:
+        """分段執行 incremental_vacuum，每段一個短交易；回傳回收的頁數"""
+        conn = self._get_connection()
+        page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+        free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        if not page_count or free_pages / page_count < VACUUM_MIN_FREE_RATIO:
+            return 0
+        reclaimed = 0
+        while reclaimed < max_pages and free_pages:
+            step = min(VACUUM_STEP_PAGES, free_pages, max_pages - reclaimed)
+            # execute() 對無結果欄的 PRAGMA 只執行一步（只回收一頁），executescript 會執行到完成
+            conn.executescript(f"PRAGMA incremental_vacuum({int(step)});")
+            remaining = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            if remaining >= free_pages:
+                break
+            reclaimed += free_pages - remaining
+            free_pages = remaining
+            time.sleep(VACUUM_STEP_PAUSE)
+        # 寫回主檔後檔案才會縮小；PASSIVE 不等待其他連線
+        conn.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchall()
+        return reclaimed
 
-        conn.close()
-        return count
+    def get_library_revision(self) -> int:
+        """提示詞庫修訂號（每次新增 / 修改 / 刪除後遞增）"""
+        return self._query("SELECT revision FROM library_revision WHERE id = 1")[0][0]
+    
+    @staticmethod
+    def _revision(cursor: sqlite3.Cursor) -> int:
+        """交易中的修訂號（含本交易的變更）"""
+        return cursor.execute("SELECT revision FROM library_revision WHERE id = 1").fetchone()[0]
+    
+    def get_changes(self, since: int = 0, limit: int = CHANGE_BATCH) -> List[Dict]:
+        """
+        本機變更記錄（依 seq 遞增；同步套用的變更不列入）
+
+        Args:
+            since: 只回傳 seq 大於此值的變更
+            limit: 最多回傳筆數
+
+        Returns:
+            [{"seq", "id", "deleted", "updated_at", "changed_at", "record"}]，tombstone 的 record 為 None
+        """
+        rows = self._query(f"""
+            SELECT c.seq, c.prompt_id, c.deleted, c.updated_at, c.changed_at, {PROMPT_COLUMNS}
+            FROM prompt_changes c
+            LEFT JOIN prompts p ON p.id = c.prompt_id
+            WHERE c.seq > ? AND c.origin IS NULL
+            ORDER BY c.seq
+            LIMIT ?
+        """, (since, limit))
+        return [{
+            'seq': row[0],
+            'id': row[1],
+            'deleted': bool(row[2]) or row[5] is None,
+            'updated_at': row[3],
+            'changed_at': row[4],
+            'record': None if row[2] or row[5] is None else dict(self._row_to_prompt(row[5:]), updated_at=row[3]),
+        } for row in rows]
+
+    def get_change_entries(self, prompt_ids: List[str]) -> Dict[str, Dict]:
+        """指定提示詞最後一次變更的 {id: {"seq", "deleted", "updated_at", "changed_at", "origin"}}（沒有記錄的 ID 不列入）"""
+        entries = {}
+        for chunk in self._chunks(list(prompt_ids)):
+            rows = self._query(f"""
+                SELECT prompt_id, seq, deleted, updated_at, changed_at, origin FROM prompt_changes
+                WHERE prompt_id IN ({", ".join("?" * len(chunk))})
+            """, chunk)
+            for prompt_id, seq, deleted, updated_at, changed_at, origin in rows:
+                entries[prompt_id] = {'seq': seq, 'deleted': bool(deleted), 'updated_at': updated_at,
+                                      'changed_at': changed_at, 'origin': origin}
+        return entries
+
+    def apply_changes(self, changes: List[Dict], origin: str) -> Dict:
+        """
+        套用其他副本的變更（供 prompt_sync 呼叫）
+
+        記錄保留變更的 updated_at 與 changed_at（last-writer-wins 的 UTC 時間戳），tombstone 刪除
+        提示詞；同一交易內將這些變更標記為來自 origin，之後不會被推送回去。
+        同步不套用 merge / skip：新 ID 與既有提示詞重複時只標記。
+
+        Args:
+            changes: get_changes() 格式的變更
+            origin: 變更來源的副本 ID
+
+        Returns:
+            {"upserted", "deleted", "errors"}（errors 為無法匯入而略過的記錄數）
+        """
+        now = datetime.now().isoformat()
+        records, applied = [], []
+        for change in changes:
+            if not change['deleted']:
+                try:
+                    record = validate_record(dict(change['record'], id=change['id']), now)
+                except ValueError as e:
+                    logging.warning(f"Skipping invalid synced record {change['id']}: {e}")
+                    continue
+                record['updated_at'] = change['updated_at']
+                records.append(record)
+            applied.append(change)
+        deleted_ids = [change['id'] for change in applied if change['deleted']]
+        signature_rows, present = signatures([record['optimized_prompt'] for record in records])
+        with self._transaction() as cursor:
+            upserted = 0
+            if records:
+                upserted = self._write_records(cursor, records, signature_rows, present, True, POLICY_FLAG)[0]
+            deleted = self._delete_rows(cursor, deleted_ids)
+            # 本機沒有的提示詞也記下 tombstone，較舊的變更之後不會讓它復活
+            cursor.executemany("""
+                INSERT INTO prompt_changes (prompt_id, deleted, updated_at, changed_at, origin) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(prompt_id) DO UPDATE SET
+                    deleted = excluded.deleted, updated_at = excluded.updated_at,
+                    changed_at = excluded.changed_at, origin = excluded.origin
+            """, [(change['id'], int(change['deleted']), change['updated_at'], change['changed_at'], origin)
+                  for change in applied])
+        return {"upserted": upserted, "deleted": deleted, "errors": len(changes) - len(applied)}
+
+    def load_sync_state(self) -> Dict:
+        """同步引擎的狀態（副本 ID、推送 / 拉取進度、衝突記錄）"""
+        return {key: json.loads(value) for key, value in self._query("SELECT key, value FROM sync_state")}
+
+    def save_sync_state(self, state: Dict):
+        """保存同步引擎的狀態"""
+        with self._transaction() as cursor:
+            cursor.execute("DELETE FROM sync_state")
+            cursor.executemany(
+                "INSERT INTO sync_state (key, value) VALUES (?, ?)",
+                [(key, json.dumps(value, ensure_ascii=False)) for key, value in state.items()]
+            )
+
+    def find_similar(self, text: str, limit: int = 5, exclude_id: Optional[str] = None) -> List[Dict]:
+        """
+        找出與輸入內容相似的已保存提示詞（離線向量索引，以原始內容與名稱比對）
+
+        索引在保存 / 刪除時增量更新；匯入或其他程序寫入後會在下次查詢時重建。
+
+        Args:
+            text: 要比對的提示內容
+            limit: 最多回傳筆數
+            exclude_id: 不列入結果的提示詞 ID（例如比對的提示詞本身）
+
+        Returns:
+            提示詞字典列表（加上 'similarity'：餘弦相似度 0~1），由最相似開始
+        """
+        index = self._similarity
+        with index.lock:
+            if not index.loaded:
+                index.load()
+            if not index.is_current(self.get_library_revision()):
+                self._rebuild_similarity_index()
+            matches = index.search(text, limit, exclude=[exclude_id] if exclude_id else ())
+        if not matches:
+            return []
+        
+        placeholders = ", ".join("?" * len(matches))
+        rows = self._query(f"SELECT {PROMPT_COLUMNS} FROM prompts p WHERE p.id IN ({placeholders})",
+                           [prompt_id for prompt_id, _ in matches])
+        prompts = {row[0]: self._row_to_prompt(row) for row in rows}
+        return [
+            {**prompts[prompt_id], 'similarity': score}
+            for prompt_id, score in matches if prompt_id in prompts
+        ]
+    
+    def _rebuild_similarity_index(self):
+        """由資料庫快照重建相似提示索引"""
+        conn = self._connect()
+        try:
+            # 同一讀取交易內讀兩次（文件頻率、向量），看到同一個 WAL 快照
+            conn.execute("BEGIN")
+            revision = self._revision(conn.cursor())
+            
+            def documents():
+                cursor = conn.execute(f"SELECT p.id, p.name, {_body('p.original_hash')} FROM prompts p")
+                for prompt_id, name, original in cursor:
+                    yield prompt_id, index_text(name, original)
+            
+            self._similarity.rebuild(documents, revision)
+        finally:
+            conn.close()
+    
+    def get_analytics_data(self) -> Dict:
+        """
+        以欄為單位讀取統計用資料（不讀取內文）
+
+        Returns:
+            {'prompts': {欄位: [值, ...]}（id / language / created_at / updated_at /
+             SCORE_FIELDS / original_hash / optimized_hash），
+             'tags': {'prompt_id': [...], 'tag': [...]}}
+        """
+        columns = ("id", "language", "created_at", "updated_at") + SCORE_FIELDS + ("original_hash", "optimized_hash")
+        rows = self._query(f"SELECT {', '.join(columns)} FROM prompts")
+        tag_rows = self._query("""
+            SELECT pt.prompt_id, t.name FROM prompt_tags pt JOIN tags t ON t.id = pt.tag_id
+        """)
+        values = list(zip(*rows)) if rows else [()] * len(columns)
+        return {
+            'prompts': {column: list(column_values) for column, column_values in zip(columns, values)},
+            'tags': {
+                'prompt_id': [row[0] for row in tag_rows],
+                'tag': [row[1] for row in tag_rows],
+            },
+        }
+
+    def iter_prompts(self, batch_size: int = 500) -> Iterator[Dict]:
+        """
+        依更新時間逐筆讀取所有提示詞（以游標分批 fetch，記憶體用量固定）
+
+        使用獨立連線，整個讀取過程看到同一個 WAL 快照，不受同時寫入影響。
+        """
+        conn = self._connect()
+        try:
+            cursor = conn.execute(f"""
+                SELECT {PROMPT_COLUMNS}
+                FROM prompts p
+                ORDER BY p.updated_at DESC
+            """)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield self._row_to_prompt(row)
+        finally:
+            conn.close()
+    
+    def export_stream(self, fmt: str = "json", compress: bool = False) -> Iterator[bytes]:
+        """
+        以串流方式匯出所有提示詞
+
+        Args:
+            fmt: "json"（與 export_prompts 相同結構）或 "jsonl"
+            compress: 是否以 gzip 壓縮
+
+        Returns:
+            bytes 區塊的迭代器
+        """
+        return iter_export(self.iter_prompts(), fmt=fmt, compress=compress)
 
     def export_prompts(self) -> str:
         """匯出所有提示詞為 JSON 字串"""
-        # Use actual count to ensure all prompts are exported
-        total_count = self.get_prompt_count()
-        prompts = self.load_prompts(limit=max(total_count, 1))
-        export_data = {
-            "version": "1.0",
-            "exported_at": datetime.now().isoformat(),
-            "prompt_count": len(prompts),
-            "prompts": prompts
-        }
-        return json.dumps(export_data, ensure_ascii=False, indent=2)
+        return b"".join(self.export_stream()).decode('utf-8')
 
     def import_prompts(self, json_data: str, overwrite: bool = False) -> Dict:
         """
@@ -234,104 +1599,167 @@ class PromptDatabase:
         Returns:
             Dict with import statistics
         """
-        try:
-            data = json.loads(json_data)
-            prompts = data.get("prompts", [])
-
-            # Validate that prompts is a list
-            if not isinstance(prompts, list):
-                return {
-                    "success": False,
-                    "error": "Invalid format: 'prompts' must be a list",
-                    "imported": 0,
-                    "skipped": 0,
-                    "errors": 0
-                }
-
-            imported = 0
-            skipped = 0
-            errors = 0
-
-            # Use context manager for proper connection handling
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-
-                for prompt in prompts:
-                    try:
-                        prompt_id = prompt.get('id')
-                        if not prompt_id:
-                            errors += 1
-                            continue
-
-                        # Check if prompt already exists
-                        cursor.execute("SELECT id FROM prompts WHERE id = ?", (prompt_id,))
-                        exists = cursor.fetchone() is not None
-
-                        if exists and not overwrite:
-                            skipped += 1
-                            continue
-
-                        now = datetime.now().isoformat()
-
-                        # Prepare common data
-                        analysis_scores = prompt.get('analysis_scores')
-                        tags = prompt.get('tags')
-
-                        if exists and overwrite:
-                            # Update existing
-                            cursor.execute("""
-                                UPDATE prompts SET
-                                    name = ?, original_prompt = ?, optimized_prompt = ?,
-                                    analysis_scores = ?, tags = ?, language = ?, updated_at = ?
-                                WHERE id = ?
-                            """, (
-                                prompt.get('name', 'Imported'),
-                                prompt.get('original_prompt', ''),
-                                prompt.get('optimized_prompt', ''),
-                                json.dumps(analysis_scores) if analysis_scores else None,
-                                json.dumps(tags) if tags else None,
-                                prompt.get('language', 'zh_TW'),
-                                now,
-                                prompt_id
-                            ))
-                        else:
-                            # Insert new
-                            cursor.execute("""
-                                INSERT INTO prompts
-                                (id, name, original_prompt, optimized_prompt, analysis_scores, tags, language, created_at, updated_at)
-                                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                            """, (
-                                prompt_id,
-                                prompt.get('name', 'Imported'),
-                                prompt.get('original_prompt', ''),
-                                prompt.get('optimized_prompt', ''),
-                                json.dumps(analysis_scores) if analysis_scores else None,
-                                json.dumps(tags) if tags else None,
-                                prompt.get('language', 'zh_TW'),
-                                prompt.get('created_at', now),
-                                now
-                            ))
-
-                        imported += 1
-
-                    except Exception:
-                        errors += 1
+        return self.import_stream(json_data, overwrite=overwrite)
 
-                conn.commit()
+    def import_stream(self, source: Union[BinaryIO, bytes, str], overwrite: bool = False,
+                      batch_size: int = IMPORT_BATCH_SIZE,
+                      progress_callback: Optional[Callable[[Dict], None]] = None,
+                      duplicate_policy: Optional[str] = None) -> Dict:
+        """
+        批次匯入備份檔（v1.0 JSON 或 JSONL，可為 gzip 壓縮）
 
-            return {
-                "success": True,
-                "imported": imported,
-                "skipped": skipped,
-                "errors": errors,
-                "total": len(prompts)
-            }
+        檔案在背景執行緒中逐筆解析與驗證，寫入端以 executemany +
+        INSERT ... ON CONFLICT 每批一個交易寫入（內文先存入 prompt_blobs，
+        重複內容只存一份），記憶體用量與檔案大小無關；
+        每批之間釋放寫入鎖，其他 session 的寫入不會被長時間阻擋。
+
+        資料庫中沒有的 ID 會先比對重複（既有提示詞與同一檔案中較早的記錄），
+        依 duplicate_policy 處理：flag 照常寫入並標記，merge / skip 不寫入
+        （merge 將標籤併入既有提示詞），兩者皆計入 skipped。
+
+        Args:
+            source: 檔案物件（如 Streamlit UploadedFile）、bytes 或 str
+            overwrite: 是否覆蓋已存在的提示詞（根據 ID）
+            batch_size: 每個交易寫入的筆數
+            progress_callback: 每批寫入後呼叫，參數為目前統計
+                               （imported / skipped / duplicates / errors / bytes_read）
+            duplicate_policy: 覆寫建構時設定的重複處理方式
 
-        except json.JSONDecodeError as e:
+        Returns:
+            Dict with import statistics（格式錯誤時 success 為 False，
+            已寫入的批次仍會保留並反映在統計中）
+        """
+        policy = validate_policy(duplicate_policy or self.duplicate_policy)
+        stats = {"imported": 0, "skipped": 0, "duplicates": 0, "errors": 0, "bytes_read": 0}
+        try:
+            for records, invalid, bytes_read in iter_validated_batches(source, batch_size):
+                stats["errors"] += invalid
+                stats["bytes_read"] = bytes_read
+                if records:
+                    signature_rows, present = signatures([record["optimized_prompt"] for record in records])
+                    with self._transaction() as cursor:
+                        written, duplicates = self._write_records(
+                            cursor, records, signature_rows, present, overwrite, policy
+                        )
+                    stats["imported"] += written
+                    stats["skipped"] += len(records) - written
+                    stats["duplicates"] += duplicates
+                if progress_callback:
+                    progress_callback(dict(stats))
+        except ImportFormatError as e:
             return {
                 "success": False,
-                "error": f"Invalid JSON format: {str(e)}",
-                "imported": 0,
-                "skipped": 0,
-                "errors": 0
+                "error": str(e),
+                "imported": stats["imported"],
+                "skipped": stats["skipped"],
+                "duplicates": stats["duplicates"],
+                "errors": stats["errors"]
             }
+
+        return {
+            "success": True,
+            "imported": stats["imported"],
+            "skipped": stats["skipped"],
+            "duplicates": stats["duplicates"],
+            "errors": stats["errors"],
+            "total": stats["imported"] + stats["skipped"] + stats["errors"]
+        }
+
+    def _write_records(self, cursor: sqlite3.Cursor, records: List[Dict], signature_rows, present,
+                       overwrite: bool, policy: str) -> tuple:
+        """
+        在目前交易中寫入一批已驗證的記錄（匯入與同步共用）
+
+        Args:
+            records: validate_record() 格式的記錄（會被改寫為寫入用的欄位）
+            signature_rows / present: 記錄優化內文的 MinHash 簽章（在交易外計算）
+            overwrite: 是否覆蓋已存在的提示詞（根據 ID）
+            policy: 新 ID 與既有提示詞重複時的處理方式
+
+        Returns:
+            (寫入筆數, 重複筆數)
+        """
+        if overwrite:
+            # 覆蓋除 id / created_at 以外的所有欄位
+            updated = [column for column in ROW_COLUMNS.split(", ") if column not in ("id", "created_at")]
+            conflict = "ON CONFLICT(id) DO UPDATE SET " + ", ".join(f"{column} = excluded.{column}" for column in updated)
+        else:
+            conflict = "ON CONFLICT(id) DO NOTHING"
+        # 先以 executemany 寫入暫存表，再以單一 INSERT ... SELECT 合併：
+        # FTS 觸發器在一個陳述式內批次執行，比逐列 executemany 快約一倍
+        # （暫存表欄位不宣告型別，原樣保存寫入的值）
+        cursor.execute(f"CREATE TEMP TABLE IF NOT EXISTS prompts_import (seq INTEGER PRIMARY KEY, {ROW_COLUMNS})")
+        stage_sql = f"INSERT INTO temp.prompts_import ({ROW_COLUMNS}) VALUES ({ROW_PARAMS})"
+        merge_sql = f"""
+            INSERT INTO prompts ({ROW_COLUMNS})
+            SELECT {ROW_COLUMNS} FROM temp.prompts_import WHERE true ORDER BY seq
+            {conflict}
+        """
+        dropped, merges, duplicates = self._resolve_duplicates(cursor, records, signature_rows, present, policy)
+        kept = [i for i in range(len(records)) if i not in dropped]
+        batch = [records[i] for i in kept]
+        for record in batch:
+            record.update(score_columns(record["analysis_scores"]))
+            record["analysis_scores"] = json.dumps(record["analysis_scores"]) if record["analysis_scores"] else None
+            record["tags"] = json.dumps(record["tags"]) if record["tags"] else None
+        written = 0
+        if batch:
+            self._store_bodies(cursor, batch)
+            cursor.executemany(stage_sql, batch)
+            # 被覆蓋或略過的內文在合併後可能已無引用
+            candidates = [record[f"{field}_hash"] for record in batch for field in ("original", "optimized")]
+            if overwrite:
+                candidates.extend(self._body_hashes(cursor, "SELECT id FROM temp.prompts_import"))
+            cursor.execute(merge_sql)
+            # DO NOTHING 的衝突列不計入 rowcount
+            written = len(batch) if overwrite else cursor.rowcount
+            self._collect_blobs(cursor, candidates)
+            cursor.execute("DELETE FROM temp.prompts_import")
+            self._store_fingerprints(cursor, [record["id"] for record in batch],
+                                     signature_rows[kept], present[kept],
+                                     [record.get("duplicate_of") for record in batch])
+        self._merge_tags(cursor, merges, datetime.now().isoformat())
+        return written, duplicates
+
+    def _resolve_duplicates(self, cursor: sqlite3.Cursor, records: List[Dict], signature_rows, present,
+                            policy: str) -> tuple:
+        """
+        匯入批次的重複處理：資料庫中沒有的 ID 與既有提示詞及同批次較早
+        （會寫入）的記錄比對；flag 時在記錄加上 'duplicate_of'
+
+        Returns:
+            (不寫入的記錄索引 set, merge 時要併入的標籤 {提示詞 ID: [tag, ...]}, 偵測到的重複數)
+        """
+        existing = set()
+        for chunk in self._chunks([record["id"] for record in records]):
+            existing.update(row[0] for row in cursor.execute(
+                f"SELECT id FROM prompts WHERE id IN ({', '.join('?' * len(chunk))})", chunk
+            ))
+        fresh = [i for i, record in enumerate(records) if record["id"] not in existing]
+        stored_matches = self._match_duplicates(
+            cursor, [records[i]["optimized_prompt"] for i in fresh], signature_rows[fresh], present[fresh]
+        )
+        keys = band_keys(signature_rows)
+        batch_index = LSHIndex()
+        batch_hashes: Dict[bytes, str] = {}
+        dropped, merges, duplicates = set(), {}, 0
+        for i, match in zip(fresh, stored_matches):
+            record = records[i]
+            digest = body_hash(record["optimized_prompt"])
+            target = match['id'] if match else batch_hashes.get(digest)
+            if target is None and present[i]:
+                found = batch_index.match(signature_rows[i], self.duplicate_threshold, keys=keys[i])
+                target = found[0] if found else None
+            if target is not None:
+                duplicates += 1
+                if policy == POLICY_FLAG:
+                    record["duplicate_of"] = target
+                else:
+                    dropped.add(i)
+                    if policy == POLICY_MERGE:
+                        merges.setdefault(target, []).extend(record["tags"] or [])
+                    continue
+            batch_hashes.setdefault(digest, record["id"])
+            if present[i]:
+                batch_index.add(record["id"], signature_rows[i], keys[i])
+        return dropped, merges, duplicates
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+Prompt Dedup - Near-duplicate detection with MinHash-LSH
+Optimized prompt bodies are reduced to MinHash signatures over character
+shingles; signatures are split into LSH bands so a new prompt is compared
+only against the few saved prompts sharing a band, and the estimated
+Jaccard similarity decides whether it is a near-duplicate
+"""
+
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from prompt_similarity import _PRIME, mix64, ngram_hashes
+
+# What happens when a saved or imported prompt duplicates an existing one
+POLICY_FLAG = "flag"    # keep both, mark the new one as a possible duplicate
+POLICY_MERGE = "merge"  # keep the existing prompt and add the new prompt's tags to it
+POLICY_SKIP = "skip"    # keep the existing prompt unchanged
+POLICIES = (POLICY_FLAG, POLICY_MERGE, POLICY_SKIP)
+
+# Estimated Jaccard similarity (over shingles) from which prompts count as duplicates
+DEFAULT_THRESHOLD = 0.85
+
+# Character shingle length (long enough that unrelated CJK texts share few)
+SHINGLE_SIZE = 4
+
+# Signature layout: BANDS x ROWS bins; a pair becomes a candidate when all
+# ROWS bins of any band agree (~99.9% recall at J = 0.85, ~64% at J = 0.5)
+BANDS = 16
+ROWS = 4
+NUM_BINS = BANDS * ROWS
+
+# Only the low 16 bits of each bin are kept (b-bit MinHash): 128-byte signatures,
+# and unrelated bins collide with probability 2 ** -16
+SIGNATURE_DTYPE = np.dtype("<u2")
+
+_BIN_BITS = int(np.log2(NUM_BINS))
+_VALUE_MASK = np.uint64((1 << (64 - _BIN_BITS)) - 1)
+_EMPTY = np.uint64(np.iinfo(np.uint64).max)
+_ROTATION = np.uint64(0x9E3779B97F4A7C15)
+
+
+def signatures(texts: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    MinHash signatures of a batch of texts
+
+    Uses one-permutation hashing: every shingle hash falls into one of
+    NUM_BINS bins by its top bits and each bin keeps its minimum; empty bins
+    borrow from the next non-empty bin (rotation densification), so short
+    texts still get full signatures.
+
+    Returns:
+        (signatures of shape (len(texts), NUM_BINS), mask of texts that had any shingle)
+    """
+    rows = len(texts)
+    owners, hashes = ngram_hashes(texts, (SHINGLE_SIZE,))
+    bins = (hashes >> np.uint64(64 - _BIN_BITS)).astype(np.int64)
+    mins = np.full((rows, NUM_BINS), _EMPTY, dtype=np.uint64)
+    np.minimum.at(mins, (owners, bins), hashes & _VALUE_MASK)
+
+    filled = mins != _EMPTY
+    present = filled.any(axis=1)
+    # Nearest filled bin at or after each position, wrapping around
+    positions = np.where(np.concatenate([filled, filled], axis=1), np.arange(2 * NUM_BINS), 2 * NUM_BINS)
+    nearest = np.minimum.accumulate(positions[:, ::-1], axis=1)[:, ::-1][:, :NUM_BINS]
+    nearest = np.where(present[:, None], nearest, np.arange(NUM_BINS))
+    distance = (nearest - np.arange(NUM_BINS)).astype(np.uint64)
+    borrowed = np.take_along_axis(mins, nearest % NUM_BINS, axis=1)
+    dense = np.where(filled, mins, mix64(borrowed + distance * _ROTATION))
+    return dense.astype(SIGNATURE_DTYPE), present
+
+
+def band_keys(signature_rows: np.ndarray) -> np.ndarray:
+    """
+    LSH bucket key of every band (32-bit, band number mixed in)
+
+    Returns:
+        int64 array of shape (len(signature_rows), BANDS)
+    """
+    values = signature_rows.astype(np.uint64).reshape(len(signature_rows), BANDS, ROWS)
+    keys = np.broadcast_to(np.arange(BANDS, dtype=np.uint64), values.shape[:2]).copy()
+    for row in range(ROWS):
+        keys = mix64(keys * _PRIME + values[:, :, row])
+    return (keys >> np.uint64(32)).astype(np.int64)
+
+
+def estimate_similarity(signature: np.ndarray, others: np.ndarray) -> np.ndarray:
+    """Estimated Jaccard similarity of one signature to each row of others"""
+    return np.count_nonzero(others == signature, axis=-1) / NUM_BINS
+
+
+def pack_signature(signature: np.ndarray) -> bytes:
+    return signature.astype(SIGNATURE_DTYPE).tobytes()
+
+
+def unpack_signatures(blobs: Sequence[bytes]) -> np.ndarray:
+    return np.frombuffer(b"".join(blobs), dtype=SIGNATURE_DTYPE).reshape(len(blobs), NUM_BINS)
+
+
+def best_match(signature: np.ndarray, candidates: np.ndarray, threshold: float) -> Optional[Tuple[int, float]]:
+    """Row of candidates most similar to signature at or above threshold, as (row, estimated similarity)"""
+    if not len(candidates):
+        return None
+    scores = estimate_similarity(signature, candidates)
+    best = int(np.argmax(scores))
+    return (best, float(scores[best])) if scores[best] >= threshold else None
+
+
+class LSHIndex:
+    """In-memory MinHash-LSH index (LocalStorage backend, and within one import)"""
+
+    def __init__(self):
+        self.revision: Optional[int] = None
+        self.ids: List[str] = []
+        self.slots: Dict[str, int] = {}
+        self._signatures = np.empty((0, NUM_BINS), dtype=SIGNATURE_DTYPE)
+        self._keys = np.empty((0, BANDS), dtype=np.int64)
+        # Bucket key -> slots (a removed prompt's slot is reused by the last one)
+        self._buckets: Dict[int, Set[int]] = defaultdict(set)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def add_many(self, items: Sequence[Tuple[str, str]]) -> None:
+        """Index (id, text) pairs"""
+        if not items:
+            return
+        rows, present = signatures([text for _, text in items])
+        keys = band_keys(rows)
+        for (key, _), row, row_keys, has_shingles in zip(items, rows, keys, present):
+            if has_shingles:
+                self.add(key, row, row_keys)
+
+    def add(self, key: str, signature: np.ndarray, keys: Optional[np.ndarray] = None) -> None:
+        self.remove(key)
+        keys = band_keys(signature[None, :])[0] if keys is None else keys
+        slot = len(self.ids)
+        if slot == len(self._signatures):
+            capacity = max(1024, 2 * slot)
+            self._signatures = np.resize(self._signatures, (capacity, NUM_BINS))
+            self._keys = np.resize(self._keys, (capacity, BANDS))
+        self._signatures[slot] = signature
+        self._keys[slot] = keys
+        self.ids.append(key)
+        self.slots[key] = slot
+        for bucket in keys.tolist():
+            self._buckets[bucket].add(slot)
+
+    def remove(self, key: str) -> None:
+        slot = self.slots.pop(key, None)
+        if slot is None:
+            return
+        for bucket in self._keys[slot].tolist():
+            self._buckets[bucket].discard(slot)
+        last = len(self.ids) - 1
+        if slot != last:
+            moved = self.ids[last]
+            for bucket in self._keys[last].tolist():
+                self._buckets[bucket].discard(last)
+                self._buckets[bucket].add(slot)
+            self._signatures[slot] = self._signatures[last]
+            self._keys[slot] = self._keys[last]
+            self.ids[slot] = moved
+            self.slots[moved] = slot
+        self.ids.pop()
+
+    def candidates(self, keys: Iterable[int], exclude: Optional[str] = None) -> np.ndarray:
+        """Slots of the indexed signatures sharing at least one band bucket"""
+        found: Set[int] = set()
+        for bucket in keys:
+            found |= self._buckets.get(bucket, set())
+        found.discard(self.slots.get(exclude, -1))
+        return np.fromiter(found, dtype=np.int64, count=len(found))
+
+    def match(self, signature: np.ndarray, threshold: float = DEFAULT_THRESHOLD,
+              exclude: Optional[str] = None, keys: Optional[np.ndarray] = None) -> Optional[Tuple[str, float]]:
+        """Most similar indexed prompt at or above threshold, as (id, estimated similarity)"""
+        keys = band_keys(signature[None, :])[0] if keys is None else keys
+        slots = self.candidates(keys.tolist(), exclude)
+        found = best_match(signature, self._signatures[slots], threshold)
+        return (self.ids[slots[found[0]]], found[1]) if found else None
+
+
+def validate_policy(policy: str) -> str:
+    if policy not in POLICIES:
+        raise ValueError(f"Unknown duplicate policy: {policy!r} (expected one of {', '.join(POLICIES)})")
+    return policy
+
+
+def merge_tags(existing: Optional[List[str]], incoming: Optional[List[str]]) -> List[str]:
+    """Existing tags followed by the new ones (order kept, no repeats)"""
+    return list(dict.fromkeys(list(existing or []) + list(incoming or [])))
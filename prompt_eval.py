@@ -1,37 +1,19 @@
 import json
 import re
+import time
 import logging
 from llm_invoker import LLMFactory
 from prompt_loader import PromptLoader, get_default_loader
+from prompt_registry import get_default_registry
 
 logger = logging.getLogger(__name__)
 max_token_length = 131072  # Claude 的最大 tokens 限制
 
-class PromptEvaluator:
-    """提示評估類，用於分析和優化提示"""
-    
-    def __init__(self, llm_type="claude", llm_instance=None, prompt_loader=None, **llm_kwargs):
-        """初始化評估器
-        
-        Args:
-            llm_type: LLM 類型
-            llm_instance: 可選的 LLM 實例
-            prompt_loader: 可選的 PromptLoader 實例（默認使用單例）
-            **llm_kwargs: LLM 初始化參數
-        """
-        if llm_instance:
-            self.llm = llm_instance
-        else:
-            self.llm = LLMFactory.create_llm(llm_type, **llm_kwargs)
-        
-        # Use provided loader or get default singleton
-        self.prompt_loader = prompt_loader if prompt_loader else get_default_loader()
-        
-        # Keep old translations dict for backward compatibility
-        # But it's now populated from YAML
-        self.translations = {
-            "zh_TW": {
-                "system_analyze": """你是一位經驗豐富的提示工程專家，擅長評估和優化大型語言模型的提示詞。你具備深厚的AI交互設計理論知識，熟悉各種提示工程技術和最佳實踐。
+# Keep old translations dict for backward compatibility
+# But it's now populated from YAML
+LEGACY_TRANSLATIONS = {
+    "zh_TW": {
+        "system_analyze": """你是一位經驗豐富的提示工程專家，擅長評估和優化大型語言模型的提示詞。你具備深厚的AI交互設計理論知識，熟悉各種提示工程技術和最佳實踐。
 
 請基於以下評估框架進行專業分析：
 - 角色定義清晰度
@@ -40,7 +22,7 @@ class PromptEvaluator:
 - 約束條件完整性
 - 示例提供充分性
 - 邏輯結構合理性""",
-                "user_analyze": """請對以下提示進行全面的專業分析。按照標準化的評估流程，逐項檢查並評分：
+        "user_analyze": """請對以下提示進行全面的專業分析。按照標準化的評估流程，逐項檢查並評分：
 
 ## 分析目標提示：
 ```
@@ -73,7 +55,7 @@ class PromptEvaluator:
 - 5-6分：一般，需要明顯改進
 - 3-4分：較差，存在重要問題
 - 1-2分：很差，基本不可用""",
-                "system_optimize": """你是一位頂級的提示工程專家，專門負責優化和重構提示詞，使其達到產業級標準。
+        "system_optimize": """你是一位頂級的提示工程專家，專門負責優化和重構提示詞，使其達到產業級標準。
 
 你的優化原則：
 1. 保持原始意圖不變
@@ -84,7 +66,7 @@ class PromptEvaluator:
 6. 優化語言表達的專業性
 
 請基於現代提示工程最佳實踐進行優化。""",
-                "user_optimize": """請將以下提示優化為專業級別的高質量提示詞。
+        "user_optimize": """請將以下提示優化為專業級別的高質量提示詞。
 
 ## 原始提示：
 ```
@@ -105,13 +87,13 @@ class PromptEvaluator:
 - 指令具體，可直接執行
 - 格式規範，符合標準
 - 邏輯合理，步驟明確""",
-                "role_added": "✓ 角色定義優化：",
-                "format_added": "✓ 輸出格式規範化：",
-                "reasoning_added": "✓ 推理過程結構化",
-                "final_improvement": "✓ 整體結構和專業性全面提升，符合工業級提示工程標準"
-            },
-            "en": {
-                "system_analyze": """You are a seasoned prompt engineering expert with extensive experience in evaluating and optimizing prompts for large language models. You possess deep knowledge of AI interaction design theory and are proficient in various prompt engineering techniques and best practices.
+        "role_added": "✓ 角色定義優化：",
+        "format_added": "✓ 輸出格式規範化：",
+        "reasoning_added": "✓ 推理過程結構化",
+        "final_improvement": "✓ 整體結構和專業性全面提升，符合工業級提示工程標準"
+    },
+    "en": {
+        "system_analyze": """You are a seasoned prompt engineering expert with extensive experience in evaluating and optimizing prompts for large language models. You possess deep knowledge of AI interaction design theory and are proficient in various prompt engineering techniques and best practices.
 
 Please conduct professional analysis based on the following evaluation framework:
 - Role definition clarity
@@ -120,7 +102,7 @@ Please conduct professional analysis based on the following evaluation framework
 - Constraint completeness
 - Example provision adequacy
 - Logical structure rationality""",
-                "user_analyze": """Please conduct a comprehensive professional analysis of the following prompt. Follow standardized evaluation procedures and score each aspect:
+        "user_analyze": """Please conduct a comprehensive professional analysis of the following prompt. Follow standardized evaluation procedures and score each aspect:
 
 ## Target Prompt for Analysis:
 ```
@@ -153,7 +135,7 @@ Please conduct professional analysis based on the following evaluation framework
 - 5-6: Average, requires significant improvements
 - 3-4: Poor, has important issues
 - 1-2: Very poor, basically unusable""",
-                "system_optimize": """You are a top-tier prompt engineering expert specializing in optimizing and restructuring prompts to meet industry-grade standards.
+        "system_optimize": """You are a top-tier prompt engineering expert specializing in optimizing and restructuring prompts to meet industry-grade standards.
 
 Your optimization principles:
 1. Maintain original intent unchanged
@@ -164,7 +146,7 @@ Your optimization principles:
 6. Optimize professional language expression
 
 Please optimize based on modern prompt engineering best practices.""",
-                "user_optimize": """Please optimize the following prompt to professional-grade, high-quality prompt standards.
+        "user_optimize": """Please optimize the following prompt to professional-grade, high-quality prompt standards.
 
 ## Original Prompt:
 ```
@@ -185,13 +167,13 @@ Please provide the complete optimized prompt directly, without additional explan
 - Contains specific, directly executable instructions
 - Follows standard formatting conventions
 - Has logical, well-defined steps""",
-                "role_added": "✓ Role definition optimized:",
-                "format_added": "✓ Output format standardized:",
-                "reasoning_added": "✓ Reasoning process structured",
-                "final_improvement": "✓ Overall structure and professionalism comprehensively enhanced to meet industrial-grade prompt engineering standards"
-            },
-            "ja": {
-                "system_analyze": """あなたは大型言語モデルのプロンプト評価と最適化において豊富な経験を持つ、熟練のプロンプトエンジニアリング専門家です。AI対話設計理論に関する深い知識を有し、様々なプロンプトエンジニアリング技術とベストプラクティスに精通しています。
+        "role_added": "✓ Role definition optimized:",
+        "format_added": "✓ Output format standardized:",
+        "reasoning_added": "✓ Reasoning process structured",
+        "final_improvement": "✓ Overall structure and professionalism comprehensively enhanced to meet industrial-grade prompt engineering standards"
+    },
+    "ja": {
+        "system_analyze": """あなたは大型言語モデルのプロンプト評価と最適化において豊富な経験を持つ、熟練のプロンプトエンジニアリング専門家です。AI対話設計理論に関する深い知識を有し、様々なプロンプトエンジニアリング技術とベストプラクティスに精通しています。
 
 以下の評価フレームワークに基づいて専門的な分析を行ってください：
 - 役割定義の明確性
@@ -200,7 +182,7 @@ Please provide the complete optimized prompt directly, without additional explan
 - 制約条件の完全性
 - 例示提供の充実性
 - 論理構造の合理性""",
-                "user_analyze": """以下のプロンプトに対して包括的な専門分析を実施してください。標準化された評価手順に従い、各項目を採点してください：
+        "user_analyze": """以下のプロンプトに対して包括的な専門分析を実施してください。標準化された評価手順に従い、各項目を採点してください：
 
 ## 分析対象プロンプト：
 ```
@@ -233,7 +215,7 @@ Please provide the complete optimized prompt directly, without additional explan
 - 5-6点：普通、大幅な改善必要
 - 3-4点：劣る、重要な問題あり
 - 1-2点：非常に劣る、基本的に使用不可""",
-                "system_optimize": """あなたはプロンプトの最適化と再構築に特化し、業界標準レベルの品質を実現するトップレベルのプロンプトエンジニアリング専門家です。
+        "system_optimize": """あなたはプロンプトの最適化と再構築に特化し、業界標準レベルの品質を実現するトップレベルのプロンプトエンジニアリング専門家です。
 
 最適化原則：
 1. 元の意図を変更せず維持する
@@ -244,7 +226,7 @@ Please provide the complete optimized prompt directly, without additional explan
 6. 専門的な言語表現を最適化する
 
 現代のプロンプトエンジニアリングベストプラクティスに基づいて最適化してください。""",
-                "user_optimize": """以下のプロンプトを専門レベルの高品質プロンプト基準に最適化してください。
+        "user_optimize": """以下のプロンプトを専門レベルの高品質プロンプト基準に最適化してください。
 
 ## 元のプロンプト：
 ```
@@ -265,33 +247,100 @@ Please provide the complete optimized prompt directly, without additional explan
 - 具体的で直接実行可能な指示
 - 標準的なフォーマット規約に従う
 - 論理的で明確に定義されたステップ""",
-                "role_added": "✓ 役割定義最適化：",
-                "format_added": "✓ 出力形式標準化：",
-                "reasoning_added": "✓ 推論プロセス構造化",
-                "final_improvement": "✓ 全体構造と専門性を包括的に向上し、工業レベルのプロンプトエンジニアリング基準を満たす"
-            }
-        }
+        "role_added": "✓ 役割定義最適化：",
+        "format_added": "✓ 出力形式標準化：",
+        "reasoning_added": "✓ 推論プロセス構造化",
+        "final_improvement": "✓ 全体構造と専門性を包括的に向上し、工業レベルのプロンプトエンジニアリング基準を満たす"
+    }
+}
+
+
+class PromptEvaluator:
+    """提示評估類，用於分析和優化提示"""
+    
+    def __init__(self, llm_type="claude", llm_instance=None, prompt_loader=None, prompt_registry=None,
+                 session_key=None, **llm_kwargs):
+        """初始化評估器
+        
+        Args:
+            llm_type: LLM 類型
+            llm_instance: 可選的 LLM 實例
+            prompt_loader: 可選的 PromptLoader 實例（默認使用單例）
+            prompt_registry: 可選的 PromptVersionRegistry（未指定 prompt_loader 時默認使用 config 中的設定）
+            session_key: 可選的會話 ID，作為多版本分流的固定 key（同一會話的評估器選到同一版本）
+            **llm_kwargs: LLM 初始化參數
+        """
+        if llm_instance:
+            self.llm = llm_instance
+        else:
+            self.llm = LLMFactory.create_llm(llm_type, **llm_kwargs)
+        
+        # Use provided loader or get default singleton
+        self.prompt_loader = prompt_loader if prompt_loader else get_default_loader()
+        
+        # 多版本 prompt 分流（僅在未指定 prompt_loader 時套用 config 設定）
+        if prompt_registry is None and prompt_loader is None:
+            prompt_registry = get_default_registry()
+        self.prompt_registry = prompt_registry
+        self.session_key = session_key
+        # 第一次選到的版本固定於此評估器，分析與優化使用同一版本（權重熱重載後亦然）
+        self._prompt_version = None
+        
+        # Legacy translations are shared at module level (no per-instance rebuild)
+        self.translations = LEGACY_TRANSLATIONS
     
     def t(self, key, language="zh_TW"):
         """獲取翻譯 - 向後兼容方法，現在從 PromptLoader 獲取"""
         # Try to get from YAML first, fallback to old dict
         if key == "system_analyze":
-            return self.prompt_loader.get_system_prompt('analyze', language)
+            return self._select_prompt_version()[1].get_system_prompt('analyze', language)
         elif key == "system_optimize":
-            return self.prompt_loader.get_system_prompt('optimize', language)
+            return self._select_prompt_version()[1].get_system_prompt('optimize', language)
         elif key in ["role_added", "format_added", "reasoning_added", "final_improvement"]:
-            return self.prompt_loader.get_improvement_message(key, language)
+            return self._select_prompt_version()[1].get_improvement_message(key, language)
         else:
             # Fallback to old dict
             return self.translations.get(language, self.translations["zh_TW"]).get(key, key)
     
+    def _select_prompt_version(self):
+        """選擇本次請求使用的 prompt 版本，回傳 (版本名稱或 None, PromptLoader)"""
+        if not self.prompt_registry:
+            return None, self.prompt_loader
+        if self._prompt_version is None:
+            self._prompt_version = self.prompt_registry.choose(self.session_key)[0]
+        return self._prompt_version, self.prompt_registry.get_loader(self._prompt_version)
+    
+    def _invoke_with_metrics(self, version, operation, **invoke_kwargs):
+        """調用 LLM；啟用多版本分流時記錄延遲與輸出 tokens"""
+        start_time = time.time()
+        try:
+            result = self.llm.invoke(**invoke_kwargs)
+        except Exception:
+            if version:
+                self.prompt_registry.record(version, operation, time.time() - start_time, error=True)
+            raise
+        return result, time.time() - start_time
+    
+    def _record_metrics(self, version, operation, result, latency, parse_failed=False, scores=None):
+        """記錄一次成功調用的 per-version 指標"""
+        if version:
+            usage = result.get("usage") or {}
+            self.prompt_registry.record(
+                version, operation, latency,
+                output_tokens=usage.get("output_tokens", 0) or 0,
+                parse_failed=parse_failed,
+                scores=scores
+            )
+    
     def analyze_prompt(self, prompt, language="zh_TW"):
         """分析提示並識別可改進的區域"""
         # Use PromptLoader to get prompts
-        system_instruction = self.prompt_loader.get_system_prompt('analyze', language)
-        user_prompt = self.prompt_loader.get_user_prompt('analyze', language, prompt=prompt)
+        version, loader = self._select_prompt_version()
+        system_instruction = loader.get_system_prompt('analyze', language)
+        user_prompt = loader.get_user_prompt('analyze', language, prompt=prompt)
 
-        result = self.llm.invoke(
+        result, latency = self._invoke_with_metrics(
+            version, 'analyze',
             prompt=user_prompt,
             system_prompt=system_instruction,
             temperature=0.3,  # 提高靈活性（從 0.1 → 0.3）
@@ -319,12 +368,14 @@ Please provide the complete optimized prompt directly, without additional explan
             # 記錄成功解析
             logger.info(f"Successfully parsed analysis JSON. Scores: {analysis.get('completeness_score')}/{analysis.get('clarity_score')}/{analysis.get('structure_score')}/{analysis.get('specificity_score')}")
 
+            self._record_metrics(version, 'analyze', result, latency, scores=analysis)
             return analysis
 
         except Exception as e:
             # 記錄解析失敗的原因和內容
             logger.error(f"Failed to parse analysis JSON: {e}")
             logger.debug(f"Raw LLM response: {result.get('content', 'N/A')[:500]}")
+            self._record_metrics(version, 'analyze', result, latency, parse_failed=True)
 
             # 返回簡化的分析（包含新的欄位）
             return {
@@ -340,36 +391,37 @@ Please provide the complete optimized prompt directly, without additional explan
             }
     
     def generate_questions(self, analysis, language="zh_TW"):
-        """根據分析結果智能生成改進問題 - 使用 PromptLoader"""
-        # Use PromptLoader's dynamic question generation
-        return self.prompt_loader.get_dynamic_questions(analysis, language)
+        """根據分析結果智能生成改進問題 - 使用本會話固定版本的 PromptLoader"""
+        _, loader = self._select_prompt_version()
+        return loader.get_dynamic_questions(analysis, language)
     
     def optimize_prompt(self, original_prompt, user_responses, analysis, language="zh_TW"):
         """基於用戶回答和分析生成優化提示 - 使用 PromptLoader"""
+        version, loader = self._select_prompt_version()
         enhanced_prompt = original_prompt
         improvements = []
         
         # 添加角色定義
         if "role" in user_responses and user_responses["role"]:
-            role_text = self.prompt_loader.get_optimization_strategy(
+            role_text = loader.get_optimization_strategy(
                 'role_enhancement', language, role=user_responses['role']
             )
             if role_text:
-                improvements.append(f"{self.prompt_loader.get_improvement_message('role_added', language)}{role_text}")
+                improvements.append(f"{loader.get_improvement_message('role_added', language)}{role_text}")
                 enhanced_prompt = role_text + "\n\n" + enhanced_prompt
         
         # 添加輸出格式
         if "format" in user_responses and user_responses["format"]:
-            format_text = self.prompt_loader.get_optimization_strategy(
+            format_text = loader.get_optimization_strategy(
                 'format_specification', language, format=user_responses['format']
             )
             if format_text:
-                improvements.append(f"{self.prompt_loader.get_improvement_message('format_added', language)}{format_text}")
+                improvements.append(f"{loader.get_improvement_message('format_added', language)}{format_text}")
                 enhanced_prompt += format_text
         
         # 添加詳細程度指示
         if "detail" in user_responses and user_responses["detail"]:
-            detail_text = self.prompt_loader.get_optimization_strategy(
+            detail_text = loader.get_optimization_strategy(
                 'detail_specification', language, detail=user_responses['detail']
             )
             if detail_text:
@@ -378,7 +430,7 @@ Please provide the complete optimized prompt directly, without additional explan
         
         # 添加範圍和深度指示
         if "scope" in user_responses and user_responses["scope"]:
-            scope_text = self.prompt_loader.get_optimization_strategy(
+            scope_text = loader.get_optimization_strategy(
                 'scope_specification', language, scope=user_responses['scope']
             )
             if scope_text:
@@ -387,18 +439,19 @@ Please provide the complete optimized prompt directly, without additional explan
         
         # 添加思考過程指示
         if "reasoning" in user_responses and user_responses["reasoning"]:
-            reasoning_text = self.prompt_loader.get_optimization_strategy(
+            reasoning_text = loader.get_optimization_strategy(
                 'reasoning_process', language
             )
             if reasoning_text:
-                improvements.append(self.prompt_loader.get_improvement_message("reasoning_added", language))
+                improvements.append(loader.get_improvement_message("reasoning_added", language))
                 enhanced_prompt += reasoning_text
         
         # 使用 LLM 進一步優化提示
-        system_instruction = self.prompt_loader.get_system_prompt('optimize', language)
-        user_prompt = self.prompt_loader.get_user_prompt('optimize', language, prompt=enhanced_prompt)
+        system_instruction = loader.get_system_prompt('optimize', language)
+        user_prompt = loader.get_user_prompt('optimize', language, prompt=enhanced_prompt)
         
-        result = self.llm.invoke(
+        result, latency = self._invoke_with_metrics(
+            version, 'optimize',
             prompt=user_prompt,
             system_prompt=system_instruction,
             temperature=0.1,
@@ -406,9 +459,10 @@ Please provide the complete optimized prompt directly, without additional explan
             top_k=40,
             max_tokens=max_token_length
         )
+        self._record_metrics(version, 'optimize', result, latency)
         
         # 添加一個最終改進說明
-        improvements.append(self.prompt_loader.get_improvement_message("final_improvement", language))
+        improvements.append(loader.get_improvement_message("final_improvement", language))
         
         return {
             "enhanced_prompt": result["content"],
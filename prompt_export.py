@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Prompt Export - Streaming export of the prompt library
+Encodes prompts one at a time as chunked JSON (same layout as the v1.0
+export) or JSONL, optionally gzip-compressed, so memory use does not grow
+with the size of the library
+"""
+
+import json
+import zlib
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, Optional
+
+EXPORT_VERSION = "1.0"
+
+# "json": the v1.0 document ({"version", "exported_at", "prompts": [...], "prompt_count"})
+# "jsonl": a header line followed by one prompt per line
+EXPORT_FORMATS = ("json", "jsonl")
+
+# Output is re-chunked to roughly this many bytes before compression / yielding
+CHUNK_SIZE = 64 * 1024
+
+_MIME_TYPES = {
+    "json": "application/json",
+    "jsonl": "application/x-ndjson",
+}
+
+
+def iter_export(
+    prompts: Iterable[Dict],
+    fmt: str = "json",
+    compress: bool = False,
+    chunk_size: int = CHUNK_SIZE
+) -> Iterator[bytes]:
+    """
+    Encode prompts as an export byte stream
+
+    Args:
+        prompts: Prompt dicts (consumed lazily, e.g. from a database cursor)
+        fmt: "json" or "jsonl"
+        compress: Whether to gzip the stream
+        chunk_size: Approximate size of each yielded chunk
+
+    Returns:
+        Iterator of byte chunks
+
+    Raises:
+        ValueError: If the format is unknown
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {fmt} (expected one of {EXPORT_FORMATS})")
+
+    pieces = _iter_json(prompts) if fmt == "json" else _iter_jsonl(prompts)
+    chunks = _rechunk(pieces, chunk_size)
+    return _gzip(chunks) if compress else chunks
+
+
+def export_filename(fmt: str = "json", compress: bool = False, stem: str = "prompts_backup") -> str:
+    """Download file name for an export (e.g. prompts_backup.jsonl.gz)"""
+    return f"{stem}.{fmt}" + (".gz" if compress else "")
+
+
+def export_mime_type(fmt: str = "json", compress: bool = False) -> str:
+    """MIME type for an export"""
+    return "application/gzip" if compress else _MIME_TYPES[fmt]
+
+
+def _header(fmt: Optional[str] = None) -> Dict:
+    header = {"version": EXPORT_VERSION, "exported_at": datetime.now().isoformat()}
+    if fmt:
+        header["format"] = fmt
+    return header
+
+
+def _iter_json(prompts: Iterable[Dict]) -> Iterator[str]:
+    """v1.0 JSON document, one prompt per line; prompt_count is written last"""
+    header = _header()
+    yield "{\n"
+    for key, value in header.items():
+        yield f'  {json.dumps(key)}: {json.dumps(value, ensure_ascii=False)},\n'
+    yield '  "prompts": ['
+
+    count = 0
+    for prompt in prompts:
+        yield ("\n    " if count == 0 else ",\n    ") + json.dumps(prompt, ensure_ascii=False)
+        count += 1
+
+    yield ("\n  ],\n" if count else "],\n") + f'  "prompt_count": {count}\n}}\n'
+
+
+def _iter_jsonl(prompts: Iterable[Dict]) -> Iterator[str]:
+    """Header line ({"version", "exported_at", "format": "jsonl"}) then one prompt per line"""
+    yield json.dumps(_header("jsonl"), ensure_ascii=False) + "\n"
+    for prompt in prompts:
+        yield json.dumps(prompt, ensure_ascii=False) + "\n"
+
+
+def _rechunk(pieces: Iterable[str], chunk_size: int) -> Iterator[bytes]:
+    """Join small text pieces into UTF-8 chunks of about chunk_size bytes"""
+    buffer = []
+    size = 0
+    for piece in pieces:
+        data = piece.encode("utf-8")
+        buffer.append(data)
+        size += len(data)
+        if size >= chunk_size:
+            yield b"".join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield b"".join(buffer)
+
+
+def _gzip(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """gzip-compress a byte stream incrementally"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Prompt History - Delta encoding of prompt version lineages
+A saved prompt's lineage (original -> optimization iterations -> final) is
+stored as full copies only at a few keyframes; every other version is a
+token-level delta against the version before it
+"""
+
+import difflib
+import json
+import re
+import zlib
+from typing import Any, Callable, Dict, List, Optional, Sequence, Union
+
+# Version kinds, in lineage order
+KIND_ORIGINAL = "original"
+KIND_ITERATION = "iteration"
+KIND_FINAL = "final"
+
+# Longest run of deltas before a full copy is stored again (bounds retrieval cost)
+MAX_DELTA_CHAIN = 8
+
+# ASCII words and whitespace runs stay whole; everything else (CJK included)
+# is one token per character, so edits inside zh_TW / ja sentences stay small
+_TOKEN_RE = re.compile(r"[A-Za-z0-9_]+|\s+|.", re.S)
+
+# Delta operations: [start, end] copies base tokens, a str inserts text
+DeltaOp = Union[List[int], str]
+
+
+def tokenize(text: str) -> List[str]:
+    """Split text into the tokens deltas are expressed in"""
+    return _TOKEN_RE.findall(text)
+
+
+def encode_delta(base: str, target: str) -> List[DeltaOp]:
+    """
+    Express target as copies of base token ranges plus inserted text
+
+    Returns:
+        List of operations ([start, end] or inserted str)
+    """
+    base_tokens = tokenize(base)
+    target_tokens = tokenize(target)
+    matcher = difflib.SequenceMatcher(None, base_tokens, target_tokens, autojunk=False)
+    ops: List[DeltaOp] = []
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            ops.append([i1, i2])
+        elif j2 > j1:
+            ops.append("".join(target_tokens[j1:j2]))
+    return ops
+
+
+def apply_delta(base: str, ops: Sequence[DeltaOp]) -> str:
+    """Rebuild a version from its base and the operations from encode_delta"""
+    base_tokens = tokenize(base)
+    return "".join(op if isinstance(op, str) else "".join(base_tokens[op[0]:op[1]]) for op in ops)
+
+
+def version_kind(index: int, count: int) -> str:
+    """Kind of the index-th (0-based) version in a lineage of count versions"""
+    if index == count - 1:
+        return KIND_FINAL
+    return KIND_ORIGINAL if index == 0 else KIND_ITERATION
+
+
+def encode_history(
+    texts: Sequence[str],
+    size_of: Optional[Callable[[Union[str, List[DeltaOp]]], int]] = None
+) -> List[Dict[str, Any]]:
+    """
+    Delta-encode a lineage
+
+    The original and the final version are always stored in full, as is any
+    version whose delta would not be smaller than a full copy, or that ends
+    a run of MAX_DELTA_CHAIN deltas.
+
+    Args:
+        texts: Version bodies, oldest first (original ... final)
+        size_of: Bytes a full copy (str) or a delta (op list) takes in the
+                 backend's storage format (default: stored_size)
+
+    Returns:
+        One entry per version: {"version", "kind", "size", "text"} for full
+        copies, {"version", "kind", "size", "delta"} for deltas
+        ("version" is 1-based, "size" is the body's UTF-8 length)
+    """
+    size_of = size_of or stored_size
+    entries = []
+    chain = 0
+    for index, text in enumerate(texts):
+        entry = {"version": index + 1, "kind": version_kind(index, len(texts)), "size": len(text.encode("utf-8"))}
+        if 0 < index < len(texts) - 1 and chain < MAX_DELTA_CHAIN:
+            ops = encode_delta(texts[index - 1], text)
+            if size_of(ops) < size_of(text):
+                entry["delta"] = ops
+                entries.append(entry)
+                chain += 1
+                continue
+        entry["text"] = text
+        entries.append(entry)
+        chain = 0
+    return entries
+
+
+def stored_size(value: Union[str, Sequence[DeltaOp]]) -> int:
+    """Approximate size of a full copy (UTF-8 bytes) or a delta (inserted bytes plus a few per copy)"""
+    if isinstance(value, str):
+        return len(value.encode("utf-8"))
+    return sum(len(op.encode("utf-8")) if isinstance(op, str) else 8 for op in value)
+
+
+def pack_delta(ops: Sequence[DeltaOp]) -> bytes:
+    """Compact binary form of a delta (zlib-compressed JSON)"""
+    return zlib.compress(json.dumps(ops, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+
+
+def unpack_delta(data: bytes) -> List[DeltaOp]:
+    """Inverse of pack_delta"""
+    return json.loads(zlib.decompress(data).decode("utf-8"))
+
+
+def decode_version(entries: Sequence[Dict[str, Any]], version: int) -> Optional[str]:
+    """
+    Rebuild one version from encoded entries (see encode_history)
+
+    Only the entries from the nearest full copy up to the requested version
+    are read.
+
+    Returns:
+        Version body, or None if the version does not exist
+    """
+    by_version = {entry["version"]: entry for entry in entries}
+    if version not in by_version:
+        return None
+    start = version
+    while "text" not in by_version[start]:
+        start -= 1
+    text = by_version[start]["text"]
+    for number in range(start + 1, version + 1):
+        text = apply_delta(text, by_version[number]["delta"])
+    return text
+
+
+def diff_text(old: str, new: str, old_label: str = "", new_label: str = "", context: int = 3) -> str:
+    """Unified line diff between two versions"""
+    return "\n".join(difflib.unified_diff(
+        old.splitlines(),
+        new.splitlines(),
+        fromfile=old_label,
+        tofile=new_label,
+        n=context,
+        lineterm="",
+    ))
@@ -0,0 +1,368 @@
+#!/usr/bin/env python3
+"""
+Prompt Import - Incremental parsing and validation of library backups
+Reads v1.0 JSON exports and JSONL exports (optionally gzip-compressed)
+record by record, validates them on a worker thread and hands bounded
+batches to the storage backend, so memory use does not grow with the file
+"""
+
+import codecs
+import gzip
+import io
+import json
+import queue
+import threading
+import uuid
+from datetime import datetime
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Tuple, Union
+
+# Bytes read from the source per step
+READ_SIZE = 64 * 1024
+
+# Validated records handed to the writer at a time
+BATCH_SIZE = 1000
+
+# Largest single JSON value accepted (guards against unterminated strings)
+MAX_RECORD_CHARS = 32 * 1024 * 1024
+
+# Batches buffered between the validation worker and the writer
+MAX_PENDING_BATCHES = 4
+
+# Longest token a read can split so that decoding fails before the end of the
+# buffer: a literal ("fals"), a number ("1.5e") or a "\uXXXX\uXXXX" escape
+_SPLIT_TOKEN_CHARS = 12
+
+_GZIP_MAGIC = b"\x1f\x8b"
+_WHITESPACE = " \t\r\n"
+
+
+class ImportFormatError(ValueError):
+    """Raised when the backup file is not a prompt export"""
+
+
+class _CountingReader(io.RawIOBase):
+    """Wraps a binary stream and counts the bytes read from it"""
+
+    def __init__(self, stream: BinaryIO):
+        self.stream = stream
+        self.bytes_read = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        data = self.stream.read(len(buffer))
+        size = len(data)
+        buffer[:size] = data
+        self.bytes_read += size
+        return size
+
+
+class _TextBuffer:
+    """Incrementally decoded text with a moving read position"""
+
+    def __init__(self, stream: BinaryIO):
+        self.stream = stream
+        self.decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+        self.text = ""
+        self.pos = 0
+        # Characters of the file dropped from the front of text
+        self.offset = 0
+        self.eof = False
+
+    def fill(self) -> bool:
+        """Read more text; returns False at end of input"""
+        if self.eof:
+            return False
+        data = self.stream.read(READ_SIZE)
+        if not data:
+            self.eof = True
+            self.offset += self.pos
+            self.text = self.text[self.pos:] + self.decoder.decode(b"", final=True)
+            self.pos = 0
+            return False
+        # Drop consumed text so the buffer only ever holds about one record
+        self.offset += self.pos
+        self.text = self.text[self.pos:] + self.decoder.decode(data)
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """Next non-whitespace character ('' at end of input)"""
+        while True:
+            while self.pos < len(self.text) and self.text[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.text):
+                return self.text[self.pos]
+            if not self.fill():
+                return ""
+
+    def expect(self, char: str) -> None:
+        found = self.peek()
+        if found != char:
+            raise ImportFormatError(f"Expected {char!r}, got {found or 'end of file'!r}")
+        self.pos += 1
+
+    def value(self, decoder: json.JSONDecoder) -> Any:
+        """Decode one complete JSON value at the current position"""
+        self.peek()
+        while True:
+            try:
+                value, end = decoder.raw_decode(self.text, self.pos)
+                # A number at the end of the buffer may continue in the next read
+                if end < len(self.text) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError as e:
+                # A value cut by the read fails within a few characters of the
+                # end of the buffer (a number after its ".", a literal, an
+                # escape) or as an unterminated string; any other error is in
+                # the file itself
+                unterminated = e.msg.startswith("Unterminated string")
+                cut = unterminated or e.pos >= len(self.text) - _SPLIT_TOKEN_CHARS
+                if self.eof and (unterminated or e.pos >= len(self.text)):
+                    raise ImportFormatError("Invalid JSON format: unexpected end of file") from e
+                if self.eof or not cut or len(self.text) - self.pos > MAX_RECORD_CHARS:
+                    raise ImportFormatError(f"Invalid JSON format: {e.msg} (char {self.offset + e.pos})") from e
+            self.fill()
+
+    def line(self) -> Optional[str]:
+        """Next line without its terminator (None at end of input)"""
+        while True:
+            newline = self.text.find("\n", self.pos)
+            if newline >= 0:
+                line = self.text[self.pos:newline]
+                self.pos = newline + 1
+                return line
+            if not self.fill():
+                if self.pos >= len(self.text):
+                    return None
+                line = self.text[self.pos:]
+                self.pos = len(self.text)
+                return line
+
+
+def open_backup(source: Union[BinaryIO, bytes, str]) -> BinaryIO:
+    """
+    Open an export as a binary stream, transparently un-gzipping it
+
+    Args:
+        source: Binary file object (e.g. a Streamlit UploadedFile), bytes or str
+    """
+    if isinstance(source, str):
+        source = source.encode("utf-8")
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+
+    stream = io.BufferedReader(source) if not hasattr(source, "peek") else source
+    if stream.peek(2)[:2] == _GZIP_MAGIC:
+        return gzip.GzipFile(fileobj=stream, mode="rb")
+    return stream
+
+
+def iter_records(stream: BinaryIO) -> Iterator[Any]:
+    """
+    Yield raw prompt records from a v1.0 JSON export or a JSONL export
+
+    JSON exports are parsed key by key; the "prompts" array is streamed one
+    element at a time. JSONL exports may start with a header line
+    ({"format": "jsonl", ...}).
+
+    Raises:
+        ImportFormatError: If the file is malformed or has no prompts list
+    """
+    buffer = _TextBuffer(stream)
+    decoder = json.JSONDecoder()
+
+    first = buffer.peek()
+    if first == "[":
+        yield from _iter_array(buffer, decoder)
+        return
+    if first != "{":
+        raise ImportFormatError("Invalid JSON format: expected an object")
+
+    # A complete object on the first line means JSONL (header or first
+    # prompt); JSON exports start with "{\n"
+    newline = buffer.text.find("\n", buffer.pos)
+    while newline < 0 and len(buffer.text) - buffer.pos <= MAX_RECORD_CHARS and buffer.fill():
+        newline = buffer.text.find("\n", buffer.pos)
+    if newline >= 0:
+        first_line = buffer.text[buffer.pos:newline]
+        try:
+            head = json.loads(first_line)
+        except json.JSONDecodeError:
+            head = None
+        if isinstance(head, dict) and "prompts" not in head:
+            buffer.line()
+            if head.get("format") != "jsonl":
+                yield head
+            yield from _iter_jsonl(buffer)
+            return
+
+    # Objects without a "prompts" key import nothing (like the previous json.loads path)
+    buffer.expect("{")
+    if buffer.peek() != "}":
+        while True:
+            key = buffer.value(decoder)
+            buffer.expect(":")
+            if key == "prompts":
+                if buffer.peek() != "[":
+                    raise ImportFormatError("Invalid format: 'prompts' must be a list")
+                yield from _iter_array(buffer, decoder)
+            else:
+                buffer.value(decoder)
+
+            char = buffer.peek()
+            buffer.pos += 1
+            if char == "}":
+                break
+            if char != ",":
+                raise ImportFormatError(f"Invalid JSON format: expected ',' or '}}', got {char or 'end of file'!r}")
+
+
+def _iter_array(buffer: _TextBuffer, decoder: json.JSONDecoder) -> Iterator[Any]:
+    buffer.expect("[")
+    if buffer.peek() == "]":
+        buffer.pos += 1
+        return
+    while True:
+        yield buffer.value(decoder)
+        char = buffer.peek()
+        buffer.pos += 1
+        if char == "]":
+            return
+        if char != ",":
+            raise ImportFormatError(f"Invalid JSON format: expected ',' or ']', got {char or 'end of file'!r}")
+
+
+def _iter_jsonl(buffer: _TextBuffer) -> Iterator[Any]:
+    while True:
+        line = buffer.line()
+        if line is None:
+            return
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError:
+            # Counted as an invalid record; the rest of the file is still imported
+            yield None
+
+
+def validate_record(record: Any, now: str, generate_missing_id: bool = False) -> Dict[str, Any]:
+    """
+    Normalize one imported prompt
+
+    Args:
+        record: Raw record from the export
+        now: Timestamp used for missing created_at / updated_at
+        generate_missing_id: Assign a new UUID instead of rejecting records without an id
+
+    Returns:
+        Record with every column present (analysis_scores / tags are None when empty)
+
+    Raises:
+        ValueError: If the record cannot be imported
+    """
+    if not isinstance(record, dict):
+        raise ValueError("record is not an object")
+    prompt_id = record.get("id")
+    if not prompt_id and generate_missing_id:
+        prompt_id = str(uuid.uuid4())
+    if not prompt_id or not isinstance(prompt_id, str):
+        raise ValueError("missing id")
+
+    analysis_scores = record.get("analysis_scores")
+    if analysis_scores is not None and not isinstance(analysis_scores, dict):
+        raise ValueError("analysis_scores must be an object")
+    tags = record.get("tags")
+    if tags is not None and not (isinstance(tags, list) and all(isinstance(tag, str) for tag in tags)):
+        raise ValueError("tags must be a list of strings")
+
+    return {
+        "id": prompt_id,
+        "name": str(record.get("name") or "Imported"),
+        "original_prompt": str(record.get("original_prompt") or ""),
+        "optimized_prompt": str(record.get("optimized_prompt") or ""),
+        "analysis_scores": analysis_scores or None,
+        "tags": tags or None,
+        "language": str(record.get("language") or "zh_TW"),
+        "created_at": str(record.get("created_at") or now),
+        "updated_at": now,
+    }
+
+
+def iter_validated_batches(
+    source: Union[BinaryIO, bytes, str],
+    batch_size: int = BATCH_SIZE,
+    generate_missing_id: bool = False
+) -> Iterator[Tuple[List[Dict[str, Any]], int, int]]:
+    """
+    Parse and validate an export on a worker thread
+
+    The worker stays at most MAX_PENDING_BATCHES ahead of the consumer, so
+    peak memory is bounded by the batch size, not the file size.
+
+    Args:
+        source: Export file (see open_backup)
+        batch_size: Records per batch
+        generate_missing_id: See validate_record
+
+    Returns:
+        Iterator of (valid records, invalid record count, bytes read so far)
+
+    Raises:
+        ImportFormatError: If the file is not a prompt export
+    """
+    if isinstance(source, str):
+        source = source.encode("utf-8")
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    counter = _CountingReader(source)
+    stream = open_backup(io.BufferedReader(counter))
+    pending: "queue.Queue" = queue.Queue(maxsize=MAX_PENDING_BATCHES)
+    stop = threading.Event()
+    done = object()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                pending.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def worker() -> None:
+        now = datetime.now().isoformat()
+        batch: List[Dict[str, Any]] = []
+        invalid = 0
+        try:
+            for record in iter_records(stream):
+                try:
+                    batch.append(validate_record(record, now, generate_missing_id))
+                except ValueError:
+                    invalid += 1
+                if len(batch) >= batch_size:
+                    if not put((batch, invalid, counter.bytes_read)):
+                        return
+                    batch, invalid = [], 0
+            if batch or invalid:
+                put((batch, invalid, counter.bytes_read))
+            put(done)
+        except Exception as e:
+            put(e)
+
+    thread = threading.Thread(target=worker, name="PromptImportValidator", daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = pending.get()
+            if item is done:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        thread.join(timeout=5)
@@ -4,42 +4,196 @@ Prompt Loader - YAML-based Prompt Configuration Loader
 Loads and manages prompts from external YAML configuration files
 """
 
-import yaml
 import os
-from typing import Dict, Any, List, Optional
+import threading
+from dataclasses import dataclass
+from string import Formatter
+from typing import Dict, Any, Iterable, List, Mapping, Optional, Sequence, Tuple, Union
 from pathlib import Path
 import logging
 
+from config_watcher import FileWatcher
+from yaml_cache import load_yaml
+from prompt_conditions import (
+    ColumnCache, ConditionError, Never, Node, compile_condition, evaluate_batch, to_columns
+)
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Per-language sections substituted into user prompt templates at compile time
+STATIC_SECTIONS = ('output_format', 'scoring_criteria', 'optimization_requirements', 'output_instructions')
+
+# Fallback language used when a section has no entry for the requested language
+FALLBACK_LANGUAGE = 'zh_TW'
+
+_formatter = Formatter()
+
+
+def _count_tokens(text: str) -> int:
+    """Count tokens with the same encoder as LLMInvoker, falling back to an estimate"""
+    try:
+        import tiktoken
+        return len(tiktoken.get_encoding("cl100k_base").encode(text))
+    except Exception:
+        return len(text) // 4
+
+
+class CompiledTemplate:
+    """
+    A user prompt template compiled for one (prompt_type, language) pair
+
+    Static sections are resolved and pre-joined with the surrounding literal
+    text, so rendering only has to interleave the caller-supplied values.
+    """
+
+    __slots__ = ('prompt_type', 'language', 'placeholders', 'static_text', '_parts', '_static_tokens')
+
+    def __init__(self, prompt_type: str, language: str, template: str, sections: Dict[str, str]):
+        """
+        Compile a template
+
+        Args:
+            prompt_type: Type of prompt (e.g., 'analyze', 'optimize')
+            language: Language code the sections were resolved for
+            template: Raw str.format template
+            sections: Resolved static section values by placeholder name
+
+        Raises:
+            ValueError: If the template contains unsupported placeholders
+        """
+        self.prompt_type = prompt_type
+        self.language = language
+
+        parts: List[Any] = []
+        placeholders = []
+        buffer: List[str] = []
+
+        for literal, field_name, format_spec, conversion in _formatter.parse(template):
+            if literal:
+                buffer.append(literal)
+            if field_name is None:
+                continue
+            if not field_name.isidentifier():
+                raise ValueError(
+                    f"Unsupported placeholder '{{{field_name}}}' in {prompt_type} template "
+                    "(only named placeholders are allowed)"
+                )
+            if format_spec and ('{' in format_spec):
+                raise ValueError(f"Nested placeholder in format spec of '{{{field_name}}}' in {prompt_type} template")
+
+            if field_name in sections:
+                buffer.append(format(_formatter.convert_field(sections[field_name], conversion), format_spec))
+            else:
+                if buffer:
+                    parts.append(''.join(buffer))
+                    buffer = []
+                parts.append((field_name, conversion, format_spec))
+                placeholders.append(field_name)
+
+        if buffer:
+            parts.append(''.join(buffer))
+
+        self._parts = tuple(parts)
+        self.placeholders = frozenset(placeholders)
+        self.static_text = ''.join(part for part in parts if isinstance(part, str))
+        self._static_tokens: Optional[int] = None
+
+    @property
+    def static_token_count(self) -> int:
+        """Token count of the static part of the template (computed once)"""
+        if self._static_tokens is None:
+            self._static_tokens = _count_tokens(self.static_text)
+        return self._static_tokens
+
+    def render(self, **kwargs) -> str:
+        """
+        Render the template
+
+        Args:
+            **kwargs: Values for the template placeholders
+
+        Returns:
+            Rendered text
+
+        Raises:
+            KeyError: If a placeholder value is missing
+        """
+        if not self.placeholders:
+            return self.static_text
+
+        out = []
+        for part in self._parts:
+            if part.__class__ is str:
+                out.append(part)
+                continue
+            name, conversion, format_spec = part
+            value = kwargs[name]
+            if conversion:
+                value = _formatter.convert_field(value, conversion)
+            if format_spec or value.__class__ is not str:
+                value = format(value, format_spec)
+            out.append(value)
+        return ''.join(out)
+
+
+@dataclass(frozen=True)
+class PromptSnapshot:
+    """
+    Immutable view of one loaded prompt configuration
+    
+    Reloading builds a new snapshot and swaps the reference in a single
+    assignment, so readers never lock and never see a half-updated state.
+    The contained dicts must be treated as read-only.
+    """
+    prompts: Dict[str, Any]
+    templates: Dict[Tuple[str, str], CompiledTemplate]
+    conditions: Dict[str, Node]
+
 
 class PromptLoader:
     """Loads and manages prompts from YAML configuration files"""
     
-    def __init__(self, config_path: str = "resources/prompts/prompts.yaml"):
+    def __init__(self, config_path: str = "resources/prompts/prompts.yaml", use_cache: bool = True):
         """
         Initialize the prompt loader
         
         Args:
             config_path: Path to the prompts YAML file
+            use_cache: Reuse the parsed-YAML snapshot cache next to the file
         """
         self.config_path = Path(config_path)
-        self.prompts = {}
+        self.use_cache = use_cache
+        self._snapshot = PromptSnapshot({}, {}, {})
+        self._watcher: Optional[FileWatcher] = None
         self._load()
     
+    @property
+    def prompts(self) -> Dict[str, Any]:
+        """Raw prompt configuration of the current snapshot"""
+        return self._snapshot.prompts
+    
+    @property
+    def templates(self) -> Dict[Tuple[str, str], CompiledTemplate]:
+        """Compiled user prompt templates of the current snapshot"""
+        return self._snapshot.templates
+    
+    @property
+    def conditions(self) -> Dict[str, Node]:
+        """Compiled dynamic question conditions of the current snapshot"""
+        return self._snapshot.conditions
+    
     def _load(self) -> None:
         """Load prompts from YAML file"""
         try:
             if not self.config_path.exists():
                 logger.warning(f"Prompt config file not found: {self.config_path}")
                 logger.warning("Using empty configuration")
-                self.prompts = self._get_default_config()
+                self._snapshot = PromptSnapshot(self._get_default_config(), {}, {})
                 return
             
-            with open(self.config_path, 'r', encoding='utf-8') as f:
-                self.prompts = yaml.safe_load(f)
+            self._snapshot = self._build_snapshot()
             
             logger.info(f"Loaded prompts from {self.config_path}")
             logger.info(f"Version: {self.prompts.get('version', 'unknown')}")
@@ -48,7 +202,98 @@ class PromptLoader:
         except Exception as e:
             logger.error(f"Error loading prompts: {e}")
             logger.warning("Falling back to default configuration")
-            self.prompts = self._get_default_config()
+            self._snapshot = PromptSnapshot(self._get_default_config(), {}, {})
+    
+    def _build_snapshot(self) -> PromptSnapshot:
+        """
+        Parse and compile the YAML file into a new snapshot
+        
+        Returns:
+            New snapshot (not yet published)
+        
+        Raises:
+            Exception: If the file cannot be read or parsed
+        """
+        prompts = load_yaml(self.config_path, self.use_cache)
+        
+        if not isinstance(prompts, dict):
+            raise ValueError(f"Prompt config must be a mapping, got {type(prompts).__name__}")
+        
+        return PromptSnapshot(
+            prompts=prompts,
+            templates=self._compile_templates(prompts),
+            conditions=self._compile_conditions(prompts)
+        )
+    
+    def _compile_templates(self, prompts: Dict[str, Any]) -> Dict[Tuple[str, str], CompiledTemplate]:
+        """
+        Compile every user prompt template for every language it supports
+        
+        Invalid templates are logged and left out, so rendering them returns ""
+        just like a failed str.format did before.
+        
+        Args:
+            prompts: Parsed prompt configuration
+        
+        Returns:
+            Compiled templates keyed by (prompt_type, language)
+        """
+        templates = {}
+        declared_languages = prompts.get('languages') or []
+        
+        for prompt_type, prompt_config in (prompts.get('user_prompts') or {}).items():
+            try:
+                template = prompt_config['template']
+                languages = set(declared_languages) | {FALLBACK_LANGUAGE}
+                for section in STATIC_SECTIONS:
+                    if section in prompt_config:
+                        languages.update(prompt_config[section].keys())
+                
+                for language in languages:
+                    sections = {
+                        section: prompt_config[section].get(
+                            language, prompt_config[section].get(FALLBACK_LANGUAGE, '')
+                        )
+                        for section in STATIC_SECTIONS
+                        if section in prompt_config
+                    }
+                    templates[(prompt_type, language)] = CompiledTemplate(
+                        prompt_type, language, template, sections
+                    )
+            except Exception as e:
+                logger.error(f"Error compiling user prompt '{prompt_type}': {e}")
+        
+        return templates
+    
+    def _compile_conditions(self, prompts: Dict[str, Any]) -> Dict[str, Node]:
+        """
+        Compile every dynamic question condition, ordered by priority (higher first)
+        
+        Malformed conditions are logged and never match.
+        
+        Args:
+            prompts: Parsed prompt configuration
+        
+        Returns:
+            Compiled conditions keyed by question type
+        """
+        dynamic_questions = prompts.get('dynamic_questions') or {}
+        ordered = sorted(
+            dynamic_questions.items(),
+            key=lambda item: item[1].get('priority', 5),
+            reverse=True
+        )
+        
+        conditions = {}
+        for q_type, config in ordered:
+            condition = config.get('condition', '')
+            try:
+                conditions[q_type] = compile_condition(condition)
+            except ConditionError as e:
+                logger.error(f"Error compiling condition '{condition}' for '{q_type}': {e}")
+                conditions[q_type] = Never()
+        
+        return conditions
     
     def _get_default_config(self) -> Dict:
         """Get minimal default configuration as fallback"""
@@ -97,38 +342,7 @@ class PromptLoader:
             Rendered user prompt text
         """
         try:
-            prompt_config = self.prompts['user_prompts'][prompt_type]
-            template = prompt_config['template']
-            
-            # Get language-specific content
-            render_vars = kwargs.copy()
-            
-            # Add output_format if exists
-            if 'output_format' in prompt_config:
-                render_vars['output_format'] = prompt_config['output_format'].get(
-                    language, prompt_config['output_format'].get('zh_TW', '')
-                )
-            
-            # Add scoring_criteria if exists
-            if 'scoring_criteria' in prompt_config:
-                render_vars['scoring_criteria'] = prompt_config['scoring_criteria'].get(
-                    language, prompt_config['scoring_criteria'].get('zh_TW', '')
-                )
-            
-            # Add optimization_requirements if exists
-            if 'optimization_requirements' in prompt_config:
-                render_vars['optimization_requirements'] = prompt_config['optimization_requirements'].get(
-                    language, prompt_config['optimization_requirements'].get('zh_TW', '')
-                )
-            
-            # Add output_instructions if exists
-            if 'output_instructions' in prompt_config:
-                render_vars['output_instructions'] = prompt_config['output_instructions'].get(
-                    language, prompt_config['output_instructions'].get('zh_TW', '')
-                )
-            
-            # Render template
-            return template.format(**render_vars)
+            return self.get_template(prompt_type, language).render(**kwargs)
         
         except KeyError as e:
             logger.warning(f"User prompt not found: {prompt_type}/{language} - {e}")
@@ -137,6 +351,60 @@ class PromptLoader:
             logger.error(f"Error rendering user prompt: {e}")
             return ""
     
+    def get_template(self, prompt_type: str, language: str = "zh_TW") -> CompiledTemplate:
+        """
+        Get the compiled user prompt template for a type and language
+        
+        Languages without their own sections resolve to the zh_TW fallback.
+        
+        Args:
+            prompt_type: Type of prompt (e.g., 'analyze', 'optimize')
+            language: Language code
+        
+        Returns:
+            Compiled template
+        
+        Raises:
+            KeyError: If no template was compiled for the prompt type
+        """
+        templates = self.templates
+        compiled = templates.get((prompt_type, language))
+        if compiled is None:
+            compiled = templates[(prompt_type, FALLBACK_LANGUAGE)]
+        return compiled
+    
+    def render_many(
+        self,
+        prompt_type: str,
+        language: str = "zh_TW",
+        variables: Iterable[Dict[str, Any]] = ()
+    ) -> List[str]:
+        """
+        Render one user prompt template for many sets of variables
+        
+        Args:
+            prompt_type: Type of prompt (e.g., 'analyze', 'optimize')
+            language: Language code
+            variables: Iterable of placeholder dicts, one per prompt
+        
+        Returns:
+            Rendered prompts in input order ("" for entries that fail to render)
+        """
+        try:
+            render = self.get_template(prompt_type, language).render
+        except KeyError as e:
+            logger.warning(f"User prompt not found: {prompt_type}/{language} - {e}")
+            return ["" for _ in variables]
+        
+        results = []
+        for render_vars in variables:
+            try:
+                results.append(render(**render_vars))
+            except Exception as e:
+                logger.error(f"Error rendering user prompt: {e}")
+                results.append("")
+        return results
+    
     def get_dynamic_questions(
         self, 
         analysis: Dict[str, Any], 
@@ -153,52 +421,105 @@ class PromptLoader:
             List of questions with type and text
         """
         questions = []
+        snapshot = self._snapshot
         
         try:
-            dynamic_questions = self.prompts.get('dynamic_questions', {})
-            
-            for q_type, config in dynamic_questions.items():
-                condition = config.get('condition', '')
-
-                # Evaluate condition
-                if self._evaluate_condition(condition, analysis):
-                    question_text = config['questions'].get(
-                        language,
-                        config['questions'].get('zh_TW', '')
-                    )
-
-                    question_obj = {
-                        "question": question_text,
-                        "type": q_type,
-                        "priority": config.get('priority', 5),
-                        "input_type": config.get('type', 'text_input')  # 支持 text_input 或 selectbox
-                    }
-
-                    # 如果是 selectbox,添加選項和預設值
-                    if config.get('type') == 'selectbox' and 'options' in config:
-                        question_obj['options'] = [
-                            {
-                                'key': opt['key'],
-                                'label': opt.get(language, opt.get('zh_TW', opt['key']))
-                            }
-                            for opt in config['options']
-                        ]
-                        question_obj['default'] = config.get('default', '')
-
-                    questions.append(question_obj)
+            dynamic_questions = snapshot.prompts.get('dynamic_questions', {})
             
-            # Sort by priority (higher first)
-            questions.sort(key=lambda x: x.get('priority', 5), reverse=True)
+            # Conditions are compiled in priority order, so no sort is needed here
+            for q_type, condition in snapshot.conditions.items():
+                if condition.evaluate(analysis):
+                    questions.append(self._build_question(q_type, dynamic_questions[q_type], language))
         
         except Exception as e:
             logger.error(f"Error generating dynamic questions: {e}")
         
         return questions
     
+    def get_dynamic_questions_batch(
+        self,
+        analyses: Union[Sequence[Dict[str, Any]], Mapping[str, Sequence[Any]]],
+        language: str = "zh_TW"
+    ) -> List[List[Dict[str, str]]]:
+        """
+        Generate dynamic questions for many analyses in one vectorized pass
+        
+        Args:
+            analyses: List of analysis dicts, or a columnar batch
+                      (field name -> list/array of values, all of equal length)
+            language: Language code
+        
+        Returns:
+            One question list per analysis, in input order
+        """
+        snapshot = self._snapshot
+        
+        if isinstance(analyses, Mapping):
+            columns = analyses
+            size = len(next(iter(columns.values()))) if columns else 0
+        else:
+            fields = set()
+            for condition in snapshot.conditions.values():
+                fields |= condition.fields
+            columns = to_columns(analyses, sorted(fields))
+            size = len(analyses)
+        
+        if size == 0:
+            return []
+        
+        try:
+            dynamic_questions = snapshot.prompts.get('dynamic_questions', {})
+            cache = ColumnCache(columns, size)
+            masks = [
+                (self._build_question(q_type, dynamic_questions[q_type], language),
+                 evaluate_batch(condition, columns, size, cache))
+                for q_type, condition in snapshot.conditions.items()
+            ]
+        
+        except Exception as e:
+            logger.error(f"Error generating dynamic questions: {e}")
+            return [[] for _ in range(size)]
+        
+        results: List[List[Dict[str, str]]] = [[] for _ in range(size)]
+        for question, mask in masks:
+            for row in mask.nonzero()[0]:
+                results[row].append(dict(question))
+        return results
+    
+    def _build_question(self, q_type: str, config: Dict[str, Any], language: str) -> Dict[str, Any]:
+        """Build the question object for one dynamic question type"""
+        question_text = config['questions'].get(
+            language,
+            config['questions'].get('zh_TW', '')
+        )
+        
+        question_obj = {
+            "question": question_text,
+            "type": q_type,
+            "priority": config.get('priority', 5),
+            "input_type": config.get('type', 'text_input')  # 支持 text_input 或 selectbox
+        }
+        
+        # 如果是 selectbox,添加選項和預設值
+        if config.get('type') == 'selectbox' and 'options' in config:
+            question_obj['options'] = [
+                {
+                    'key': opt['key'],
+                    'label': opt.get(language, opt.get('zh_TW', opt['key']))
+                }
+                for opt in config['options']
+            ]
+            question_obj['default'] = config.get('default', '')
+        
+        return question_obj
+    
     def _evaluate_condition(self, condition: str, analysis: Dict[str, Any]) -> bool:
         """
         Evaluate a condition expression
         
+        Supports comparisons (<, <=, >, >=, ==, !=), "in"/"not in" lists,
+        AND / OR / NOT and parentheses. See prompt_conditions.py.
+        
         Args:
             condition: Condition string (e.g., "completeness_score < 7")
             analysis: Analysis dict with scores
@@ -207,37 +528,7 @@ class PromptLoader:
             True if condition is met
         """
         try:
-            # Simple evaluation for common conditions
-            # Security: Only allow simple comparison expressions
-            
-            # Check for score comparisons
-            if '<' in condition:
-                parts = condition.split('<')
-                if len(parts) == 2:
-                    key = parts[0].strip()
-                    threshold = float(parts[1].strip())
-                    return analysis.get(key, 10) < threshold
-            
-            # Check for "in" conditions (for complexity_level)
-            if ' in ' in condition:
-                parts = condition.split(' in ')
-                if len(parts) == 2:
-                    key = parts[0].strip()
-                    # Parse list from string like "['複雜', 'Complex', '複雑']"
-                    values_str = parts[1].strip()
-                    if values_str.startswith('[') and values_str.endswith(']'):
-                        # Simple parsing - extract quoted strings
-                        import re
-                        values = re.findall(r"'([^']*)'", values_str)
-                        return analysis.get(key, '') in values
-            
-            # Check for "OR" conditions
-            if ' OR ' in condition:
-                subconditions = condition.split(' OR ')
-                return any(self._evaluate_condition(sc.strip(), analysis) for sc in subconditions)
-            
-            return False
-        
+            return compile_condition(condition).evaluate(analysis)
         except Exception as e:
             logger.error(f"Error evaluating condition '{condition}': {e}")
             return False
@@ -300,10 +591,50 @@ class PromptLoader:
             logger.error(f"Error getting improvement message '{message_key}': {e}")
             return ""
     
-    def reload(self) -> None:
-        """Reload prompts from file (hot reload)"""
+    def reload(self) -> bool:
+        """
+        Reload prompts from file (hot reload)
+        
+        The new file is parsed, compiled and validated before it replaces the
+        current snapshot; on any failure the current prompts stay in effect.
+        
+        Returns:
+            True if the new configuration was swapped in
+        """
         logger.info("Reloading prompts...")
-        self._load()
+        try:
+            snapshot = self._build_snapshot()
+        except Exception as e:
+            logger.error(f"Error reloading prompts, keeping version {self.get_version()}: {e}")
+            return False
+        
+        error = self._validate_snapshot(snapshot)
+        if error:
+            logger.error(f"Reloaded prompts are invalid, keeping version {self.get_version()}: {error}")
+            return False
+        
+        self._snapshot = snapshot
+        logger.info(f"Reloaded prompts from {self.config_path} (version {self.get_version()})")
+        return True
+    
+    def start_watching(self, interval: float = 2.0) -> None:
+        """
+        Watch the YAML file and hot reload it on change
+        
+        Parsing and validation run on the watcher thread; request threads
+        keep reading the previous snapshot until the swap.
+        
+        Args:
+            interval: Polling interval in seconds
+        """
+        if self._watcher is None:
+            self._watcher = FileWatcher(str(self.config_path), self.reload, interval)
+        self._watcher.start()
+    
+    def stop_watching(self) -> None:
+        """Stop watching the YAML file"""
+        if self._watcher is not None:
+            self._watcher.stop()
     
     def get_version(self) -> str:
         """Get configuration version"""
@@ -320,26 +651,59 @@ class PromptLoader:
         Returns:
             True if valid, False otherwise
         """
+        error = self._validate_snapshot(self._snapshot)
+        if error:
+            logger.error(error)
+            return False
+        
+        logger.info("Configuration validation passed")
+        return True
+    
+    def _validate_snapshot(self, snapshot: PromptSnapshot) -> Optional[str]:
+        """
+        Validate a snapshot's structure
+        
+        Args:
+            snapshot: Snapshot to validate
+        
+        Returns:
+            Error message, or None if valid
+        """
         required_keys = ['version', 'languages', 'system_prompts', 'user_prompts']
         
         for key in required_keys:
-            if key not in self.prompts:
-                logger.error(f"Missing required key: {key}")
-                return False
+            if key not in snapshot.prompts:
+                return f"Missing required key: {key}"
         
-        logger.info("Configuration validation passed")
-        return True
+        for prompt_type in snapshot.prompts.get('user_prompts') or {}:
+            if (prompt_type, FALLBACK_LANGUAGE) not in snapshot.templates:
+                return f"User prompt template failed to compile: {prompt_type}"
+        
+        return None
 
 
 # Singleton instance for global access
 _default_loader = None
+_default_loader_lock = threading.Lock()
 
 
 def get_default_loader() -> PromptLoader:
-    """Get default singleton prompt loader instance"""
+    """
+    Get default singleton prompt loader instance
+    
+    Starts hot reload when config.yaml sets prompts.hot_reload.
+    """
     global _default_loader
     if _default_loader is None:
-        _default_loader = PromptLoader()
+        with _default_loader_lock:
+            if _default_loader is None:
+                from config_loader import get_default_config_loader
+                
+                loader = PromptLoader()
+                config = get_default_config_loader()
+                if config.get('prompts.hot_reload', False):
+                    loader.start_watching(config.get('prompts.hot_reload_interval_seconds', 2.0))
+                _default_loader = loader
     return _default_loader
 
 
@@ -360,6 +724,11 @@ if __name__ == "__main__":
     user_prompt = loader.get_user_prompt('analyze', 'zh_TW', prompt="測試提示")
     print(user_prompt[:300] + "...")
     
+    print("\n=== Compiled Template (analyze, zh_TW) ===")
+    compiled = loader.get_template('analyze', 'zh_TW')
+    print(f"Placeholders: {sorted(compiled.placeholders)}")
+    print(f"Static tokens: {compiled.static_token_count}")
+    
     print("\n=== Dynamic Questions ===")
     test_analysis = {
         "completeness_score": 5,
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Prompt Maintenance - Background storage upkeep for the SQLite prompt library
+Runs PromptDatabase.maintain() on a daemon thread: a one-time switch to
+incremental auto_vacuum, sampled ANALYZE for the query planner, bounded
+incremental vacuum steps and size telemetry, all off the request path
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Hours between maintenance runs
+INTERVAL_HOURS = 6
+
+# Delay before the first run after start-up (after the first backup, if enabled)
+STARTUP_DELAY = 120.0
+
+
+class MaintenanceScheduler:
+    """Runs maintain() on one PromptDatabase every interval_hours on a daemon thread"""
+
+    def __init__(self, db, interval_hours: float = INTERVAL_HOURS, startup_delay: float = STARTUP_DELAY):
+        self.db = db
+        self.interval = interval_hours * 3600
+        self.startup_delay = startup_delay
+        self._lock = threading.Lock()
+        self._run_lock = threading.Lock()
+        self._report: Optional[Dict] = None
+        self._wake = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def last_report(self) -> Optional[Dict]:
+        """Result of the most recent run (None before the first one)"""
+        with self._lock:
+            return self._report
+
+    def run_maintenance(self) -> Dict:
+        """Run maintenance now, on the calling thread"""
+        with self._run_lock:
+            try:
+                report = self.db.maintain()
+            except sqlite3.Error as e:
+                logger.error(f"Maintenance of {self.db.db_path} failed: {e}")
+                report = {"error": str(e)}
+            else:
+                stats = report["stats"]
+                logger.info(f"Maintenance of {self.db.db_path}: {stats['file_size'] / 2 ** 20:.1f} MB, "
+                            f"{stats['free_ratio']:.1%} free, {report['reclaimed_pages']} pages reclaimed "
+                            f"in {report['duration']:.1f}s")
+            report["finished_at"] = datetime.now().isoformat(timespec="seconds")
+            with self._lock:
+                self._report = report
+            return report
+
+    def request_run(self) -> None:
+        """Ask the background thread to run maintenance as soon as possible"""
+        self._wake.set()
+
+    def _run(self) -> None:
+        """Scheduling loop"""
+        delay = self.startup_delay
+        while not self._stop_event.is_set():
+            self._wake.wait(delay)
+            if self._stop_event.is_set():
+                break
+            self._wake.clear()
+            self.run_maintenance()
+            delay = self.interval
+
+    def start(self) -> None:
+        """Start the scheduler on a daemon thread (no-op if already running)"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(
+            target=self._run, name=f"MaintenanceScheduler({os.path.basename(self.db.db_path)})", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the scheduler (a run in progress finishes first)"""
+        self._stop_event.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    @property
+    def is_running(self) -> bool:
+        """Whether the scheduler thread is alive"""
+        return self._thread is not None and self._thread.is_alive()
+
+
+_schedulers: Dict[str, MaintenanceScheduler] = {}
+_schedulers_lock = threading.Lock()
+
+
+def start_maintenance(db, interval_hours: float = INTERVAL_HOURS) -> MaintenanceScheduler:
+    """
+    Process-wide maintenance scheduler for a database file, started on first use
+
+    The first session's PromptDatabase is kept; maintain() runs on the
+    scheduler thread, which gets its own connection.
+    """
+    key = os.path.abspath(db.db_path)
+    with _schedulers_lock:
+        scheduler = _schedulers.get(key)
+        if scheduler is None:
+            scheduler = _schedulers[key] = MaintenanceScheduler(db, interval_hours)
+        scheduler.start()
+        return scheduler
@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+"""
+Prompt Registry - Versioned prompt configurations with traffic splitting
+Loads several prompt-config versions at once, splits analyze/optimize
+traffic between them by weight and records per-version metrics
+"""
+
+import json
+import random
+import hashlib
+import threading
+import logging
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from prompt_loader import PromptLoader
+
+logger = logging.getLogger(__name__)
+
+# Analysis fields aggregated as "resulting scores"
+SCORE_FIELDS = ("completeness_score", "clarity_score", "structure_score", "specificity_score")
+
+# Latency samples kept per (version, operation) for percentiles
+LATENCY_WINDOW = 1000
+
+
+class VersionMetrics:
+    """Running metrics for one (version, operation) pair"""
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.parse_failures = 0
+        self.output_tokens = 0
+        self.total_latency = 0.0
+        self.latencies: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self.score_sums: Dict[str, float] = {field: 0.0 for field in SCORE_FIELDS}
+        self.score_counts: Dict[str, int] = {field: 0 for field in SCORE_FIELDS}
+
+    def add(self, latency: float, output_tokens: int, error: bool,
+            parse_failed: bool, scores: Optional[Dict[str, Any]]) -> None:
+        """Add one observation"""
+        self.requests += 1
+        self.errors += int(error)
+        self.parse_failures += int(parse_failed)
+        self.output_tokens += output_tokens
+        self.total_latency += latency
+        self.latencies.append(latency)
+        # Fallback scores after a parse failure are placeholders, not results
+        if scores and not parse_failed:
+            for field in SCORE_FIELDS:
+                value = scores.get(field)
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    self.score_sums[field] += value
+                    self.score_counts[field] += 1
+
+    def summary(self) -> Dict[str, Any]:
+        """Aggregate view of the collected metrics"""
+        latencies = sorted(self.latencies)
+
+        def percentile(p: float) -> Optional[float]:
+            if not latencies:
+                return None
+            return latencies[min(len(latencies) - 1, int(p * len(latencies)))]
+
+        requests = self.requests or 1
+        scores = {
+            field: (self.score_sums[field] / self.score_counts[field]) if self.score_counts[field] else None
+            for field in SCORE_FIELDS
+        }
+        scored = [value for value in scores.values() if value is not None]
+
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "parse_failures": self.parse_failures,
+            "parse_failure_rate": self.parse_failures / requests,
+            "avg_latency": self.total_latency / requests,
+            "p50_latency": percentile(0.5),
+            "p95_latency": percentile(0.95),
+            "avg_output_tokens": self.output_tokens / requests,
+            "avg_scores": scores,
+            "avg_overall_score": sum(scored) / len(scored) if scored else None,
+        }
+
+
+class PromptVersionRegistry:
+    """
+    Holds several prompt-config versions and routes traffic between them
+
+    Versions are identified by the names used in the registry config (the
+    `version` field inside a YAML file is informational only).
+    """
+
+    def __init__(
+        self,
+        sources: Dict[str, str],
+        weights: Optional[Dict[str, float]] = None,
+        default_version: Optional[str] = None,
+        metrics_path: Optional[str] = None,
+        seed: Optional[int] = None
+    ):
+        """
+        Initialize the registry
+
+        Args:
+            sources: Version name -> prompts YAML path
+            weights: Version name -> traffic weight (missing versions get 0)
+            default_version: Version used when all weights are 0
+            metrics_path: Optional JSONL file every observation is appended to
+            seed: Optional random seed (for reproducible splits in batch jobs)
+        """
+        if not sources:
+            raise ValueError("PromptVersionRegistry needs at least one version")
+
+        self.loaders: Dict[str, PromptLoader] = {
+            name: PromptLoader(path) for name, path in sources.items()
+        }
+        self.default_version = default_version if default_version in self.loaders else next(iter(self.loaders))
+        self.metrics_path = Path(metrics_path) if metrics_path else None
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._metrics: Dict[Tuple[str, str], VersionMetrics] = {}
+        self.set_weights(weights or {self.default_version: 1.0})
+
+    def set_weights(self, weights: Dict[str, float]) -> None:
+        """
+        Replace the traffic weights
+
+        Args:
+            weights: Version name -> weight (negative or unknown entries are ignored)
+        """
+        cleaned = []
+        for name, weight in weights.items():
+            if name not in self.loaders:
+                logger.warning(f"Ignoring weight for unknown prompt version: {name}")
+                continue
+            if weight and weight > 0:
+                cleaned.append((name, float(weight)))
+
+        total = sum(weight for _, weight in cleaned)
+        cumulative = []
+        running = 0.0
+        for name, weight in cleaned:
+            running += weight / total
+            cumulative.append((running, name))
+
+        # Single assignment so choose() never sees a half-built table
+        self._cumulative = cumulative
+        logger.info(f"Prompt version weights: {dict(cleaned) or {self.default_version: 1.0}}")
+
+    def choose(self, key: Optional[str] = None) -> Tuple[str, PromptLoader]:
+        """
+        Pick a prompt version by weight
+
+        Args:
+            key: Optional sticky key (e.g. a session ID); the same key always
+                 maps to the same version while the weights are unchanged
+
+        Returns:
+            (version name, PromptLoader)
+        """
+        cumulative = self._cumulative
+        if not cumulative:
+            return self.default_version, self.loaders[self.default_version]
+
+        if key is not None:
+            digest = hashlib.sha256(key.encode('utf-8')).digest()
+            point = int.from_bytes(digest[:8], 'big') / 2 ** 64
+        else:
+            with self._lock:
+                point = self._random.random()
+
+        for threshold, name in cumulative:
+            if point < threshold:
+                return name, self.loaders[name]
+        name = cumulative[-1][1]
+        return name, self.loaders[name]
+
+    def get_loader(self, version: str) -> PromptLoader:
+        """Get the loader of a specific version"""
+        return self.loaders[version]
+
+    def record(
+        self,
+        version: str,
+        operation: str,
+        latency: float,
+        output_tokens: int = 0,
+        error: bool = False,
+        parse_failed: bool = False,
+        scores: Optional[Dict[str, Any]] = None
+    ) -> None:
+        """
+        Record one LLM call made with a prompt version
+
+        Args:
+            version: Version name returned by choose()
+            operation: 'analyze' or 'optimize'
+            latency: Wall-clock seconds of the LLM call
+            output_tokens: Output tokens reported by the invoker
+            error: Whether the LLM call raised
+            parse_failed: Whether the analysis JSON could not be parsed
+            scores: Analysis result (score fields are aggregated)
+        """
+        with self._lock:
+            metrics = self._metrics.get((version, operation))
+            if metrics is None:
+                metrics = self._metrics[(version, operation)] = VersionMetrics()
+            metrics.add(latency, output_tokens, error, parse_failed, scores)
+
+        if self.metrics_path:
+            self._append_jsonl({
+                "timestamp": datetime.now().isoformat(),
+                "version": version,
+                "operation": operation,
+                "latency": latency,
+                "output_tokens": output_tokens,
+                "error": error,
+                "parse_failed": parse_failed,
+                "scores": {field: scores.get(field) for field in SCORE_FIELDS} if scores and not parse_failed else None,
+            })
+
+    def _append_jsonl(self, record: Dict[str, Any]) -> None:
+        """Append one observation to the metrics file"""
+        try:
+            self.metrics_path.parent.mkdir(parents=True, exist_ok=True)
+            line = json.dumps(record, ensure_ascii=False) + "\n"
+            with self._lock:
+                with open(self.metrics_path, 'a', encoding='utf-8') as f:
+                    f.write(line)
+        except Exception as e:
+            logger.warning(f"Failed to write prompt metrics: {e}")
+
+    def get_metrics(self) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        """
+        Get aggregated metrics
+
+        Returns:
+            {version: {operation: summary}}
+        """
+        with self._lock:
+            items = list(self._metrics.items())
+        result: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        for (version, operation), metrics in items:
+            result.setdefault(version, {})[operation] = metrics.summary()
+        return result
+
+    def get_versions(self) -> List[str]:
+        """Get registered version names"""
+        return list(self.loaders.keys())
+
+
+# Singleton instance for global access
+_default_registry = None
+_default_registry_loaded = False
+_default_registry_lock = threading.Lock()
+
+
+def get_default_registry() -> Optional[PromptVersionRegistry]:
+    """
+    Get the registry configured under prompts.versions in config.yaml
+
+    Returns:
+        Registry instance, or None when version splitting is disabled
+    """
+    global _default_registry, _default_registry_loaded
+    if not _default_registry_loaded:
+        with _default_registry_lock:
+            if not _default_registry_loaded:
+                from config_loader import get_default_config_loader
+
+                config = get_default_config_loader()
+                versions_config = config.get('prompts.versions', {}) or {}
+                if versions_config.get('enabled', False) and versions_config.get('sources'):
+                    try:
+                        _default_registry = PromptVersionRegistry(
+                            sources=versions_config['sources'],
+                            weights=versions_config.get('weights'),
+                            default_version=versions_config.get('default'),
+                            metrics_path=versions_config.get('metrics_path')
+                        )
+                        config.add_reload_listener(_reload_weights)
+                    except Exception as e:
+                        logger.error(f"Error creating prompt version registry: {e}")
+                _default_registry_loaded = True
+    return _default_registry
+
+
+def _reload_weights(config) -> None:
+    """Apply prompts.versions.weights from a reloaded config.yaml to the default registry"""
+    versions_config = config.get('prompts.versions', {}) or {}
+    if _default_registry is not None and versions_config.get('enabled', False):
+        _default_registry.set_weights(versions_config.get('weights') or {_default_registry.default_version: 1.0})
+
+
+if __name__ == "__main__":
+    # Test the registry
+    print("Testing PromptVersionRegistry...")
+
+    registry = PromptVersionRegistry(
+        sources={
+            "v2.0": "resources/prompts/prompts.yaml",
+            "v1.0": "resources/prompts/versions/v1.0.yaml"
+        },
+        weights={"v2.0": 0.8, "v1.0": 0.2},
+        seed=42
+    )
+
+    counts = {}
+    for _ in range(1000):
+        name, _loader = registry.choose()
+        counts[name] = counts.get(name, 0) + 1
+    print(f"Split over 1000 requests: {counts}")
+
+    registry.record("v2.0", "analyze", 1.2, 350, scores={"completeness_score": 7, "clarity_score": 8})
+    registry.record("v1.0", "analyze", 1.8, 420, parse_failed=True)
+    print(json.dumps(registry.get_metrics(), indent=2, ensure_ascii=False))
+
+    print("\nTest completed!")
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Prompt Search - Inverted character n-gram index for substring search
+Used by the LocalStorage backend, where the library lives in session state:
+every prompt's name and bodies are indexed by their character bigrams and
+trigrams, so a query only verifies the prompts holding all of its n-grams
+instead of scanning the whole library
+"""
+
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+from prompt_similarity import ngram_hashes
+
+# Indexed n-gram lengths; queries use trigrams, two-character queries the bigram
+NGRAM_SIZES = (2, 3)
+
+# Texts hashed per vectorized pass when indexing
+BUILD_BATCH = 1000
+
+# A new segment is merged into the one before it until that one is this many
+# times larger, so there are only O(log n) segments to look up
+MERGE_RATIO = 4
+
+_DOC_BITS = np.uint64(32)
+_DOC_MASK = np.uint64((1 << 32) - 1)
+
+
+def search_text(name: Optional[str], original_prompt: Optional[str], optimized_prompt: Optional[str]) -> str:
+    """Text a prompt is searched by (the fields search_prompts matches)"""
+    return f"{name or ''}\n{original_prompt or ''}\n{optimized_prompt or ''}"
+
+
+def query_grams(query: str) -> Optional[np.ndarray]:
+    """
+    Distinct n-gram hashes a text containing query must also contain
+
+    Returns:
+        None when the query is too short to narrow the search (one character)
+    """
+    length = len(" ".join(query.lower().split()))
+    if length < 2:
+        return None
+    _, hashes = ngram_hashes([query], (3,) if length >= 3 else (2,))
+    return np.unique(hashes >> _DOC_BITS)
+
+
+class NgramIndex:
+    """
+    In-memory inverted index: n-gram -> prompts containing it
+
+    Postings are kept in a few immutable segments, each a sorted uint64
+    array of (32-bit n-gram hash << 32 | document number), so a posting list
+    is a binary-searched slice. Adding prompts appends a segment (merged
+    with the smaller recent ones); removing a prompt only marks its document
+    number dead, and dead postings are dropped when segments merge. Hash
+    collisions and n-grams spanning fields only add candidates, which the
+    caller verifies.
+    """
+
+    def __init__(self):
+        self.revision: Optional[int] = None
+        self.ids: List[Optional[str]] = []
+        self.docnos: Dict[str, int] = {}
+        self._live = bytearray()
+        self._dead = 0
+        self._segments: List[np.ndarray] = []
+
+    def __len__(self) -> int:
+        return len(self.docnos)
+
+    def add_many(self, items: Iterable[Tuple[str, str]]) -> None:
+        """Index (id, text) pairs; an id already indexed is replaced"""
+        items = list(dict(items).items())
+        for key, _ in items:
+            self.remove(key)
+        for start in range(0, len(items), BUILD_BATCH):
+            chunk = items[start:start + BUILD_BATCH]
+            first = len(self.ids)
+            for key, _ in chunk:
+                self.docnos[key] = len(self.ids)
+                self.ids.append(key)
+            self._live.extend(b"\1" * len(chunk))
+            owners, hashes = ngram_hashes([text for _, text in chunk], NGRAM_SIZES)
+            postings = np.sort((hashes >> _DOC_BITS << _DOC_BITS) | (owners + first).astype(np.uint64))
+            self._append(_distinct(postings))
+
+    def add(self, key: str, text: str) -> None:
+        self.add_many([(key, text)])
+
+    def remove(self, key: str) -> None:
+        docno = self.docnos.pop(key, None)
+        if docno is None:
+            return
+        self.ids[docno] = None
+        self._live[docno] = 0
+        self._dead += 1
+        if self._dead > len(self.docnos):
+            self._merge(0)
+
+    def candidates(self, query: str) -> Optional[Set[str]]:
+        """
+        Ids of the indexed texts holding every n-gram of query (a superset of
+        the texts containing it, case-insensitively)
+
+        Returns:
+            None when the query is too short for the index (scan instead)
+        """
+        grams = query_grams(query)
+        if grams is None:
+            return None
+        lists = sorted((self._postings(gram) for gram in grams.tolist()), key=len)
+        found = lists[0]
+        for postings in lists[1:]:
+            if not found.size:
+                break
+            found = found[np.isin(found, postings, assume_unique=True)]
+        return {self.ids[docno] for docno in found.tolist() if self._live[docno]}
+
+    def _postings(self, gram: int) -> np.ndarray:
+        """Document numbers containing an n-gram, ascending (may include dead ones)"""
+        low = np.uint64(gram) << _DOC_BITS
+        high = low | _DOC_MASK
+        parts = []
+        for segment in self._segments:
+            start = np.searchsorted(segment, low)
+            stop = np.searchsorted(segment, high, side="right")
+            if stop > start:
+                parts.append(segment[start:stop] & _DOC_MASK)
+        if not parts:
+            return np.empty(0, dtype=np.uint64)
+        # Later segments only hold later document numbers
+        return parts[0] if len(parts) == 1 else np.concatenate(parts)
+
+    def _append(self, segment: np.ndarray) -> None:
+        self._segments.append(segment)
+        count = len(self._segments)
+        while count > 1 and len(self._segments[count - 2]) < MERGE_RATIO * len(self._segments[count - 1]):
+            self._merge(count - 2)
+            count = len(self._segments)
+
+    def _merge(self, start: int) -> None:
+        """Merge the segments from start on into one, dropping dead postings"""
+        merged = np.sort(np.concatenate(self._segments[start:] or [np.empty(0, dtype=np.uint64)]))
+        if self._dead:
+            live = np.frombuffer(bytes(self._live), dtype=np.uint8).astype(bool)
+            merged = merged[live[(merged & _DOC_MASK).astype(np.int64)]]
+            if start == 0:
+                self._dead = 0
+        self._segments[start:] = [merged]
+
+
+def _distinct(postings: np.ndarray) -> np.ndarray:
+    """Sorted postings without repeats (an n-gram occurring twice in one text)"""
+    if not postings.size:
+        return postings
+    keep = np.empty(len(postings), dtype=bool)
+    keep[0] = True
+    np.not_equal(postings[1:], postings[:-1], out=keep[1:])
+    return postings[keep]
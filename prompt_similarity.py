@@ -0,0 +1,415 @@
+#!/usr/bin/env python3
+"""
+Prompt Similarity - Offline "find similar prompts" index
+Prompts are embedded as hashed TF-IDF vectors over character n-grams (which
+needs no word segmentation, so zh_TW / ja work as well as English) computed
+with NumPy, kept as float32 rows in a memory-mapped file and searched by
+cosine similarity; no model download or network access is involved
+"""
+
+import json
+import os
+import threading
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Character n-gram lengths (2-grams cover CJK words, 3-grams Latin morphemes)
+NGRAM_SIZES = (2, 3)
+
+# Document-frequency table size (2 ** DF_BITS hashed n-gram buckets)
+DF_BITS = 18
+
+# Stored vector dimension (buckets are folded into it with a random sign)
+DIM = 256
+
+# Rebuild (refresh IDF) once the library has grown or shrunk by this factor since the last full build
+REBUILD_FACTOR = 2.0
+
+# Matches below this cosine similarity are not returned
+MIN_SIMILARITY = 0.2
+
+# Texts hashed / embedded per vectorized batch while rebuilding
+BATCH_SIZE = 1000
+
+# Bump when the embedding or file layout changes; older index files are rebuilt
+INDEX_FORMAT = 1
+
+_PRIME = np.uint64(0x100000001B3)
+_MIX1 = np.uint64(0xFF51AFD7ED558CCD)
+_MIX2 = np.uint64(0xC4CEB9FE1A85EC53)
+_SHIFT = np.uint64(33)
+
+
+def index_text(name: Optional[str], original_prompt: Optional[str]) -> str:
+    """Text a saved prompt is indexed by (a new input is compared against saved originals)"""
+    return f"{name or ''}\n{original_prompt or ''}"
+
+
+def ngram_hashes(texts: Sequence[str], sizes: Sequence[int] = NGRAM_SIZES) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    64-bit hashes of the character n-grams of a batch of texts (one vectorized pass)
+
+    Texts are lowercased and whitespace runs collapsed first.
+
+    Returns:
+        (index of the owning text, hash) for every n-gram occurrence
+    """
+    normalized = [" ".join(text.lower().split()) for text in texts]
+    lengths = np.array([len(text) for text in normalized], dtype=np.int64)
+    # Texts are joined with a separator; n-grams crossing it are dropped below
+    codes = np.frombuffer("\0".join(normalized).encode("utf-32-le"), dtype="<u4").astype(np.uint64)
+    starts = np.cumsum(lengths + 1) - (lengths + 1)
+    owner = np.repeat(np.arange(len(texts)), lengths + 1)[:len(codes)]
+    offset_in_text = np.arange(len(codes)) - starts[owner]
+
+    owners, hashes = [], []
+    for size in sizes:
+        count = len(codes) - size + 1
+        if count <= 0:
+            continue
+        h = np.full(count, size, dtype=np.uint64)
+        for offset in range(size):
+            h = h * _PRIME + codes[offset:offset + count]
+        valid = offset_in_text[:count] + size <= lengths[owner[:count]]
+        owners.append(owner[:count][valid])
+        hashes.append(mix64(h[valid]))
+    if not hashes:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.uint64)
+    return np.concatenate(owners), np.concatenate(hashes)
+
+
+def mix64(h: np.ndarray) -> np.ndarray:
+    """murmur3 64-bit finalizer (well-mixed high bits), applied in place"""
+    h ^= h >> _SHIFT
+    h *= _MIX1
+    h ^= h >> _SHIFT
+    h *= _MIX2
+    h ^= h >> _SHIFT
+    return h
+
+
+def ngram_counts(texts: Sequence[str]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Hashed character n-grams of a batch of texts
+
+    Returns:
+        (document index, bucket id, occurrence count) for every distinct
+        n-gram bucket of every text, sorted by document
+    """
+    owners, hashes = ngram_hashes(texts)
+    keys = (owners << DF_BITS) | (hashes >> np.uint64(64 - DF_BITS)).astype(np.int64)
+    unique, counts = np.unique(keys, return_counts=True)
+    return unique >> DF_BITS, unique & ((1 << DF_BITS) - 1), counts
+
+
+def embed(documents: np.ndarray, buckets: np.ndarray, counts: np.ndarray, rows: int,
+          df: np.ndarray, docs: int, dim: int = DIM) -> np.ndarray:
+    """
+    Unit-length TF-IDF vectors folded into dim dimensions
+
+    Args:
+        documents, buckets, counts: from ngram_counts
+        rows: number of texts in the batch
+        df: document frequency per bucket
+        docs: number of indexed documents
+
+    Returns:
+        float32 array of shape (rows, dim)
+    """
+    idf = np.log((1.0 + docs) / (1.0 + df[buckets])) + 1.0
+    signs = np.where((buckets // dim) % 2, -1.0, 1.0)
+    weights = (1.0 + np.log(counts)) * idf * signs
+    vectors = np.bincount(documents * dim + buckets % dim, weights=weights, minlength=rows * dim)
+    vectors = vectors.reshape(rows, dim).astype(np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return np.divide(vectors, norms, out=vectors, where=norms > 0)
+
+
+class SimilarityIndex:
+    """
+    Top-k cosine index over saved prompts
+
+    With a path, vectors live in "<path>.vectors" (float32, memory-mapped),
+    document frequencies in "<path>.df", the slot -> prompt id mapping in the
+    append-only journal "<path>.ids" and counters in "<path>.json"; without
+    one (LocalStorage backend) everything stays in memory.
+
+    The index records the library revision it reflects: update() applies a
+    save / delete incrementally only when it is the next revision, anything
+    else (imports, other sessions' writes) marks the index stale and the
+    owner rebuilds it on the next search.
+    """
+
+    def __init__(self, path: Optional[str] = None, dim: int = DIM):
+        self.path = path
+        self.dim = dim
+        self.lock = threading.RLock()
+        self.loaded = False  # index files have been read (or there are none)
+        self.revision: Optional[int] = None
+        self.docs = 0
+        self.built_docs = 0
+        self.ids: List[str] = []
+        self.slots: Dict[str, int] = {}
+        self.journal_lines = 0
+        self._pending: List[str] = []  # journal lines not yet written
+        self.df = np.zeros(1 << DF_BITS, dtype=np.int32)
+        self.vectors = np.zeros((0, dim), dtype=np.float32)
+
+    def _file(self, suffix: str) -> str:
+        return f"{self.path}.{suffix}"
+
+    def is_current(self, revision: int) -> bool:
+        """Whether the index reflects this library revision and its IDF is still representative"""
+        if self.revision != revision:
+            return False
+        low, high = self.built_docs / REBUILD_FACTOR, max(self.built_docs * REBUILD_FACTOR, 16)
+        return low <= self.docs <= high
+
+    def load(self) -> bool:
+        """Open the index files (False if missing, unreadable or of another format)"""
+        self.loaded = True
+        if self.path is None:
+            return False
+        try:
+            with open(self._file("json"), encoding="utf-8") as f:
+                meta = json.load(f)
+            if (meta.get("format"), meta.get("dim"), meta.get("df_bits")) != (INDEX_FORMAT, self.dim, DF_BITS):
+                return False
+            capacity = meta["capacity"]
+            ids = _replay_journal(self._file("ids"), meta["journal_lines"])
+            df = np.memmap(self._file("df"), dtype=np.int32, mode="r+", shape=(1 << DF_BITS,))
+            vectors = np.memmap(self._file("vectors"), dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+        except (OSError, ValueError, KeyError, IndexError):
+            return False
+        self.df, self.vectors = df, vectors
+        self.ids, self.journal_lines = ids, meta["journal_lines"]
+        self.slots = {prompt_id: slot for slot, prompt_id in enumerate(self.ids)}
+        self.docs, self.built_docs, self.revision = meta["docs"], meta["built_docs"], meta["revision"]
+        return True
+
+    def rebuild(self, documents: Callable[[], Iterable[Tuple[str, str]]], revision: int) -> None:
+        """
+        Re-embed every document
+
+        Args:
+            documents: Returns a fresh iterable of (prompt_id, index_text); it is
+                       read twice (document frequencies, then vectors) and must
+                       yield the same snapshot both times
+            revision: Library revision the snapshot belongs to
+        """
+        with self.lock:
+            self._rebuild(documents, revision)
+
+    def _rebuild(self, documents: Callable[[], Iterable[Tuple[str, str]]], revision: int) -> None:
+        df = np.zeros(1 << DF_BITS, dtype=np.int32)
+        docs = 0
+        for _, texts in _batches(documents()):
+            _, buckets, _ = ngram_counts(texts)
+            np.add.at(df, buckets, 1)
+            docs += len(texts)
+
+        ids = []
+        vectors = np.zeros((max(docs, 1), self.dim), dtype=np.float32)
+        for batch_ids, texts in _batches(documents()):
+            batch_ids, texts = batch_ids[:docs - len(ids)], texts[:docs - len(ids)]
+            vectors[len(ids):len(ids) + len(texts)] = embed(*ngram_counts(texts), len(texts), df, docs, self.dim)
+            ids.extend(batch_ids)
+
+        self.loaded = True
+        self.revision, self.docs, self.built_docs = revision, len(ids), len(ids)
+        self.ids = ids
+        self.slots = {prompt_id: slot for slot, prompt_id in enumerate(ids)}
+        self.df = df
+        self.vectors = vectors
+        if self.path is not None:
+            self._write_files()
+
+    def update(self, added: Sequence[Tuple[str, str]], removed: Sequence[Tuple[str, str]],
+               revision: int, changes: int = 1) -> None:
+        """
+        Apply saves / deletes
+
+        Args:
+            added, removed: (prompt_id, index_text) pairs
+            revision: Library revision after the change
+            changes: Revisions the change accounts for (one per row written)
+        """
+        with self.lock:
+            if not self.loaded:
+                self.load()
+            if self.revision is None or self.revision + changes != revision:
+                self.revision = None  # stale: rebuilt by the next search
+                return
+            for prompt_id, text in removed:
+                self._remove(prompt_id, text)
+            for prompt_id, text in added:
+                self._add(prompt_id, text)
+            self.revision = revision
+            if self.path is not None:
+                self._flush()
+
+    def _add(self, prompt_id: str, text: str) -> None:
+        grams = ngram_counts([text])
+        self.df[grams[1]] += 1
+        self.docs += 1
+        if len(self.ids) == len(self.vectors):
+            self._grow(max(1024, 2 * len(self.vectors)))
+        slot = len(self.ids)
+        self.vectors[slot] = embed(*grams, 1, self.df, self.docs, self.dim)[0]
+        self.ids.append(prompt_id)
+        self.slots[prompt_id] = slot
+        self._pending.append(json.dumps(["add", prompt_id], ensure_ascii=False))
+
+    def _remove(self, prompt_id: str, text: str) -> None:
+        slot = self.slots.pop(prompt_id, None)
+        if slot is None:
+            return
+        _, buckets, _ = ngram_counts([text])
+        self.df[buckets] = np.maximum(self.df[buckets] - 1, 0)
+        self.docs -= 1
+        # Keep rows dense: move the last row into the freed slot
+        last = len(self.ids) - 1
+        if slot != last:
+            moved = self.ids[last]
+            self.vectors[slot] = self.vectors[last]
+            self.ids[slot] = moved
+            self.slots[moved] = slot
+        self.vectors[last] = 0
+        self.ids.pop()
+        self._pending.append(json.dumps(["del", slot]))
+
+    def _grow(self, capacity: int) -> None:
+        if self.path is None:
+            vectors = np.zeros((capacity, self.dim), dtype=np.float32)
+            vectors[:len(self.vectors)] = self.vectors
+            self.vectors = vectors
+            return
+        if isinstance(self.vectors, np.memmap):
+            self.vectors.flush()
+        self.vectors = None
+        with open(self._file("vectors"), "r+b") as f:
+            f.truncate(capacity * self.dim * 4)
+        self.vectors = np.memmap(self._file("vectors"), dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+
+    def _write_files(self) -> None:
+        """Write a freshly built index (each file replaced atomically, metadata last)"""
+        for suffix, array in (("df", self.df), ("vectors", self.vectors)):
+            temp = self._file(suffix + ".tmp")
+            array.tofile(temp)
+            os.replace(temp, self._file(suffix))
+        self.df = np.memmap(self._file("df"), dtype=np.int32, mode="r+", shape=self.df.shape)
+        self.vectors = np.memmap(self._file("vectors"), dtype=np.float32, mode="r+", shape=self.vectors.shape)
+        self._write_journal()
+        self._write_meta()
+
+    def _write_journal(self) -> None:
+        """Rewrite the id journal as one "add" per slot"""
+        temp = self._file("ids.tmp")
+        with open(temp, "w", encoding="utf-8") as f:
+            for prompt_id in self.ids:
+                f.write(json.dumps(["add", prompt_id], ensure_ascii=False) + "\n")
+        os.replace(temp, self._file("ids"))
+        self.journal_lines = len(self.ids)
+        self._pending = []
+
+    def _flush(self) -> None:
+        for array in (self.df, self.vectors):
+            if isinstance(array, np.memmap):
+                array.flush()
+        if self.journal_lines + len(self._pending) > 2 * len(self.ids) + 1024:
+            self._write_journal()
+        elif self._pending:
+            with open(self._file("ids"), "a", encoding="utf-8") as f:
+                f.write("\n".join(self._pending) + "\n")
+            self.journal_lines += len(self._pending)
+            self._pending = []
+        self._write_meta()
+
+    def _write_meta(self) -> None:
+        # A crash before this point leaves the old revision on disk, so the
+        # next load sees a mismatch and rebuilds instead of trusting the rows
+        meta = {
+            "format": INDEX_FORMAT,
+            "dim": self.dim,
+            "df_bits": DF_BITS,
+            "revision": self.revision,
+            "docs": self.docs,
+            "built_docs": self.built_docs,
+            "capacity": len(self.vectors),
+            "journal_lines": self.journal_lines,
+        }
+        temp = self._file("json.tmp")
+        with open(temp, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(temp, self._file("json"))
+
+    def search(self, text: str, limit: int = 5, exclude: Iterable[str] = (),
+               min_similarity: float = MIN_SIMILARITY) -> List[Tuple[str, float]]:
+        """
+        Most similar indexed prompts
+
+        Returns:
+            [(prompt_id, cosine similarity), ...], most similar first
+        """
+        with self.lock:
+            count = len(self.ids)
+            if count == 0:
+                return []
+            query = embed(*ngram_counts([text]), 1, self.df, self.docs, self.dim)[0]
+            scores = np.asarray(self.vectors[:count] @ query)
+            for prompt_id in exclude:
+                slot = self.slots.get(prompt_id)
+                if slot is not None:
+                    scores[slot] = -1.0
+            k = min(limit, count)
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return [(self.ids[slot], float(scores[slot])) for slot in top if scores[slot] >= min_similarity]
+
+
+def _replay_journal(path: str, lines: int) -> List[str]:
+    """Slot -> prompt id mapping after the first lines journal entries"""
+    ids: List[str] = []
+    with open(path, encoding="utf-8") as f:
+        for _, line in zip(range(lines), f):
+            op, value = json.loads(line)
+            if op == "add":
+                ids.append(value)
+            else:
+                last = ids.pop()
+                if value < len(ids):
+                    ids[value] = last
+    return ids
+
+
+def _batches(documents: Iterable[Tuple[str, str]]) -> Iterator[Tuple[List[str], List[str]]]:
+    """Group (prompt_id, text) pairs into (ids, texts) lists of BATCH_SIZE"""
+    ids, texts = [], []
+    for prompt_id, text in documents:
+        ids.append(prompt_id)
+        texts.append(text)
+        if len(ids) == BATCH_SIZE:
+            yield ids, texts
+            ids, texts = [], []
+    if ids:
+        yield ids, texts
+
+
+_shared_indexes: Dict[str, SimilarityIndex] = {}
+_shared_indexes_lock = threading.Lock()
+
+
+def shared_index(path: str) -> SimilarityIndex:
+    """
+    Process-wide index for an index file path
+
+    Streamlit sessions each hold their own PromptDatabase for the same file;
+    sharing the index keeps one copy of the vectors and serializes writes.
+    """
+    key = os.path.abspath(path)
+    with _shared_indexes_lock:
+        index = _shared_indexes.get(key)
+        if index is None:
+            index = _shared_indexes[key] = SimilarityIndex(path)
+        return index
@@ -6,13 +6,59 @@ Uses streamlit-local-storage to persist data in user's browser.
 
 import json
 import logging
+import time
 import uuid
+import zlib
+from collections import Counter
 from datetime import datetime
-from typing import List, Dict, Optional
+from itertools import islice
+from typing import BinaryIO, Callable, Iterable, Iterator, List, Dict, Optional, Set, Tuple, Union
+import numpy as np
 import streamlit as st
 
-# Key for storing prompts in LocalStorage
+from prompt_export import iter_export
+from prompt_blobs import body_hash
+from prompt_dedup import (
+    DEFAULT_THRESHOLD as DUPLICATE_THRESHOLD, POLICY_FLAG, POLICY_MERGE, LSHIndex, band_keys, merge_tags,
+    signatures, validate_policy
+)
+from prompt_history import KIND_FINAL, KIND_ORIGINAL, decode_version, diff_text, encode_history
+from prompt_import import BATCH_SIZE as IMPORT_BATCH_SIZE, ImportFormatError, iter_validated_batches, validate_record
+from prompt_search import NgramIndex, search_text
+from prompt_similarity import SimilarityIndex, index_text
+from prompt_sync import to_utc_stamp, utc_stamp
+
+# Keys in LocalStorage: the library document (the only key before per-prompt
+# keys existed), a small manifest with the order, and one key per prompt
+# changed since the document was last rewritten
 STORAGE_KEY = "prompt_tool_prompts"
+MANIFEST_KEY = "prompt_tool_manifest"
+SHARD_PREFIX = "prompt_tool_prompt:"
+
+# Stored values are deflate-compressed JSON packed 15 bits per UTF-16
+# character behind this prefix (the quota counts UTF-16 characters, and
+# zh_TW / ja text barely shrinks under base64); plain JSON values from
+# earlier versions, or too small to gain, start with "{"
+ENCODED_PREFIX = "~z1:"
+COMPRESS_LEVEL = 6
+# Packed characters are 0x20..0x801F: no control characters or surrogates
+PACK_OFFSET = 0x20
+
+# Saves touching more prompts than this rewrite the library document instead
+# (every LocalStorage write is a component round trip)
+COMPACT_THRESHOLD = 50
+
+# Changes are queued and written by flush() at the end of the script run, so
+# several saves / deletes in one rerun cost one round of writes; a run still
+# busy this many seconds after its first queued change flushes early
+FLUSH_INTERVAL = 5.0
+
+# Same score fields / preview length as PromptDatabase.query_prompts
+SCORE_FIELDS = ("completeness_score", "clarity_score", "structure_score", "specificity_score")
+PREVIEW_CHARS = 100
+
+# Same default batch as PromptDatabase.get_changes
+CHANGE_BATCH = 500
 
 
 class LocalStoragePromptDB:
@@ -21,93 +67,231 @@ class LocalStoragePromptDB:
     Implements same interface as PromptDatabase for compatibility.
     """
 
-    def __init__(self):
-        """Initialize LocalStorage connection"""
+    def __init__(self, duplicate_policy: str = POLICY_FLAG, duplicate_threshold: float = DUPLICATE_THRESHOLD):
+        """
+        Initialize LocalStorage connection
+
+        Args:
+            duplicate_policy / duplicate_threshold: see PromptDatabase
+        """
+        self.duplicate_policy = validate_policy(duplicate_policy)
+        self.duplicate_threshold = duplicate_threshold
         self._init_storage()
+        # "Find similar" vectors; in memory, since the library lives in the browser
+        self._similarity = SimilarityIndex()
+        # Near-duplicate MinHash-LSH index of the optimized bodies
+        self._duplicates = LSHIndex()
+        # Substring search n-gram index of the names and bodies
+        self._search = NgramIndex()
+        # Duplicate flags by the prompt they point to (entries may be stale; check before use)
+        self._flagged: Dict[str, Set[str]] = {}
+        self._flagged_revision: Optional[int] = None
 
     def _init_storage(self):
         """Initialize the storage in session state"""
-        if 'local_prompts' not in st.session_state:
+        if 'local_library' not in st.session_state:
             # 讓 _load_from_local_storage() 處理初始化
             self._load_from_local_storage()
-            # 防禦性檢查：確保 local_prompts 一定被創建
-            if 'local_prompts' not in st.session_state:
-                logging.error("[INIT] local_prompts still not in session_state after load attempt")
-                st.session_state.local_prompts = []
+            # 防禦性檢查：確保 local_library 一定被創建
+            if 'local_library' not in st.session_state:
+                logging.error("[INIT] local_library still not in session_state after load attempt")
+                st.session_state.local_library = {}
 
     def _load_from_local_storage(self):
         """Load prompts from browser LocalStorage"""
         try:
             from streamlit_local_storage import LocalStorage
             ls = LocalStorage()
-            data = ls.getItem(STORAGE_KEY)
+            data = ls.getItem(STORAGE_KEY) or ls.getItem(MANIFEST_KEY)
 
             # 診斷日誌：載入狀態
-            logging.info(f"[LOAD] LocalStorage data exists: {data is not None}")
-            logging.info(f"[LOAD] local_prompts key exists in session_state: {'local_prompts' in st.session_state}")
+            logging.debug(f"[LOAD] LocalStorage data exists: {data is not None}")
+            logging.debug(f"[LOAD] local_library key exists in session_state: {'local_library' in st.session_state}")
 
             # 只有在 session_state 中還沒有這個 key 時才載入
             # (表示這是第一次初始化，而非用戶已刪除所有 prompts)
-            if 'local_prompts' not in st.session_state:
+            if 'local_library' not in st.session_state:
                 if data:
-                    parsed = json.loads(data)
+                    library = _read_library(ls.getAll())
                     # 驗證 JSON 資料結構是否為 dict
-                    if isinstance(parsed, dict):
-                        loaded_prompts = parsed.get("prompts", [])
-                        st.session_state.local_prompts = loaded_prompts
+                    if library is not None:
+                        loaded_prompts = library["prompts"]
+                        st.session_state.local_library = _index_prompts(loaded_prompts)
+                        st.session_state.local_changes = library["changes"]
+                        st.session_state.local_sync_state = library["sync"]
+                        st.session_state.local_storage_generation = library["generation"]
                         logging.info(f"[LOAD] Loaded {len(loaded_prompts)} prompts from LocalStorage")
                     else:
                         # LocalStorage 資料格式錯誤
-                        logging.warning(f"LocalStorage data is not a dict: {type(parsed)}")
-                        st.session_state.local_prompts = []
+                        logging.warning("LocalStorage data is not a dict")
+                        st.session_state.local_library = {}
                 else:
-                    logging.info("[LOAD] No data in LocalStorage, initializing empty list")
-                    st.session_state.local_prompts = []
+                    logging.debug("[LOAD] No data in LocalStorage, initializing empty library")
+                    st.session_state.local_library = {}
             else:
-                logging.info(f"[LOAD] Skipping load - session_state already has {len(st.session_state.local_prompts)} prompts")
+                logging.debug(f"[LOAD] Skipping load - session_state already has {len(st.session_state.local_library)} prompts")
 
             # 如果 key 已存在，我們假設 session_state 是最新的，不進行覆蓋
 
         except Exception as e:
             # LocalStorage 不可用時，確保 session_state 被初始化
-            if 'local_prompts' not in st.session_state:
-                st.session_state.local_prompts = []
+            if 'local_library' not in st.session_state:
+                st.session_state.local_library = {}
 
             # 記錄錯誤以便除錯
             logging.warning(f"Failed to load from LocalStorage: {e}")
 
-    def _save_to_local_storage(self):
-        """Save prompts to browser LocalStorage"""
+    def _save_to_local_storage(self, prompt_ids: Optional[Iterable[str]] = None):
+        """
+        Save prompts to browser LocalStorage (queued until flush())
+
+        prompt_ids: the prompts that changed (deleted ones included); only
+        their keys and the manifest are written. None, or more than
+        COMPACT_THRESHOLD prompts, rewrites the library document instead.
+        """
+        # Every mutation ends here; invalidates caches keyed by get_library_revision()
+        st.session_state.local_prompts_revision = st.session_state.get('local_prompts_revision', 0) + 1
+        self._queue_write(prompt_ids)
+
+    def _queue_write(self, prompt_ids: Optional[Iterable[str]] = None, manifest_only: bool = False):
+        """Mark prompts (or the whole document) for the next flush(); the manifest is always rewritten"""
+        pending = st.session_state.get('local_storage_pending')
+        if pending is None:
+            pending = {"ids": set(), "document": False, "since": time.monotonic()}
+            st.session_state.local_storage_pending = pending
+        if not manifest_only:
+            if prompt_ids is None:
+                pending["document"] = True
+            else:
+                pending["ids"].update(prompt_ids)
+        if time.monotonic() - pending["since"] >= FLUSH_INTERVAL:
+            self.flush()
+
+    def has_pending_writes(self) -> bool:
+        """Whether changes are queued that flush() has not written yet"""
+        return 'local_storage_pending' in st.session_state
+
+    def flush(self) -> bool:
+        """
+        Write the changes queued since the last flush to LocalStorage
+
+        The app calls this once at the end of every script run; changes
+        queued by a run that ended in st.rerun() are written by the next
+        one. Values are taken from the session library at flush time, so a
+        prompt edited several times is written once, in its latest state.
+        When a write fails the changes stay queued and are retried on the
+        next flush (keys written before the failure are simply rewritten).
+
+        Returns:
+            False when the write failed
+        """
+        pending = st.session_state.get('local_storage_pending')
+        if pending is None:
+            return True
+        prompt_ids = None if pending["document"] else pending["ids"]
+        if self._write_local_storage(prompt_ids):
+            del st.session_state['local_storage_pending']
+            return True
+        pending["since"] = time.monotonic()
+        return False
+
+    def _write_local_storage(self, prompt_ids: Optional[Iterable[str]] = None) -> bool:
+        """
+        Write changed prompts (or the whole library document) and the manifest
+
+        Rewriting the document starts a new generation: per-prompt keys of
+        older generations (tombstones included) are ignored on load, and are
+        deleted once the document and manifest are written.
+
+        Returns:
+            False when a write failed (the generation is then left unchanged)
+        """
         try:
             from streamlit_local_storage import LocalStorage
             ls = LocalStorage()
-            data = {
-                "version": "1.0",
-                "updated_at": datetime.now().isoformat(),
-                "prompts": st.session_state.local_prompts
-            }
-            json_data = json.dumps(data, ensure_ascii=False)
+            now = datetime.now().isoformat()
+            log = self._change_log()
+            generation = st.session_state.get('local_storage_generation', 0)
+            writes = []
+            changed = None if prompt_ids is None else set(prompt_ids)
+            rewrite = changed is None or len(changed) > COMPACT_THRESHOLD
+            if rewrite:
+                generation += 1
+                writes.append((STORAGE_KEY, {
+                    "version": "1.0",
+                    "generation": generation,
+                    "updated_at": now,
+                    "prompts": list(_newest_first()),
+                    "changes": log
+                }))
+            else:
+                library = _library()
+                for prompt_id in changed:
+                    writes.append((SHARD_PREFIX + prompt_id, {
+                        "generation": generation,
+                        "prompt": library.get(prompt_id),
+                        "change": log["entries"].get(prompt_id)
+                    }))
+            writes.append((MANIFEST_KEY, {
+                "version": "2.0",
+                "generation": generation,
+                "updated_at": now,
+                "ids": list(reversed(_library())),
+                "seq": log["seq"],
+                "sync": st.session_state.get('local_sync_state', {})
+            }))
 
             # 診斷日誌：保存內容
-            logging.info(f"[SAVE_LS] Saving {len(st.session_state.local_prompts)} prompts to LocalStorage")
-            logging.info(f"[SAVE_LS] JSON data length: {len(json_data)} bytes")
-
-            ls.setItem(STORAGE_KEY, json_data)
+            characters = 0
+            for key, value in writes:
+                json_data = _encode_item(value)
+                logging.debug(f"[SAVE_LS] {key}: {len(json_data)} characters")
+                ls.setItem(key, json_data, key=_component_key())
+                characters += len(json_data)
+            st.session_state.local_storage_generation = generation
+            removed = _delete_shards(ls) if rewrite else 0
 
-            logging.info(f"[SAVE_LS] Successfully saved to LocalStorage")
+            logging.info(f"[SAVE_LS] Saved {len(writes)} keys ({characters} characters) for {len(_library())} prompts"
+                         f"{f', removed {removed} old prompt keys' if removed else ''}")
+            return True
 
         except Exception as e:
             # 記錄錯誤而非靜默失敗
-            logging.error(f"[SAVE_LS] Failed to save to LocalStorage: {e}")
+            logging.error(f"[SAVE_LS] Failed to save to LocalStorage, will retry: {e}")
             # 在 UI 顯示錯誤（對用戶可見）
             st.warning(f"⚠️ 無法保存到瀏覽器儲存：{e}")
+            return False
 
     def save_prompt(self, name: str, original_prompt: str, optimized_prompt: str,
                     analysis_scores: Dict = None, tags: List[str] = None,
-                    language: str = "zh_TW") -> str:
-        """Save a prompt to LocalStorage"""
-        prompt_id = str(uuid.uuid4())
+                    language: str = "zh_TW", history: Optional[List[str]] = None,
+                    duplicate_policy: Optional[str] = None) -> str:
+        """
+        Save a prompt to LocalStorage
+
+        history: versions before the final one, oldest first; when given, the
+        lineage is kept delta-encoded under 'versions' (the final version is
+        the record's optimized_prompt and is not stored twice)
+
+        duplicate_policy: how to handle a duplicate optimized body (see
+        PromptDatabase.save_prompt); "merge" and "skip" return the existing id
+        """
+        policy = validate_policy(duplicate_policy or self.duplicate_policy)
         now = datetime.now().isoformat()
+        duplicate = self.find_duplicate(optimized_prompt)
+        if duplicate and policy != POLICY_FLAG:
+            if policy == POLICY_MERGE:
+                existing = self.load_prompt_by_id(duplicate['id'])
+                merged = merge_tags(existing.get('tags'), tags)
+                if merged != (existing.get('tags') or []):
+                    existing['tags'] = merged
+                    existing['updated_at'] = now
+                    self._record_changes([(existing['id'], False, now)])
+                    self._save_to_local_storage([existing['id']])
+                    self._bodies_unchanged()
+            return duplicate['id']
+
+        prompt_id = str(uuid.uuid4())
 
         prompt = {
             'id': prompt_id,
@@ -120,154 +304,749 @@ class LocalStoragePromptDB:
             'created_at': now,
             'updated_at': now
         }
+        if history:
+            prompt['versions'] = encode_history(list(history) + [optimized_prompt])[:-1]
+        if duplicate:
+            prompt['duplicate_of'] = duplicate['id']
 
         # 診斷日誌：保存前的狀態
-        logging.info(f"[SAVE] Before save - session_state.local_prompts count: {len(st.session_state.get('local_prompts', []))}")
-        logging.info(f"[SAVE] Saving prompt: {name} (ID: {prompt_id})")
+        logging.debug(f"[SAVE] Before save - session_state.local_library count: {len(st.session_state.get('local_library', {}))}")
+        logging.debug(f"[SAVE] Saving prompt: {name} (ID: {prompt_id})")
 
-        st.session_state.local_prompts.insert(0, prompt)
+        _library()[prompt_id] = prompt
+        self._record_changes([(prompt_id, False, now)])
 
         # 診斷日誌：保存後的狀態
-        logging.info(f"[SAVE] After insert - session_state.local_prompts count: {len(st.session_state.local_prompts)}")
+        logging.debug(f"[SAVE] After insert - session_state.local_library count: {len(_library())}")
 
-        self._save_to_local_storage()
-
-        # 診斷日誌：確認同步到 LocalStorage
-        logging.info(f"[SAVE] Called _save_to_local_storage()")
+        self._save_to_local_storage([prompt_id])
 
+        revision = self.get_library_revision()
+        self._similarity.update([(prompt_id, index_text(name, original_prompt))], [], revision)
+        if self._duplicates.revision == revision - 1:
+            self._duplicates.add_many([(prompt_id, optimized_prompt)])
+            self._duplicates.revision = revision
+        if self._search.revision == revision - 1:
+            self._search.add(prompt_id, search_text(name, original_prompt, optimized_prompt))
+            self._search.revision = revision
+        self._update_duplicate_flags([prompt])
         return prompt_id
 
     def load_prompts(self, limit: int = 50) -> List[Dict]:
         """Load all saved prompts"""
         self._load_from_local_storage()
-        return st.session_state.local_prompts[:limit]
+        return list(islice(_newest_first(), limit))
 
     def load_prompt_by_id(self, prompt_id: str) -> Optional[Dict]:
         """Load a specific prompt by ID"""
-        for prompt in st.session_state.local_prompts:
-            if prompt.get('id') == prompt_id:
-                return prompt
-        return None
+        return _library().get(prompt_id)
 
     def delete_prompt(self, prompt_id: str) -> bool:
         """Delete a prompt by ID"""
-        initial_len = len(st.session_state.local_prompts)
-        st.session_state.local_prompts = [
-            p for p in st.session_state.local_prompts
-            if p.get('id') != prompt_id
-        ]
+        flagged = self._duplicate_flags()
+        prompt = _library().pop(prompt_id, None)
+        removed = [(prompt_id, index_text(prompt.get('name'), prompt.get('original_prompt')))] if prompt else []
 
-        if len(st.session_state.local_prompts) < initial_len:
-            self._save_to_local_storage()
+        if removed:
+            if prompt.get('duplicate_of') in flagged:
+                flagged[prompt['duplicate_of']].discard(prompt_id)
+            unflagged = []
+            for flagged_id in flagged.pop(prompt_id, ()):
+                duplicate = _library().get(flagged_id)
+                if duplicate is not None and duplicate.get('duplicate_of') == prompt_id:
+                    del duplicate['duplicate_of']
+                    unflagged.append(flagged_id)
+            self._record_changes([(prompt_id, True, datetime.now().isoformat())])
+            self._save_to_local_storage([prompt_id] + unflagged)
+            revision = self.get_library_revision()
+            self._similarity.update([], removed, revision)
+            if self._duplicates.revision == revision - 1:
+                self._duplicates.remove(prompt_id)
+                self._duplicates.revision = revision
+            if self._search.revision == revision - 1:
+                self._search.remove(prompt_id)
+                self._search.revision = revision
+            if self._flagged_revision == revision - 1:
+                self._flagged_revision = revision
             return True
         return False
 
-    def search_prompts(self, query: str, language: str = None) -> List[Dict]:
-        """Search prompts by query"""
+    def _bodies_unchanged(self) -> None:
+        """Keep the in-memory indexes current after a save that changed no prompt body (tag merge)"""
+        revision = self.get_library_revision()
+        self._similarity.update([], [], revision)
+        if self._duplicates.revision == revision - 1:
+            self._duplicates.revision = revision
+        if self._search.revision == revision - 1:
+            self._search.revision = revision
+        self._update_duplicate_flags([])
+
+    def _search_index(self) -> NgramIndex:
+        """Substring search index, rebuilt when the library changed since it was last kept current"""
+        revision = self.get_library_revision()
+        if self._search.revision != revision:
+            self._search = NgramIndex()
+            self._search.add_many([
+                (p.get('id'), search_text(p.get('name'), p.get('original_prompt'), p.get('optimized_prompt')))
+                for p in _library().values()
+            ])
+            self._search.revision = revision
+        return self._search
+
+    def _update_search_index(self, upserted: Iterable[Dict], removed: Iterable[str]) -> None:
+        """Apply a bulk change (import / sync) to the search index if it was current before it"""
+        revision = self.get_library_revision()
+        if self._search.revision == revision - 1:
+            for prompt_id in removed:
+                self._search.remove(prompt_id)
+            self._search.add_many([
+                (p.get('id'), search_text(p.get('name'), p.get('original_prompt'), p.get('optimized_prompt')))
+                for p in upserted
+            ])
+            self._search.revision = revision
+
+    def _duplicate_flags(self) -> Dict[str, Set[str]]:
+        """
+        Ids flagged as duplicates of each prompt, so a delete clears its
+        flags without scanning the library; rebuilt when the library changed
+        since it was last kept current
+        """
+        revision = self.get_library_revision()
+        if self._flagged_revision != revision:
+            self._flagged = {}
+            for prompt in _library().values():
+                if prompt.get('duplicate_of'):
+                    self._flagged.setdefault(prompt['duplicate_of'], set()).add(prompt.get('id'))
+            self._flagged_revision = revision
+        return self._flagged
+
+    def _update_duplicate_flags(self, upserted: Iterable[Dict]) -> None:
+        """Add the flags of saved / imported / synced prompts if the flag index was current before"""
+        revision = self.get_library_revision()
+        if self._flagged_revision == revision - 1:
+            for prompt in upserted:
+                if prompt.get('duplicate_of'):
+                    self._flagged.setdefault(prompt['duplicate_of'], set()).add(prompt.get('id'))
+            self._flagged_revision = revision
+
+    def _duplicate_index(self) -> LSHIndex:
+        """Near-duplicate index, rebuilt when the library changed since it was last kept current"""
+        revision = self.get_library_revision()
+        if self._duplicates.revision != revision:
+            self._duplicates = LSHIndex()
+            self._duplicates.add_many([
+                (p.get('id'), p.get('optimized_prompt') or '') for p in _library().values()
+            ])
+            self._duplicates.revision = revision
+        return self._duplicates
+
+    def find_duplicate(self, optimized_prompt: str, exclude_id: Optional[str] = None) -> Optional[Dict]:
+        """Saved prompt with the same or a near-duplicate optimized body (see PromptDatabase.find_duplicate)"""
+        # Oldest copy first, like PromptDatabase
+        for prompt in _library().values():
+            if prompt.get('optimized_prompt') == optimized_prompt and prompt.get('id') != exclude_id:
+                return {'id': prompt['id'], 'name': prompt.get('name'), 'similarity': 1.0, 'exact': True}
+        signature_rows, present = signatures([optimized_prompt])
+        if not present[0]:
+            return None
+        match = self._duplicate_index().match(signature_rows[0], self.duplicate_threshold, exclude=exclude_id)
+        if match is None:
+            return None
+        prompt = self.load_prompt_by_id(match[0]) or {}
+        return {'id': match[0], 'name': prompt.get('name'), 'similarity': match[1], 'exact': False}
+
+    def get_prompt_versions(self, prompt_id: str) -> List[Dict]:
+        """List a prompt's versions, oldest first (see PromptDatabase.get_prompt_versions)"""
+        prompt = self.load_prompt_by_id(prompt_id)
+        if prompt is None:
+            return []
+        return [
+            {'version': entry['version'], 'kind': entry['kind'], 'size': entry['size']}
+            for entry in _version_entries(prompt)
+        ]
+
+    def load_prompt_version(self, prompt_id: str, version: int) -> Optional[str]:
+        """Rebuild one version of a prompt (None if it does not exist)"""
+        prompt = self.load_prompt_by_id(prompt_id)
+        if prompt is None:
+            return None
+        return decode_version(_version_entries(prompt), version)
+
+    def diff_prompt_versions(self, prompt_id: str, from_version: int, to_version: int) -> Optional[str]:
+        """Unified diff between two versions of a prompt (None if either is missing)"""
+        old = self.load_prompt_version(prompt_id, from_version)
+        new = self.load_prompt_version(prompt_id, to_version)
+        if old is None or new is None:
+            return None
+        return diff_text(old, new, f"v{from_version}", f"v{to_version}")
+
+    def _change_log(self) -> Dict:
+        """
+        Change log kept next to the prompts:
+        {"seq", "entries": {id: {"seq", "deleted", "updated_at", "changed_at", "origin"}}}
+
+        One entry per prompt (its last change), as in PromptDatabase's
+        prompt_changes; libraries saved before the log existed are logged
+        as local changes, oldest first.
+        """
+        log = st.session_state.get('local_changes')
+        if log is None:
+            log = st.session_state.local_changes = _initial_change_log(list(_library().values()))
+        return log
+
+    def _record_changes(self, changes: Iterable[Tuple[str, bool, str]], origin: Optional[str] = None,
+                        stamps: Optional[Dict[str, str]] = None) -> None:
+        """
+        Log (id, deleted, updated_at) changes; origin is the replica a synced change came from
+
+        stamps: UTC change stamps of synced changes by id (local changes are stamped now)
+        """
+        log = self._change_log()
+        now = utc_stamp()
+        for prompt_id, deleted, updated_at in changes:
+            log["seq"] += 1
+            log["entries"].pop(prompt_id, None)
+            log["entries"][prompt_id] = {
+                "seq": log["seq"], "deleted": deleted, "updated_at": updated_at,
+                "changed_at": (stamps or {}).get(prompt_id, now), "origin": origin
+            }
+
+    def get_changes(self, since: int = 0, limit: int = CHANGE_BATCH) -> List[Dict]:
+        """Local changes after since, oldest first (see PromptDatabase.get_changes)"""
+        entries = sorted(
+            (entry["seq"], prompt_id, entry) for prompt_id, entry in self._change_log()["entries"].items()
+            if entry["seq"] > since and entry["origin"] is None
+        )[:limit]
+        by_id = _library()
+        changes = []
+        for seq, prompt_id, entry in entries:
+            prompt = by_id.get(prompt_id)
+            record = None
+            if not entry["deleted"] and prompt is not None:
+                record = {key: value for key, value in prompt.items() if key not in ('versions', 'duplicate_of')}
+                record['updated_at'] = entry["updated_at"]
+            changes.append({
+                'seq': seq, 'id': prompt_id, 'deleted': record is None, 'updated_at': entry["updated_at"],
+                'changed_at': entry["changed_at"], 'record': record
+            })
+        return changes
+
+    def get_change_entries(self, prompt_ids: List[str]) -> Dict[str, Dict]:
+        """Last change of the given prompts (see PromptDatabase.get_change_entries)"""
+        entries = self._change_log()["entries"]
+        return {prompt_id: dict(entries[prompt_id]) for prompt_id in prompt_ids if prompt_id in entries}
+
+    def apply_changes(self, changes: List[Dict], origin: str) -> Dict:
+        """
+        Apply another replica's changes (see PromptDatabase.apply_changes)
+
+        Records keep the change's updated_at; tombstones delete the prompt.
+        Updated prompts keep their place, new ones become the newest.
+        """
+        now = datetime.now().isoformat()
+        upserts, applied = {}, []
+        for change in changes:
+            if not change['deleted']:
+                try:
+                    record = validate_record(dict(change['record'], id=change['id']), now)
+                except ValueError as e:
+                    logging.warning(f"Skipping invalid synced record {change['id']}: {e}")
+                    continue
+                record['analysis_scores'] = record['analysis_scores'] or {}
+                record['tags'] = record['tags'] or []
+                record['updated_at'] = change['updated_at']
+                upserts[change['id']] = record
+            applied.append(change)
+        library = _library()
+        deleted = 0
+        for change in applied:
+            if change['deleted']:
+                deleted += library.pop(change['id'], None) is not None
+            else:
+                # Local lineage and duplicate flag do not travel; stale lineage is dropped
+                library[change['id']] = upserts[change['id']]
+        self._record_changes([(c['id'], c['deleted'], c['updated_at']) for c in applied], origin,
+                             {c['id']: c['changed_at'] for c in applied})
+        self._save_to_local_storage([change['id'] for change in applied])
+        self._update_search_index(
+            [library[c['id']] for c in applied if c['id'] in library],
+            [c['id'] for c in applied if c['deleted']]
+        )
+        # Synced records carry no duplicate flag
+        self._update_duplicate_flags([])
+        return {
+            "upserted": len(upserts),
+            "deleted": deleted,
+            "errors": len(changes) - len(applied)
+        }
+
+    def load_sync_state(self) -> Dict:
+        """Sync engine state (see PromptDatabase.load_sync_state)"""
+        return json.loads(json.dumps(st.session_state.get('local_sync_state', {})))
+
+    def save_sync_state(self, state: Dict):
+        """Persist the sync engine state (the library revision is unchanged)"""
+        st.session_state.local_sync_state = json.loads(json.dumps(state))
+        self._queue_write(manifest_only=True)
+
+    def find_similar(self, text: str, limit: int = 5, exclude_id: Optional[str] = None) -> List[Dict]:
+        """Saved prompts most similar to text, with 'similarity' added (see PromptDatabase.find_similar)"""
+        revision = self.get_library_revision()
+        if not self._similarity.is_current(revision):
+            prompts = list(_library().values())
+            self._similarity.rebuild(
+                lambda: ((p.get('id'), index_text(p.get('name'), p.get('original_prompt'))) for p in prompts),
+                revision
+            )
+        matches = self._similarity.search(text, limit, exclude=[exclude_id] if exclude_id else ())
+        by_id = _library()
+        return [{**by_id[prompt_id], 'similarity': score} for prompt_id, score in matches if prompt_id in by_id]
+
+    def search_prompts(self, query: str, language: str = None,
+                       limit: Optional[int] = None, offset: int = 0) -> List[Dict]:
+        """
+        Search prompts by query (limit / offset paginate the results)
+
+        Only the prompts holding all of the query's n-grams are checked
+        (single-character queries check every prompt); results stay newest first
+        """
         query_lower = query.lower()
+        candidates = self._search_index().candidates(query)
+        if candidates is not None and not candidates:
+            return []
         results = []
 
-        for prompt in st.session_state.local_prompts:
+        for prompt in _newest_first():
+            if candidates is not None and prompt.get('id') not in candidates:
+                continue
             # Search in name, original_prompt, optimized_prompt
-            if (query_lower in prompt.get('name', '').lower() or
-                query_lower in prompt.get('original_prompt', '').lower() or
-                    query_lower in prompt.get('optimized_prompt', '').lower()):
+            if (query_lower in (prompt.get('name') or '').lower() or
+                query_lower in (prompt.get('original_prompt') or '').lower() or
+                    query_lower in (prompt.get('optimized_prompt') or '').lower()):
 
                 if language is None or prompt.get('language') == language:
                     results.append(prompt)
 
-        return results
+        if limit is not None:
+            return results[offset:offset + limit]
+        return results[offset:]
+
+    def query_prompts(self, limit: int = 20, cursor: Optional[str] = None,
+                      language: Optional[str] = None, tag: Optional[str] = None,
+                      updated_from: Optional[str] = None, updated_to: Optional[str] = None,
+                      min_score: Optional[float] = None, max_score: Optional[float] = None,
+                      include_bodies: bool = False) -> Dict:
+        """Keyset-paginated query, newest first (see PromptDatabase.query_prompts)"""
+        if updated_to and 'T' not in updated_to:
+            updated_to += 'T23:59:59.999999'
+        after = tuple(cursor.partition('|')[::2]) if cursor else None
+
+        matches = []
+        for prompt in _newest_first():
+            key = (_updated_at(prompt), prompt.get('id') or '')
+            if after is not None and key >= after:
+                continue
+            if language and prompt.get('language') != language:
+                continue
+            if updated_from and key[0] < updated_from:
+                continue
+            if updated_to and key[0] > updated_to:
+                continue
+            if tag and tag not in (prompt.get('tags') or []):
+                continue
+            if min_score is not None or max_score is not None:
+                score = _average_score(prompt.get('analysis_scores'))
+                if score is None:
+                    continue
+                if min_score is not None and score < min_score:
+                    continue
+                if max_score is not None and score > max_score:
+                    continue
+            matches.append((key, prompt))
+
+        matches.sort(key=lambda item: item[0], reverse=True)
+        page = matches[:limit]
+
+        prompts = []
+        for _, prompt in page:
+            item = dict(prompt)
+            item['updated_at'] = _updated_at(prompt)
+            if not include_bodies:
+                item['original_preview'] = (item.pop('original_prompt', '') or '')[:PREVIEW_CHARS]
+                item['optimized_preview'] = (item.pop('optimized_prompt', '') or '')[:PREVIEW_CHARS]
+            prompts.append(item)
+
+        next_cursor = None
+        if len(matches) > limit:
+            last_key = page[-1][0]
+            next_cursor = f"{last_key[0]}|{last_key[1]}"
+        return {'prompts': prompts, 'next_cursor': next_cursor}
 
     def get_all_tags(self) -> List[str]:
         """Get all unique tags"""
         all_tags = set()
-        for prompt in st.session_state.local_prompts:
+        for prompt in _newest_first():
             tags = prompt.get('tags', [])
             if tags:
                 all_tags.update(tags)
         return sorted(list(all_tags))
 
+    def get_tag_counts(self, limit: Optional[int] = None) -> List[Dict]:
+        """Get tags with usage counts, most used first (for tag clouds)"""
+        counts = Counter()
+        for prompt in _newest_first():
+            counts.update(set(prompt.get('tags') or []))
+        ranked = sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+        if limit is not None:
+            ranked = ranked[:limit]
+        return [{'name': name, 'count': count} for name, count in ranked]
+
     def get_prompt_count(self) -> int:
         """Get total prompt count"""
-        return len(st.session_state.local_prompts)
+        return len(_library())
 
-    def export_prompts(self) -> str:
-        """Export all prompts to JSON string"""
-        # 診斷日誌：匯出時的狀態
-        logging.info(f"[EXPORT] local_prompts key exists: {'local_prompts' in st.session_state}")
-        logging.info(f"[EXPORT] session_state.local_prompts count: {len(st.session_state.get('local_prompts', []))}")
+    def get_library_revision(self) -> int:
+        """Library revision, bumped on every save / delete / import"""
+        return st.session_state.get('local_prompts_revision', 0)
+
+    def get_analytics_data(self) -> Dict:
+        """Column-oriented score data (see PromptDatabase.get_analytics_data)"""
+        columns = ("id", "language", "created_at", "updated_at") + SCORE_FIELDS + ("original_hash", "optimized_hash")
+        data = {'prompts': {column: [] for column in columns}, 'tags': {'prompt_id': [], 'tag': []}}
+        prompts = data['prompts']
+        for prompt in _newest_first():
+            scores = prompt.get('analysis_scores') or {}
+            prompts['id'].append(prompt.get('id'))
+            prompts['language'].append(prompt.get('language'))
+            prompts['created_at'].append(prompt.get('created_at'))
+            prompts['updated_at'].append(_updated_at(prompt))
+            for field in SCORE_FIELDS:
+                value = scores.get(field) if isinstance(scores, dict) else None
+                is_number = isinstance(value, (int, float)) and not isinstance(value, bool)
+                prompts[field].append(float(value) if is_number else None)
+            prompts['original_hash'].append(body_hash(prompt.get('original_prompt') or ''))
+            prompts['optimized_hash'].append(body_hash(prompt.get('optimized_prompt') or ''))
+            for tag in set(prompt.get('tags') or []):
+                data['tags']['prompt_id'].append(prompt.get('id'))
+                data['tags']['tag'].append(tag)
+        return data
 
+    def iter_prompts(self) -> Iterator[Dict]:
+        """Iterate over all prompts, newest first"""
         # 如果 session_state 尚未初始化，嘗試從 LocalStorage 載入
         # (檢查 key 是否存在，而非列表是否為空，避免已刪除資料復活)
-        if 'local_prompts' not in st.session_state:
-            logging.info("[EXPORT] local_prompts not in session_state, loading from LocalStorage")
+        if 'local_library' not in st.session_state:
             self._load_from_local_storage()
-            logging.info(f"[EXPORT] After load - count: {len(st.session_state.get('local_prompts', []))}")
 
-        export_data = {
-            "version": "1.0",
-            "exported_at": datetime.now().isoformat(),
-            "prompt_count": len(st.session_state.local_prompts),
-            "prompts": st.session_state.local_prompts
-        }
+        # Shallow copy so concurrent saves/deletes do not affect the iteration
+        return iter(list(_newest_first()))
 
-        logging.info(f"[EXPORT] Exporting {export_data['prompt_count']} prompts")
+    def export_stream(self, fmt: str = "json", compress: bool = False) -> Iterator[bytes]:
+        """Stream all prompts as JSON / JSONL bytes, optionally gzip-compressed"""
+        # Version history and duplicate flags stay local; exports keep the v1.0 record layout
+        prompts = (
+            {k: v for k, v in prompt.items() if k not in ('versions', 'duplicate_of')}
+            for prompt in self.iter_prompts()
+        )
+        logging.info(f"[EXPORT] Exporting {len(_library())} prompts as {fmt}")
+        return iter_export(prompts, fmt=fmt, compress=compress)
 
-        return json.dumps(export_data, ensure_ascii=False, indent=2)
+    def export_prompts(self) -> str:
+        """Export all prompts to JSON string"""
+        return b"".join(self.export_stream()).decode('utf-8')
 
     def import_prompts(self, json_data: str, overwrite: bool = False) -> Dict:
         """Import prompts from JSON string"""
-        try:
-            data = json.loads(json_data)
-            prompts = data.get("prompts", [])
+        return self.import_stream(json_data, overwrite=overwrite)
 
-            imported = 0
-            skipped = 0
-            errors = 0
+    def import_stream(self, source: Union[BinaryIO, bytes, str], overwrite: bool = False,
+                      batch_size: int = IMPORT_BATCH_SIZE,
+                      progress_callback: Optional[Callable[[Dict], None]] = None,
+                      duplicate_policy: Optional[str] = None) -> Dict:
+        """
+        Import a v1.0 JSON or JSONL backup (optionally gzip-compressed)
 
-            existing_ids = {p.get('id') for p in st.session_state.local_prompts}
+        Records are parsed and validated incrementally, then applied to the
+        library in one pass and persisted once. Records without an id get a
+        new one. New ids that duplicate a saved prompt or an earlier record
+        are handled per duplicate_policy, as in PromptDatabase.import_stream.
+        """
+        policy = validate_policy(duplicate_policy or self.duplicate_policy)
+        library = _library()
+        seen_ids = set()
+        new_prompts = []
+        stats = {"imported": 0, "skipped": 0, "duplicates": 0, "errors": 0, "bytes_read": 0}
+        # Indexes of the saved prompts, extended with the imported ones as they are accepted
+        index = self._duplicate_index()
+        by_body = {}
+        for prompt in library.values():
+            by_body.setdefault(body_hash(prompt.get('optimized_prompt') or ''), prompt.get('id'))
+        # Imported records by id (the latest one wins)
+        latest = {}
+        merges = {}
 
-            for prompt in prompts:
-                try:
-                    prompt_id = prompt.get('id')
-
-                    if prompt_id in existing_ids:
-                        if overwrite:
-                            # Remove existing and add new
-                            st.session_state.local_prompts = [
-                                p for p in st.session_state.local_prompts
-                                if p.get('id') != prompt_id
-                            ]
-                            prompt['updated_at'] = datetime.now().isoformat()
-                            st.session_state.local_prompts.insert(0, prompt)
-                            imported += 1
-                        else:
-                            skipped += 1
+        try:
+            for records, invalid, bytes_read in iter_validated_batches(
+                source, batch_size, generate_missing_id=True
+            ):
+                stats["errors"] += invalid
+                stats["bytes_read"] = bytes_read
+                signature_rows, present = signatures([record['optimized_prompt'] for record in records])
+                keys = band_keys(signature_rows)
+                for record, signature, row_keys, has_shingles in zip(records, signature_rows, keys, present):
+                    prompt_id = record['id']
+                    record['analysis_scores'] = record['analysis_scores'] or {}
+                    record['tags'] = record['tags'] or []
+                    digest = body_hash(record['optimized_prompt'])
+                    if prompt_id in library or prompt_id in seen_ids:
+                        if not overwrite:
+                            stats["skipped"] += 1
+                            continue
                     else:
-                        # Add new prompt
-                        if not prompt_id:
-                            prompt['id'] = str(uuid.uuid4())
-                        st.session_state.local_prompts.insert(0, prompt)
-                        imported += 1
-
-                except Exception:
-                    errors += 1
-
-            self._save_to_local_storage()
-
-            return {
-                "success": True,
-                "imported": imported,
-                "skipped": skipped,
-                "errors": errors,
-                "total": len(prompts)
-            }
-
-        except json.JSONDecodeError as e:
+                        target = by_body.get(digest)
+                        if target is None and has_shingles:
+                            match = index.match(signature, self.duplicate_threshold, keys=row_keys)
+                            target = match[0] if match else None
+                        if target is not None:
+                            stats["duplicates"] += 1
+                            if policy == POLICY_FLAG:
+                                record['duplicate_of'] = target
+                            else:
+                                stats["skipped"] += 1
+                                if policy == POLICY_MERGE:
+                                    merges.setdefault(target, []).extend(record['tags'])
+                                continue
+                    seen_ids.add(prompt_id)
+                    by_body.setdefault(digest, prompt_id)
+                    latest[prompt_id] = record
+                    if has_shingles:
+                        index.add(prompt_id, signature, row_keys)
+                    new_prompts.append(record)
+                    stats["imported"] += 1
+                if progress_callback:
+                    progress_callback(dict(stats))
+        except ImportFormatError as e:
+            # The index already holds records that were not saved
+            self._duplicates.revision = None
             return {
                 "success": False,
-                "error": f"Invalid JSON format: {str(e)}",
+                "error": str(e),
                 "imported": 0,
                 "skipped": 0,
+                "duplicates": 0,
                 "errors": 0
             }
+
+        now = datetime.now().isoformat()
+        changed = [(prompt_id, False, record['updated_at']) for prompt_id, record in latest.items()]
+        for target, tags in merges.items():
+            prompt = latest.get(target) or library[target]
+            merged = merge_tags(prompt.get('tags'), tags)
+            if merged != (prompt.get('tags') or []):
+                prompt['tags'] = merged
+                prompt['updated_at'] = now
+                changed.append((target, False, now))
+        # Imported prompts become the newest, in file order; a later record with the same id wins
+        for record in new_prompts:
+            if latest[record['id']] is record:
+                library.pop(record['id'], None)
+                library[record['id']] = record
+        self._record_changes(changed)
+        self._save_to_local_storage([prompt_id for prompt_id, _, _ in changed])
+        self._update_search_index(latest.values(), [])
+        self._update_duplicate_flags(latest.values())
+
+        return {
+            "success": True,
+            "imported": stats["imported"],
+            "skipped": stats["skipped"],
+            "duplicates": stats["duplicates"],
+            "errors": stats["errors"],
+            "total": stats["imported"] + stats["skipped"] + stats["errors"]
+        }
+
+
+def _library() -> Dict[str, Dict]:
+    """
+    The prompts by id, oldest first
+
+    Dicts keep insertion order, so this one structure is both the id index
+    and the library order: lookups, deletes and saves (which append the
+    newest prompt) are O(1).
+    """
+    return st.session_state.local_library
+
+
+def _newest_first() -> Iterator[Dict]:
+    return reversed(_library().values())
+
+
+def _index_prompts(prompts: List[Dict]) -> Dict[str, Dict]:
+    """Library dict from a stored, newest-first prompt list"""
+    return {prompt.get('id'): prompt for prompt in reversed(prompts)}
+
+
+def _component_key() -> str:
+    """Unique key for one LocalStorage write component in this session"""
+    st.session_state.local_storage_writes = st.session_state.get('local_storage_writes', 0) + 1
+    return f"local_storage_set_{st.session_state.local_storage_writes}"
+
+
+def _delete_shards(ls) -> int:
+    """
+    Delete every per-prompt key (after a document rewrite, which holds them all)
+
+    A failure is only logged: the keys are of an older generation, so they
+    are ignored on load and deleted by the next rewrite.
+
+    Returns:
+        Number of keys deleted
+    """
+    stale = [key for key in list(ls.getAll()) if key.startswith(SHARD_PREFIX)]
+    deleted = 0
+    try:
+        for key in stale:
+            ls.deleteItem(key, key=_component_key())
+            deleted += 1
+    except Exception as e:
+        logging.warning(f"[SAVE_LS] Could not delete {len(stale) - deleted} old prompt keys: {e}")
+    return deleted
+
+
+def _pack_utf16(data: bytes) -> str:
+    """Bytes as text, 15 bits per character (the last one zero-padded)"""
+    bits = np.unpackbits(np.frombuffer(data, dtype=np.uint8))
+    rows = np.zeros((-(-len(bits) // 15), 16), dtype=np.uint8)
+    rows[:, 1:].flat[:len(bits)] = bits
+    codes = np.packbits(rows, axis=1).view(">u2").ravel() + PACK_OFFSET
+    return codes.astype("<u2").tobytes().decode("utf-16-le")
+
+
+def _unpack_utf16(text: str) -> bytes:
+    """Inverse of _pack_utf16 (may end with one extra zero byte)"""
+    codes = np.frombuffer(text.encode("utf-16-le"), dtype="<u2").astype(np.int32) - PACK_OFFSET
+    if codes.size and (codes.min() < 0 or codes.max() > 0x7FFF):
+        raise ValueError("not a packed value")
+    bits = np.unpackbits(codes.astype(">u2").view(np.uint8)).reshape(-1, 16)[:, 1:].ravel()
+    return np.packbits(bits[:len(bits) // 8 * 8]).tobytes()
+
+
+def _encode_item(value: Dict) -> str:
+    """LocalStorage value for a JSON object: compressed, or plain JSON when that is shorter"""
+    plain = json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+    packed = ENCODED_PREFIX + _pack_utf16(zlib.compress(plain.encode("utf-8"), COMPRESS_LEVEL))
+    return packed if len(packed) < len(plain) else plain
+
+
+def _parse_item(value) -> Optional[Dict]:
+    """JSON object stored under a LocalStorage key, in either format (None when missing or not an object)"""
+    if not value:
+        return None
+    if isinstance(value, str):
+        try:
+            if value.startswith(ENCODED_PREFIX):
+                # Trailing padding byte, if any, is left in unused_data
+                value = zlib.decompressobj().decompress(_unpack_utf16(value[len(ENCODED_PREFIX):])).decode("utf-8")
+            value = json.loads(value)
+        except (ValueError, zlib.error):
+            return None
+    return value if isinstance(value, dict) else None
+
+
+def _initial_change_log(prompts: List[Dict]) -> Dict:
+    """Change log logging every prompt as a local change, oldest first"""
+    log = {"seq": 0, "entries": {}}
+    for prompt in sorted(prompts, key=_updated_at):
+        log["seq"] += 1
+        log["entries"][prompt.get('id')] = {
+            "seq": log["seq"], "deleted": False, "updated_at": _updated_at(prompt),
+            "changed_at": to_utc_stamp(_updated_at(prompt)), "origin": None
+        }
+    return log
+
+
+def _read_library(items: Dict) -> Optional[Dict]:
+    """
+    Assemble the library from all LocalStorage items
+
+    The library document holds the prompts as of its last rewrite;
+    per-prompt keys of the same or a newer generation override it (a
+    "prompt" of null is a deletion) and the manifest gives the order.
+
+    Returns:
+        {"prompts", "changes", "sync", "generation"}, or None when neither
+        the document nor the manifest is a JSON object
+    """
+    document = _parse_item(items.get(STORAGE_KEY))
+    manifest = _parse_item(items.get(MANIFEST_KEY))
+    if document is None and manifest is None:
+        return None
+    document = document or {}
+    manifest = manifest or {}
+    generation = document.get("generation", 0)
+    prompts = [p for p in document.get("prompts") or [] if isinstance(p, dict)]
+    log = document.get("changes")
+    if not isinstance(log, dict):
+        log = _initial_change_log(prompts)
+    records = {p.get('id'): p for p in prompts}
+    for key, value in items.items():
+        if not key.startswith(SHARD_PREFIX):
+            continue
+        shard = _parse_item(value)
+        if shard is None or shard.get("generation", 0) < generation:
+            continue
+        prompt_id = key[len(SHARD_PREFIX):]
+        if isinstance(shard.get("prompt"), dict):
+            records[prompt_id] = shard["prompt"]
+        else:
+            records.pop(prompt_id, None)
+        if isinstance(shard.get("change"), dict):
+            log["entries"][prompt_id] = shard["change"]
+    for entry in log["entries"].values():
+        # Entries written before change stamps existed: updated_at is local time
+        if not entry.get("changed_at"):
+            entry["changed_at"] = to_utc_stamp(entry.get("updated_at"))
+    log["seq"] = max([log["seq"], manifest.get("seq", 0)] + [entry["seq"] for entry in log["entries"].values()])
+    order = manifest.get("ids") or [p.get('id') for p in prompts]
+    ordered = [records.pop(prompt_id) for prompt_id in order if prompt_id in records]
+    # Prompts missing from the manifest (its last write did not land) go by date
+    ordered.extend(sorted(records.values(), key=_updated_at, reverse=True))
+    return {
+        "prompts": ordered,
+        "changes": log,
+        "sync": manifest.get("sync", document.get("sync")) or {},
+        "generation": max(generation, manifest.get("generation", 0)),
+    }
+
+
+def _version_entries(prompt: Dict) -> List[Dict]:
+    """Stored lineage plus the final version; prompts saved without history have original -> final"""
+    entries = prompt.get('versions') or [{
+        'version': 1,
+        'kind': KIND_ORIGINAL,
+        'size': len((prompt.get('original_prompt') or '').encode('utf-8')),
+        'text': prompt.get('original_prompt') or '',
+    }]
+    final = prompt.get('optimized_prompt') or ''
+    return list(entries) + [{
+        'version': len(entries) + 1,
+        'kind': KIND_FINAL,
+        'size': len(final.encode('utf-8')),
+        'text': final,
+    }]
+
+
+def _updated_at(prompt: Dict) -> str:
+    """Sort key of a stored prompt (imported prompts may lack updated_at)"""
+    return prompt.get('updated_at') or prompt.get('created_at') or ''
+
+
+def _average_score(scores) -> Optional[float]:
+    """Average of the numeric SCORE_FIELDS present in analysis_scores"""
+    if not isinstance(scores, dict):
+        return None
+    values = [
+        scores[field] for field in SCORE_FIELDS
+        if isinstance(scores.get(field), (int, float)) and not isinstance(scores.get(field), bool)
+    ]
+    return sum(values) / len(values) if values else None
@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+"""
+Prompt Sync - Delta sync of the prompt library through a shared remote store
+Each replica pushes its change log (the last change of every record, with
+tombstones for deletions) as compact gzip JSONL batches and pulls the
+batches of the other replicas; when both sides changed the same prompt,
+the newer change wins and the losing version is kept as a conflict record
+"""
+
+import gzip
+import io
+import json
+import os
+import re
+import tempfile
+import threading
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional, Tuple
+
+BATCH_FORMAT = "prompt-tool-changes"
+# Version 2 adds the UTC change stamp (changed_at)
+BATCH_VERSION = 2
+
+# Changes per pushed batch
+BATCH_SIZE = 500
+
+# Conflict records kept (oldest are dropped first)
+MAX_CONFLICTS = 100
+
+# Record fields that are synced ('versions' and 'duplicate_of' stay local, as in exports)
+SYNC_FIELDS = ("name", "original_prompt", "optimized_prompt", "analysis_scores", "tags", "language", "created_at")
+
+GZIP_LEVEL = 6
+
+
+class SyncError(Exception):
+    """Raised when the remote store holds something that is not a change batch"""
+
+
+def utc_stamp(moment: Optional[datetime] = None) -> str:
+    """
+    Change stamp: UTC time with an explicit offset, to the millisecond
+
+    Stamps of replicas in different time zones compare correctly as
+    strings; SQLite writes the same format with
+    strftime('%Y-%m-%dT%H:%M:%f+00:00', 'now').
+    """
+    moment = moment or datetime.now(timezone.utc)
+    return moment.astimezone(timezone.utc).isoformat(timespec="milliseconds")
+
+
+def to_utc_stamp(value: Optional[str]) -> str:
+    """Change stamp of an ISO time string; times without an offset are taken as local time"""
+    try:
+        return utc_stamp(datetime.fromisoformat(str(value)))
+    except ValueError:
+        return ""
+
+
+def encode_batch(changes: List[Dict], origin: str) -> bytes:
+    """Gzip JSONL batch: a header line, then one change per line"""
+    lines = [json.dumps({"format": BATCH_FORMAT, "version": BATCH_VERSION, "origin": origin, "count": len(changes)})]
+    for change in changes:
+        entry = {"id": change["id"], "deleted": change["deleted"], "updated_at": change["updated_at"],
+                 "changed_at": change["changed_at"]}
+        if not change["deleted"]:
+            entry["record"] = {field: change["record"].get(field) for field in SYNC_FIELDS}
+        lines.append(json.dumps(entry, ensure_ascii=False))
+    return gzip.compress("\n".join(lines).encode("utf-8"), compresslevel=GZIP_LEVEL)
+
+
+def decode_batch(data: bytes) -> Tuple[str, List[Dict]]:
+    """
+    Parse a batch written by encode_batch
+
+    Returns:
+        (origin replica id, changes)
+    """
+    try:
+        header, *lines = gzip.decompress(data).decode("utf-8").split("\n")
+        meta = json.loads(header)
+        changes = [json.loads(line) for line in lines if line]
+    except (OSError, EOFError, UnicodeDecodeError, ValueError) as e:
+        raise SyncError(f"unreadable change batch: {e}") from e
+    if not isinstance(meta, dict) or meta.get("format") != BATCH_FORMAT:
+        raise SyncError("not a prompt change batch")
+    if meta.get("version", 0) > BATCH_VERSION:
+        raise SyncError(f"change batch version {meta.get('version')} is newer than supported ({BATCH_VERSION})")
+    for change in changes:
+        if not isinstance(change, dict) or not isinstance(change.get("id"), str) or not change.get("updated_at"):
+            raise SyncError("malformed change in batch")
+        # Version 1 batches have local times only (taken as this replica's zone)
+        if not change.get("changed_at"):
+            change["changed_at"] = to_utc_stamp(change["updated_at"])
+        change["deleted"] = bool(change.get("deleted"))
+        if not change["deleted"] and not isinstance(change.get("record"), dict):
+            raise SyncError(f"change for {change['id']} has no record")
+    return str(meta.get("origin") or ""), changes
+
+
+class RemoteStore:
+    """
+    Where replicas exchange change batches
+
+    Batches are append-only and numbered in the order they were appended;
+    a batch numbered n must only become readable after every batch before it.
+    """
+
+    def append(self, origin: str, data: bytes) -> int:
+        """Store a batch; returns its sequence number"""
+        raise NotImplementedError
+
+    def read_since(self, cursor: int) -> Iterator[Tuple[int, str, bytes]]:
+        """Batches numbered above cursor, in order, as (sequence number, origin, data)"""
+        raise NotImplementedError
+
+
+class LocalFolderRemote(RemoteStore):
+    """
+    Remote store in a folder, one "<seq>.jsonl.gz" file per batch
+
+    Works with any folder the replicas share (a network drive, a desktop
+    sync client's folder, or a temporary directory in tests). Batches are
+    written to a temporary file and linked into place, so readers never see
+    a partial batch. The file name holds only the number, so two replicas
+    racing for it collide and exactly one of them gets it; the origin is
+    read from the batch header. Folders written by older versions also hold
+    "<seq>-<origin>.jsonl.gz" files, which are still read.
+    """
+
+    _NAME = re.compile(r"^(\d{12})(?:-([0-9A-Za-z_-]+))?\.jsonl\.gz$")
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def _batches(self) -> List[Tuple[int, str, str]]:
+        try:
+            names = os.listdir(self.root)
+        except FileNotFoundError:
+            return []
+        batches = []
+        for name in names:
+            match = self._NAME.match(name)
+            if match:
+                batches.append((int(match.group(1)), name, match.group(2)))
+        return sorted(batches)
+
+    def append(self, origin: str, data: bytes) -> int:
+        os.makedirs(self.root, exist_ok=True)
+        fd, temp = tempfile.mkstemp(prefix=".batch-", dir=self.root)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            batches = self._batches()
+            seq = batches[-1][0] + 1 if batches else 1
+            while True:
+                try:
+                    os.link(temp, os.path.join(self.root, f"{seq:012d}.jsonl.gz"))
+                    return seq
+                except FileExistsError:
+                    seq += 1
+        finally:
+            os.remove(temp)
+
+    def read_since(self, cursor: int) -> Iterator[Tuple[int, str, bytes]]:
+        for seq, name, origin in self._batches():
+            if seq > cursor:
+                with open(os.path.join(self.root, name), "rb") as f:
+                    data = f.read()
+                yield seq, origin or _batch_origin(data), data
+
+
+def _batch_origin(data: bytes) -> str:
+    """Origin replica id from a batch header ('' if unreadable; decode_batch reports the error)"""
+    try:
+        with gzip.GzipFile(fileobj=io.BytesIO(data)) as f:
+            meta = json.loads(f.readline())
+    except (OSError, EOFError, ValueError):
+        return ""
+    return str(meta.get("origin") or "") if isinstance(meta, dict) else ""
+
+
+class SyncEngine:
+    """
+    Two-way delta sync of one storage backend (PromptDatabase or
+    LocalStoragePromptDB) with a RemoteStore
+
+    The backend provides the change log (get_changes / get_change_entries /
+    apply_changes) and keeps the engine's state (load_sync_state /
+    save_sync_state): this replica's id, the last pushed local change, the
+    last pulled batch and the conflict records. Re-applying a batch after
+    an interruption is harmless, since an equal change is ignored.
+    """
+
+    def __init__(self, storage, remote: RemoteStore, batch_size: int = BATCH_SIZE):
+        self.storage = storage
+        self.remote = remote
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+
+    def _state(self) -> Dict:
+        state = self.storage.load_sync_state()
+        if not state.get("replica_id"):
+            state["replica_id"] = uuid.uuid4().hex[:12]
+            self.storage.save_sync_state(state)
+        state.setdefault("pushed_seq", 0)
+        state.setdefault("remote_cursor", 0)
+        state.setdefault("conflicts", [])
+        return state
+
+    @property
+    def replica_id(self) -> str:
+        return self._state()["replica_id"]
+
+    def sync(self) -> Dict:
+        """
+        Pull the other replicas' batches, then push local changes
+
+        Returns:
+            {"pulled", "pushed", "conflicts", "stale", "errors", "batches_pulled", "batches_pushed"};
+            errors counts incoming records that could not be applied
+        """
+        with self._lock:
+            stats = {"pulled": 0, "pushed": 0, "conflicts": 0, "stale": 0, "errors": 0,
+                     "batches_pulled": 0, "batches_pushed": 0}
+            state = self._state()
+            self._pull(state, stats)
+            self._push(state, stats)
+            return stats
+
+    def _pull(self, state: Dict, stats: Dict) -> None:
+        for seq, _, data in self.remote.read_since(state["remote_cursor"]):
+            origin, changes = decode_batch(data)
+            if origin != state["replica_id"]:
+                accepted = self._resolve(changes, origin, state, stats)
+                if accepted:
+                    applied = self.storage.apply_changes(accepted, origin)
+                    stats["pulled"] += applied["upserted"] + applied["deleted"]
+                    stats["errors"] += applied["errors"]
+                stats["batches_pulled"] += 1
+            state["remote_cursor"] = seq
+            self.storage.save_sync_state(state)
+
+    def _push(self, state: Dict, stats: Dict) -> None:
+        while True:
+            changes = self.storage.get_changes(state["pushed_seq"], self.batch_size)
+            if not changes:
+                return
+            self.remote.append(state["replica_id"], encode_batch(changes, state["replica_id"]))
+            state["pushed_seq"] = changes[-1]["seq"]
+            self.storage.save_sync_state(state)
+            stats["pushed"] += len(changes)
+            stats["batches_pushed"] += 1
+
+    def _resolve(self, changes: List[Dict], origin: str, state: Dict, stats: Dict) -> List[Dict]:
+        """
+        Decide which incoming changes to apply (last writer wins)
+
+        Changes are ordered by (changed_at, replica id): UTC stamps, so
+        replicas in different time zones agree (updated_at is local time,
+        kept for display). An incoming change
+        that is not newer than the local one is skipped; when the local one
+        has not been pushed yet both sides changed the prompt, and the
+        losing side is kept as a conflict record.
+        """
+        local = self.storage.get_change_entries([change["id"] for change in changes])
+        accepted = []
+        for change in changes:
+            entry = local.get(change["id"])
+            if entry is None:
+                accepted.append(change)
+                continue
+            unpushed = entry["origin"] is None and entry["seq"] > state["pushed_seq"]
+            local_stamp = (entry["changed_at"], entry["origin"] or state["replica_id"])
+            remote_wins = (change["changed_at"], origin) > local_stamp
+            if unpushed:
+                if remote_wins:
+                    loser = {"updated_at": entry["updated_at"], "changed_at": entry["changed_at"],
+                             "deleted": entry["deleted"],
+                             "record": None if entry["deleted"] else self.storage.load_prompt_by_id(change["id"])}
+                else:
+                    loser = {key: change.get(key) for key in ("updated_at", "changed_at", "deleted", "record")}
+                self._add_conflict(state, change["id"], "remote" if remote_wins else "local", origin, loser)
+                stats["conflicts"] += 1
+            if remote_wins:
+                accepted.append(change)
+            elif not unpushed:
+                stats["stale"] += 1
+        return accepted
+
+    @staticmethod
+    def _add_conflict(state: Dict, prompt_id: str, winner: str, origin: str, loser: Dict) -> None:
+        state["conflicts"].append({
+            "id": prompt_id,
+            "detected_at": datetime.now().isoformat(timespec="seconds"),
+            "winner": winner,
+            "origin": origin,
+            "loser": loser,
+        })
+        del state["conflicts"][:-MAX_CONFLICTS]
+
+    def conflicts(self) -> List[Dict]:
+        """Conflict records, oldest first: the losing version of prompts changed on both sides"""
+        return list(self._state()["conflicts"])
+
+    def clear_conflicts(self, prompt_ids: Optional[List[str]] = None) -> None:
+        """Drop the conflict records of the given prompts (all when None)"""
+        with self._lock:
+            state = self._state()
+            drop = None if prompt_ids is None else set(prompt_ids)
+            state["conflicts"] = [] if drop is None else [
+                conflict for conflict in state["conflicts"] if conflict["id"] not in drop
+            ]
+            self.storage.save_sync_state(state)
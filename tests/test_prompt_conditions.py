@@ -0,0 +1,33 @@
+"""
+Batch evaluation must agree with evaluating each analysis on its own
+"""
+
+import pytest
+
+from prompt_conditions import Node, compile_condition, evaluate_batch, to_columns
+
+ANALYSES = [
+    {"prompt_type": "翻譯", "missing_elements": ["角色", "格式"], "clarity_score": 4},
+    {"prompt_type": "寫作", "missing_elements": ["範例", "語氣"], "clarity_score": 8},
+    {"prompt_type": "翻譯", "missing_elements": ["格式", "範例"]},
+    {"missing_elements": ["角色", "語氣"]},
+]
+
+
+@pytest.mark.parametrize("condition", [
+    "prompt_type in ['翻譯', '摘要']",
+    "missing_elements == '角色'",
+    "missing_elements != '角色' and clarity_score < 7",
+    "not prompt_type == '寫作' or clarity_score >= 8",
+])
+def test_batch_matches_single_evaluation_with_list_fields(condition):
+    # Equal-length lists in every row are where slice assignment broadcast
+    node = compile_condition(condition)
+    columns = to_columns(ANALYSES, sorted(node.fields))
+    batch = evaluate_batch(node, columns, len(ANALYSES))
+    assert batch.tolist() == [node.evaluate(analysis) for analysis in ANALYSES]
+
+
+def test_node_is_abstract():
+    with pytest.raises(TypeError):
+        Node()
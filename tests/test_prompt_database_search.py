@@ -0,0 +1,58 @@
+"""
+Short (one- and two-character) searches must find what a LIKE scan finds
+without decompressing every body
+"""
+
+import pytest
+
+import prompt_database
+from prompt_database import PromptDatabase
+
+PROMPTS = [
+    ("翻譯助手", "請把下列文字翻譯成英文", "你是專業譯者，請翻譯成英文"),
+    ("摘要", "幫我摘要這篇文章", "請以三點摘要全文，結尾附上關鍵詞"),
+    ("寫作", "寫一首詩", "以七言絕句寫詩"),
+    ("Code Review", "Review this diff", "You are a senior reviewer. 請用中文回答"),
+    ("短", "詩", "文章"),
+]
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    calls = []
+    inflate = prompt_database.inflate
+
+    def counting_inflate(codec, data):
+        calls.append(1)
+        return inflate(codec, data)
+
+    monkeypatch.setattr(prompt_database, "inflate", counting_inflate)
+    database = PromptDatabase(str(tmp_path / "prompts.db"))
+    for name, original, optimized in PROMPTS:
+        # Distinct bodies, so duplicate detection keeps every prompt
+        database.save_prompt(name, original, optimized, {}, [], "zh_TW")
+    database.inflate_calls = calls
+    yield database
+    database.close()
+
+
+def _scan(db, query):
+    enabled, db.fts_enabled = db.fts_enabled, False
+    try:
+        return [p["id"] for p in db.search_prompts(query)]
+    finally:
+        db.fts_enabled = enabled
+
+
+@pytest.mark.parametrize("query", ["翻譯", "英文", "摘要", "詞", "文章", "詩", "中文", "re", "RE", "助手", "沒有"])
+def test_short_queries_match_like_scan(db, query):
+    assert db.fts_enabled
+    assert [p["id"] for p in db.search_prompts(query)] == _scan(db, query)
+
+
+def test_two_character_cjk_query_decompresses_only_matches(db):
+    del db.inflate_calls[:]
+    results = db.search_prompts("絕句")
+    assert [p["name"] for p in results] == ["寫作"]
+    # Two bodies of the one match, once to confirm it and once to return it
+    assert len(db.inflate_calls) <= 4
@@ -0,0 +1,115 @@
+"""
+Streaming import must not depend on where the read boundaries fall
+"""
+
+import io
+import json
+
+import pytest
+
+import prompt_import
+from prompt_import import ImportFormatError, iter_records, iter_validated_batches
+
+READ_SIZES = list(range(1, 40)) + [61, 64, 97, 128, 255, 256, 1000, 4096, 64 * 1024]
+
+
+def _records():
+    records = []
+    for i in range(12):
+        records.append({
+            "id": f"p{i}",
+            "name": f"提示詞 {i} — テスト",
+            "original_prompt": "請翻譯 \"quoted\" text\n第二行\t" * (i % 3 + 1),
+            "optimized_prompt": f"Optimized body {i} 最佳化 😀",
+            "analysis_scores": {
+                "completeness_score": 7.5,
+                "clarity_score": -0.25,
+                "structure_score": 1e-3,
+                "specificity_score": -12,
+                "total_score": 8.125e+1,
+                "passed": i % 2 == 0,
+                "note": None,
+            },
+            "tags": ["中文", "tag-" + str(i)],
+            "language": "zh_TW",
+            "created_at": "2026-01-02T03:04:05",
+        })
+    return records
+
+
+def _json_backup(records):
+    # ASCII escapes put \uXXXX sequences (and surrogate pairs) at the boundaries
+    return json.dumps({"version": "1.0", "prompts": records, "count": len(records)},
+                      ensure_ascii=True, indent=2).encode("utf-8")
+
+
+def _jsonl_backup(records):
+    lines = [json.dumps({"format": "jsonl", "version": "1.0", "count": len(records)})]
+    lines += [json.dumps(record, ensure_ascii=True) for record in records]
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+@pytest.mark.parametrize("read_size", READ_SIZES)
+@pytest.mark.parametrize("make_backup", [_json_backup, _jsonl_backup])
+def test_records_do_not_depend_on_read_size(monkeypatch, make_backup, read_size):
+    records = _records()
+    monkeypatch.setattr(prompt_import, "READ_SIZE", read_size)
+    assert list(iter_records(io.BytesIO(make_backup(records)))) == records
+
+
+@pytest.mark.parametrize("read_size", [1, 7, 64, 64 * 1024])
+def test_json_and_jsonl_import_identically(monkeypatch, read_size):
+    records = _records()
+    monkeypatch.setattr(prompt_import, "READ_SIZE", read_size)
+    imported = []
+    for make_backup in (_json_backup, _jsonl_backup):
+        batches = list(iter_validated_batches(make_backup(records), batch_size=5))
+        rows = [record for batch, _, _ in batches for record in batch]
+        assert sum(invalid for _, invalid, _ in batches) == 0
+        imported.append([{k: v for k, v in row.items() if k != "updated_at"} for row in rows])
+    assert imported[0] == imported[1]
+    assert [row["analysis_scores"] for row in imported[0]] == [r["analysis_scores"] for r in records]
+
+
+def test_float_split_at_default_read_size():
+    prefix = '{\n"prompts": [\n{"id": "x", "name": "'
+    suffix = '", "optimized_prompt": "b", "analysis_scores": {"clarity_score": 7.5}}\n]\n}'
+    # Pad the name so that "7." ends the first read and "5" starts the second
+    padding = prompt_import.READ_SIZE - len(prefix) - suffix.index("7.") - 2
+    data = (prefix + "a" * padding + suffix).encode("utf-8")
+    assert data[:prompt_import.READ_SIZE].endswith(b"7.")
+    assert list(iter_records(io.BytesIO(data)))[0]["analysis_scores"] == {"clarity_score": 7.5}
+
+
+@pytest.mark.parametrize("read_size", [1, 5, 64 * 1024])
+@pytest.mark.parametrize("data", [
+    b'{\n"prompts": [{"id": "x", "name": tru}]\n}',
+    b'{\n"prompts": [{"id": "x", "name": "unterminated}]\n',
+    b'{\n"prompts": [{"id": "x"} {"id": "y"}]\n}',
+])
+def test_malformed_backup_still_fails(monkeypatch, read_size, data):
+    monkeypatch.setattr(prompt_import, "READ_SIZE", read_size)
+    with pytest.raises(ImportFormatError):
+        list(iter_records(io.BytesIO(data)))
+
+
+class _ReadCounter(io.BytesIO):
+    def __init__(self, data):
+        super().__init__(data)
+        self.reads = 0
+
+    def read(self, size=-1):
+        self.reads += 1
+        return super().read(size)
+
+
+@pytest.mark.parametrize("read_size", [5, 64])
+def test_syntax_error_fails_at_once_with_file_offset(monkeypatch, read_size):
+    monkeypatch.setattr(prompt_import, "READ_SIZE", read_size)
+    good = json.dumps({"id": "x", "name": "n" * 100})
+    prefix = '{\n"prompts": [\n' + ",\n".join([good] * 20) + ',\n{"id": "y",, '
+    stream = _ReadCounter((prefix + '"name": "' + "z" * 100_000 + '"}\n]\n}').encode("utf-8"))
+    with pytest.raises(ImportFormatError, match=rf"\(char {len(prefix) - 2}\)"):
+        list(iter_records(stream))
+    # The long string after the error is never read
+    assert stream.reads * read_size < len(prefix) + 100
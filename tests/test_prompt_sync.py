@@ -0,0 +1,46 @@
+"""
+Replicas appending to a shared folder must never take the same batch number
+"""
+
+import os
+import threading
+
+from prompt_sync import LocalFolderRemote, encode_batch
+
+CHANGES = [{"id": "p1", "deleted": True, "updated_at": "2026-01-02T03:04:05",
+            "changed_at": "2026-01-02T03:04:05.000+00:00"}]
+
+
+def test_racing_replicas_get_distinct_numbers(tmp_path):
+    remote = LocalFolderRemote(str(tmp_path))
+    origins = [f"replica{i}" for i in range(8)]
+    listing = remote._batches
+    barrier = threading.Barrier(len(origins))
+
+    def same_listing():
+        # Every replica sees the folder before any of them has appended
+        batches = listing()
+        barrier.wait(timeout=5)
+        return batches
+
+    remote._batches = same_listing
+    threads = [threading.Thread(target=remote.append, args=(origin, encode_batch(CHANGES, origin)))
+               for origin in origins]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    remote._batches = listing
+
+    batches = list(remote.read_since(0))
+    assert [seq for seq, _, _ in batches] == list(range(1, len(origins) + 1))
+    assert sorted(origin for _, origin, _ in batches) == origins
+
+
+def test_reads_batches_named_with_their_origin(tmp_path):
+    with open(os.path.join(tmp_path, "000000000001-legacy.jsonl.gz"), "wb") as f:
+        f.write(encode_batch(CHANGES, "legacy"))
+    remote = LocalFolderRemote(str(tmp_path))
+    assert remote.append("new", encode_batch(CHANGES, "new")) == 2
+    assert [(seq, origin) for seq, origin, _ in remote.read_since(0)] == [(1, "legacy"), (2, "new")]
+    assert [seq for seq, _, _ in remote.read_since(1)] == [2]
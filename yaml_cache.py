@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+YAML Cache - Fast-start loading of YAML configuration files
+Parses with libyaml when available and keeps a marshal snapshot next to the
+YAML file, keyed by path, mtime and size, so warm starts skip parsing
+"""
+
+import marshal
+import os
+import logging
+from pathlib import Path
+from typing import Any, Union
+
+import yaml
+
+logger = logging.getLogger(__name__)
+
+# libyaml-backed loader is ~10x faster; fall back to the pure-Python one
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:  # PyYAML built without libyaml
+    from yaml import SafeLoader
+
+# Bump when the cache layout changes so stale caches are ignored
+CACHE_FORMAT = 1
+
+# Set PROMPT_TOOL_YAML_CACHE=0 to always parse the YAML file
+CACHE_ENV_VAR = "PROMPT_TOOL_YAML_CACHE"
+
+
+def cache_path_for(path: Union[str, Path]) -> Path:
+    """Snapshot file stored next to the YAML file (e.g. config/.config.yaml.cache)"""
+    path = Path(path)
+    return path.with_name(f".{path.name}.cache")
+
+
+def parse_yaml(stream: Any) -> Any:
+    """Parse YAML with the fastest available safe loader"""
+    return yaml.load(stream, Loader=SafeLoader)
+
+
+def load_yaml(path: Union[str, Path], use_cache: bool = True) -> Any:
+    """
+    Load a YAML file, using the marshal snapshot when it is still valid
+
+    marshal only serializes builtin types (no arbitrary objects are
+    constructed on load), so the cache is as safe to read as the YAML itself.
+    Files containing non-builtin values (e.g. unquoted dates) are simply not
+    cached. Cache read/write failures never fail the load.
+
+    Args:
+        path: Path to the YAML file
+        use_cache: Whether to read/write the snapshot cache
+
+    Returns:
+        Parsed YAML data
+
+    Raises:
+        OSError: If the YAML file cannot be read
+        yaml.YAMLError: If the YAML file cannot be parsed
+    """
+    path = Path(path)
+    use_cache = use_cache and os.environ.get(CACHE_ENV_VAR, "1") != "0"
+
+    st = os.stat(path)
+    key = (CACHE_FORMAT, str(path.resolve()), st.st_mtime_ns, st.st_size)
+    cache_file = cache_path_for(path)
+
+    if use_cache:
+        try:
+            with open(cache_file, 'rb') as f:
+                cached_key, data = marshal.load(f)
+            if cached_key == key:
+                return data
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.debug(f"Ignoring unreadable YAML cache {cache_file}: {e}")
+
+    with open(path, 'r', encoding='utf-8') as f:
+        data = parse_yaml(f)
+
+    if use_cache:
+        _write_cache(cache_file, key, data)
+
+    return data
+
+
+def _write_cache(cache_file: Path, key: tuple, data: Any) -> None:
+    """Atomically write the snapshot; failures (read-only FS, unsupported types) are ignored"""
+    tmp_file = cache_file.with_name(f"{cache_file.name}.{os.getpid()}.tmp")
+    try:
+        payload = marshal.dumps((key, data))
+        with open(tmp_file, 'wb') as f:
+            f.write(payload)
+        os.replace(tmp_file, cache_file)
+    except Exception as e:
+        logger.debug(f"Could not write YAML cache {cache_file}: {e}")
+        try:
+            os.unlink(tmp_file)
+        except OSError:
+            pass